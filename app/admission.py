@@ -0,0 +1,253 @@
+import asyncio
+import re
+import threading
+import time
+from collections import deque
+from app import deadline, metrics
+from app.config import (
+    ADMISSION_ENABLED, ADMISSION_PASSWORD_CONCURRENCY, ADMISSION_READ_CONCURRENCY,
+    ADMISSION_STREAM_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_MS,
+    ADMISSION_TARGET_QUEUE_MS, ADMISSION_INTERVAL_MS
+)
+
+# Admisión por clase de endpoint, compartida por los interceptores gRPC y el
+# middleware HTTP (app.instrumentation). Cada clase tiene su propio límite de
+# concurrencia: con los endpoints de bcrypt saturados, las lecturas siguen entrando.
+# Una petición sin hueco espera en una cola FIFO acotada como mucho
+# ADMISSION_QUEUE_TIMEOUT_MS (o lo que le quede de deadline); si la espera se
+# mantiene por encima del objetivo un intervalo entero (CoDel), solo espera el
+# objetivo: bajo sobrecarga sostenida se rechaza pronto en vez de encolar.
+PASSWORD = "password"
+READ = "read"
+STREAM = "stream"
+
+# UpdateUser y PUT/PATCH /users/{id} solo hacen bcrypt si cambia la contraseña, pero
+# no se sabe sin leer el cuerpo: van a la clase cara
+PASSWORD_RPCS = {"Login", "Register", "CreateUser", "UpdateUser", "BatchCreateUsers"}
+STREAM_RPCS = {"StreamUsers"}
+
+# (método, ruta) de FastAPI; las rutas sin clase no pasan por la admisión
+PASSWORD_ROUTES = (
+    ("POST", re.compile(r"/login$")),
+    ("POST", re.compile(r"/register$")),
+    ("POST", re.compile(r"/users/batch$")),
+    ("PUT", re.compile(r"/users/[^/]+$")),
+    ("PATCH", re.compile(r"/users/[^/]+$")),
+)
+STREAM_ROUTES = (("GET", re.compile(r"/users/export$")),)
+EXEMPT_PATHS = ("/metrics", "/.well-known/jwks.json", "/cache/stats")
+
+# Servidor gRPC con hilos: quien espera ocupa un hilo del pool. Fracción máxima
+# de hilos (en curso + en cola) por clase, para que siempre queden para lecturas.
+THREAD_SHARES = {PASSWORD: 0.5, STREAM: 0.25}
+
+def rpc_class(method: str) -> str:
+    if method in PASSWORD_RPCS:
+        return PASSWORD
+    if method in STREAM_RPCS:
+        return STREAM
+    return READ
+
+def http_class(method: str, path: str):
+    if path in EXEMPT_PATHS:
+        return None
+    for routes, name in ((PASSWORD_ROUTES, PASSWORD), (STREAM_ROUTES, STREAM)):
+        if any(method == verb and pattern.match(path) for verb, pattern in routes):
+            return name
+    return READ
+
+class AdmissionRejected(Exception):
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"Servidor ocupado ({name}: {reason})")
+        self.name = name
+        self.reason = reason
+
+class _Waiter:
+    __slots__ = ("notify", "granted")
+
+    def __init__(self, notify):
+        self.notify = notify
+        self.granted = False
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+class AdmissionLimiter:
+    # Semáforo FIFO que sirve a la vez a hilos y a corrutinas: al liberar, el hueco
+    # pasa directamente al primero de la cola
+    def __init__(self, name, limit, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT_MS / 1000,
+                 target=ADMISSION_TARGET_QUEUE_MS / 1000,
+                 interval=ADMISSION_INTERVAL_MS / 1000, clock=time.monotonic):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target = target
+        self.interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+        self._above_since = None
+        self.overloaded = False
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _observe(self, waited):
+        # Bajo self._lock
+        metrics.ADMISSION_QUEUE_SECONDS.observe(waited, endpoint=self.name)
+        now = self._clock()
+        if waited < self.target:
+            self._above_since = None
+            self.overloaded = False
+        elif self._above_since is None:
+            self._above_since = now
+        elif now - self._above_since >= self.interval:
+            self.overloaded = True
+
+    def _reject(self, reason):
+        metrics.ADMISSION_REJECTED.inc(endpoint=self.name, reason=reason)
+        raise AdmissionRejected(self.name, reason)
+
+    def _enter(self, notify):
+        # Devuelve None si entra ya, o (waiter, timeout) si debe esperar
+        with self._lock:
+            if self.limit <= 0 or (self._active < self.limit and not self._waiters):
+                self._active += 1
+                self._observe(0.0)
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._reject("queue_full")
+            timeout = self.target if self.overloaded else self.queue_timeout
+            remaining = deadline.remaining()
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+            if timeout <= 0:
+                self._reject("deadline")
+            waiter = _Waiter(notify)
+            self._waiters.append(waiter)
+            return waiter, timeout
+
+    def _settle(self, waiter, waited, abandon=False):
+        # Tras esperar: si el hueco llegó mientras tanto se queda, si no se rechaza
+        with self._lock:
+            if waiter.granted:
+                self._observe(waited)
+                if not abandon:
+                    return
+            else:
+                self._waiters.remove(waiter)
+                if not abandon:
+                    self._observe(waited)
+                    self._reject("queue_timeout")
+                return
+        self.release()
+
+    def acquire(self):
+        event = threading.Event()
+        entered = self._enter(event.set)
+        if entered is None:
+            return
+        waiter, timeout = entered
+        start = self._clock()
+        event.wait(timeout)
+        self._settle(waiter, self._clock() - start)
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entered = self._enter(lambda: loop.call_soon_threadsafe(_wake, future))
+        if entered is None:
+            return
+        waiter, timeout = entered
+        start = self._clock()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelada mientras esperaba: devuelve el hueco si ya se lo habían dado
+            self._settle(waiter, self._clock() - start, abandon=True)
+            raise
+        self._settle(waiter, self._clock() - start)
+
+    def release(self):
+        with self._lock:
+            if self.limit > 0 and self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.notify()
+            else:
+                self._active -= 1
+
+class AdmissionController:
+    def __init__(self, limiters):
+        self.limiters = {limiter.name: limiter for limiter in limiters}
+
+    @classmethod
+    def from_config(cls, max_threads=None):
+        limits = {
+            PASSWORD: ADMISSION_PASSWORD_CONCURRENCY,
+            READ: ADMISSION_READ_CONCURRENCY,
+            STREAM: ADMISSION_STREAM_CONCURRENCY,
+        }
+        limiters = []
+        for name, limit in limits.items():
+            max_queue = ADMISSION_MAX_QUEUE
+            share = THREAD_SHARES.get(name)
+            if max_threads and share:
+                threads = max(1, int(max_threads * share))
+                limit = min(limit, threads) if limit > 0 else threads
+                max_queue = min(max_queue, threads - limit)
+            limiters.append(AdmissionLimiter(name, limit, max_queue))
+        return cls(limiters)
+
+    def get(self, name):
+        return self.limiters.get(name) if name is not None else None
+
+    def stats(self) -> dict:
+        return {
+            name: {"active": limiter.active, "queued": limiter.queued,
+                   "limit": limiter.limit, "overloaded": limiter.overloaded}
+            for name, limiter in self.limiters.items()
+        }
+
+class NullAdmissionController(AdmissionController):
+    def __init__(self):
+        super().__init__([])
+
+def build_admission_controller(max_threads=None) -> AdmissionController:
+    if not ADMISSION_ENABLED:
+        return NullAdmissionController()
+    return AdmissionController.from_config(max_threads)
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = build_admission_controller()
+        return _controller
+
+def set_admission_controller(controller):
+    global _controller
+    with _controller_lock:
+        _controller = controller
+
+def _gauge(field):
+    return lambda: {
+        (name,): limiter[field] for name, limiter in get_admission_controller().stats().items()
+    }
+
+metrics.ADMISSION_IN_FLIGHT.set_function(_gauge("active"))
+metrics.ADMISSION_QUEUED.set_function(_gauge("queued"))
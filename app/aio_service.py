@@ -0,0 +1,311 @@
+import asyncio
+import functools
+import grpc
+import threading
+from concurrent import futures
+from bson import ObjectId, errors as bson_errors
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.auth import create_access_token_async
+from app.batch import (
+    BatchTooLarge, check_batch_size, parse_ids, order_by_request,
+    split_new_users, build_documents, insert_outcomes
+)
+from app.cache import find_user_async, find_users_async, find_version_async, get_user_cache
+from app.database import IndexesNotReady
+from app.config import (
+    GRPC_PORT, GRPC_MAX_WORKERS, GRPC_MAXIMUM_CONCURRENT_RPCS, GRPC_REUSE_PORT,
+    SHUTDOWN_GRACE_SECONDS, METRICS_ENABLED
+)
+from app.database import close_async_client
+from app.hashing import (
+    HashingBusyError, get_password_hash_async, get_password_hashes_async,
+    verify_password_async, needs_rehash, schedule_rehash
+)
+from app.instrumentation import (
+    AsyncAdmissionInterceptor, AsyncCompressionInterceptor, AsyncDeadlineInterceptor,
+    AsyncMetricsInterceptor
+)
+from app.pagination import InvalidPageToken
+from app.projections import AUTH_PROJECTION
+from app.ratelimit import LoginThrottled, get_login_limiter, peer_address
+from app.service import (
+    STOP_SIGNALS, not_modified_response, server_options, update_fields, user_response,
+    validate_tokens
+)
+from app.store import get_async_user_store
+import app.proto.user_pb2 as user_pb2
+import app.proto.user_pb2_grpc as user_pb2_grpc
+
+def reject_when_unavailable(response_cls):
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, request, context):
+            try:
+                return await method(self, request, context)
+            except HashingBusyError:
+                context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+                context.set_details('Servidor ocupado, intente de nuevo')
+                return response_cls()
+            except IndexesNotReady:
+                context.set_code(grpc.StatusCode.UNAVAILABLE)
+                context.set_details('Servicio no disponible todavía, intente de nuevo')
+                return response_cls()
+        return wrapper
+    return decorator
+
+# Misma lógica que app.service.UserService, pero sobre grpc.aio y el driver async:
+# ninguna llamada a Mongo o bcrypt bloquea el event loop
+class AsyncUserService(user_pb2_grpc.UserServiceServicer):
+    def __init__(self, store=None):
+        self.store = store if store is not None else get_async_user_store()
+        self.cache = get_user_cache()
+
+    @reject_when_unavailable(user_pb2.UserResponse)
+    async def CreateUser(self, request, context):
+        hashed_pw = await get_password_hash_async(request.password)
+        user = {
+            "username": request.username,
+            "email": request.email,
+            "password": hashed_pw
+        }
+        try:
+            user_id = await self.store.insert(user)
+        except DuplicateKeyError:
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details("Email ya registrado")
+            return user_pb2.UserResponse()
+        self.cache.invalidate(email=user["email"])
+        return user_pb2.UserResponse(
+            id=str(user_id),
+            username=user["username"],
+            email=user["email"]
+        )
+
+    async def GetUser(self, request, context):
+        try:
+            user_id = ObjectId(request.id)
+        except bson_errors.InvalidId:
+            user_id = None
+        user = None
+        if user_id is not None:
+            if request.if_version:
+                version = await find_version_async(self.store, self.cache, user_id=user_id)
+                if version == request.if_version:
+                    return not_modified_response(request, version)
+            user = await find_user_async(self.store, self.cache, user_id=user_id)
+        if user:
+            return user_response(user)
+        context.set_code(grpc.StatusCode.NOT_FOUND)
+        context.set_details('User not found')
+        return user_pb2.UserResponse()
+
+    @reject_when_unavailable(user_pb2.UserResponse)
+    async def UpdateUser(self, request, context):
+        try:
+            user_id = ObjectId(request.id)
+        except bson_errors.InvalidId:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid user id')
+            return user_pb2.UserResponse()
+        try:
+            fields = update_fields(request)
+        except ValueError as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.UserResponse()
+        if "password" in fields:
+            fields["password"] = await get_password_hash_async(fields["password"])
+        try:
+            user = await self.store.update(user_id, fields)
+        except DuplicateKeyError:
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details("Email ya registrado")
+            return user_pb2.UserResponse()
+        self.cache.invalidate(user_id=user_id, email=fields.get("email"))
+        if user:
+            return user_response(user)
+        context.set_code(grpc.StatusCode.NOT_FOUND)
+        context.set_details('User not found')
+        return user_pb2.UserResponse()
+
+    async def DeleteUser(self, request, context):
+        try:
+            user_id = ObjectId(request.id)
+        except bson_errors.InvalidId:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid user id')
+            return user_pb2.Empty()
+        deleted = await self.store.delete(user_id)
+        self.cache.invalidate(user_id=user_id)
+        if not deleted:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details('User not found')
+        return user_pb2.Empty()
+
+    async def ListUsers(self, request, context):
+        try:
+            users, next_token = await self.store.page(request.page_size, request.page_token)
+        except InvalidPageToken:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid page token')
+            return user_pb2.UserListResponse()
+        return user_pb2.UserListResponse(
+            users=[user_response(user) for user in users],
+            next_page_token=next_token
+        )
+
+    async def StreamUsers(self, request, context):
+        try:
+            cursor = self.store.iterate(request.page_token)
+        except InvalidPageToken:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid page token')
+            return
+        async with cursor:
+            async for user in cursor:
+                yield user_response(user)
+
+    async def BatchGetUsers(self, request, context):
+        try:
+            check_batch_size(len(request.ids))
+        except BatchTooLarge as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.BatchGetUsersResponse()
+        oids, _ = parse_ids(request.ids)
+        users = await find_users_async(self.store, self.cache, oids) if oids else []
+        found, not_found = order_by_request(request.ids, users)
+        return user_pb2.BatchGetUsersResponse(
+            users=[user_response(user) for user in found],
+            not_found_ids=not_found
+        )
+
+    @reject_when_unavailable(user_pb2.BatchCreateUsersResponse)
+    async def BatchCreateUsers(self, request, context):
+        try:
+            check_batch_size(len(request.users))
+        except BatchTooLarge as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.BatchCreateUsersResponse()
+        errors, valid = split_new_users(
+            [(item.username, item.email, item.password) for item in request.users]
+        )
+        hashes = await get_password_hashes_async([password for *_, password in valid])
+        documents = build_documents(valid, hashes)
+        error = None
+        if documents:
+            try:
+                await self.store.insert_many([doc for _, doc in documents])
+            except BulkWriteError as exc:
+                error = exc
+        results = [
+            user_pb2.BatchCreateUserResult(index=index, error=message)
+            for index, message in errors.items()
+        ]
+        for index, document, message in insert_outcomes(documents, error):
+            if document is None:
+                results.append(user_pb2.BatchCreateUserResult(index=index, error=message))
+            else:
+                self.cache.invalidate(email=document["email"])
+                results.append(user_pb2.BatchCreateUserResult(
+                    index=index, user=user_response(document)
+                ))
+        results.sort(key=lambda result: result.index)
+        return user_pb2.BatchCreateUsersResponse(results=results)
+
+    async def BatchDeleteUsers(self, request, context):
+        try:
+            check_batch_size(len(request.ids))
+        except BatchTooLarge as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.BatchDeleteUsersResponse()
+        oids, invalid = parse_ids(request.ids)
+        deleted = 0
+        if oids:
+            deleted = await self.store.delete_many(oids)
+            for oid in oids:
+                self.cache.invalidate(user_id=oid)
+        return user_pb2.BatchDeleteUsersResponse(deleted_count=deleted, invalid_ids=invalid)
+
+    @reject_when_unavailable(user_pb2.RegisterResponse)
+    async def Register(self, request, context):
+        hashed_pw = await get_password_hash_async(request.password)
+        user = {
+            "username": request.username,
+            "email": request.email,
+            "password": hashed_pw
+        }
+        # Un solo insert: el índice único de email detecta el duplicado
+        try:
+            user_id = await self.store.insert(user)
+        except DuplicateKeyError:
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details("Email ya registrado")
+            return user_pb2.RegisterResponse()
+        self.cache.invalidate(email=user["email"])
+        return user_pb2.RegisterResponse(id=str(user_id))
+
+    @reject_when_unavailable(user_pb2.LoginResponse)
+    async def Login(self, request, context):
+        limiter = get_login_limiter()
+        try:
+            limiter.check(request.email, peer_address(context.peer()))
+        except LoginThrottled:
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details("Demasiados intentos, intente más tarde")
+            return user_pb2.LoginResponse(access_token="", token_type="")
+        user = await self.store.get_by_email(request.email, AUTH_PROJECTION)
+        if not user or not await verify_password_async(request.password, user["password"]):
+            limiter.record_failure(request.email)
+            context.set_code(grpc.StatusCode.UNAUTHENTICATED)
+            context.set_details("Credenciales incorrectas")
+            return user_pb2.LoginResponse(access_token="", token_type="")
+        limiter.record_success(request.email)
+        if needs_rehash(user["password"]):
+            schedule_rehash(self.store, user["email"], request.password, user["password"])
+        token = await create_access_token_async({"sub": user["email"]})
+        return user_pb2.LoginResponse(access_token=token, token_type="bearer")
+
+    async def ValidateTokens(self, request, context):
+        try:
+            check_batch_size(len(request.tokens))
+        except BatchTooLarge as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.ValidateTokensResponse()
+        # Las firmas asimétricas cuestan milisegundos por token: fuera del event loop
+        return await asyncio.to_thread(validate_tokens, list(request.tokens))
+
+async def serve(port=GRPC_PORT, max_workers=GRPC_MAX_WORKERS,
+                maximum_concurrent_rpcs=GRPC_MAXIMUM_CONCURRENT_RPCS,
+                reuse_port=GRPC_REUSE_PORT, grace=SHUTDOWN_GRACE_SECONDS):
+    server = grpc.aio.server(
+        # Solo se usa para handlers síncronos; los de AsyncUserService corren en el loop
+        migration_thread_pool=futures.ThreadPoolExecutor(max_workers=max_workers),
+        interceptors=([AsyncMetricsInterceptor()] if METRICS_ENABLED else [])
+        + [AsyncDeadlineInterceptor(), AsyncAdmissionInterceptor(),
+           AsyncCompressionInterceptor()],
+        options=server_options(reuse_port),
+        maximum_concurrent_rpcs=maximum_concurrent_rpcs,
+    )
+    service = AsyncUserService()
+    user_pb2_grpc.add_UserServiceServicer_to_server(service, server)
+    server.add_insecure_port(f'[::]:{port}')
+    prepare = asyncio.create_task(service.store.prepare())
+    await server.start()
+    print(f"gRPC UserService (aio) running on port {port}")
+    stopping = []
+    if threading.current_thread() is threading.main_thread():
+        loop = asyncio.get_running_loop()
+        for signum in STOP_SIGNALS:
+            # wait_for_termination vuelve cuando acaban las RPCs activas o vence `grace`
+            loop.add_signal_handler(signum, lambda: stopping.append(
+                asyncio.ensure_future(server.stop(grace))))
+    try:
+        await server.wait_for_termination()
+    finally:
+        prepare.cancel()
+        await server.stop(None)
+        await close_async_client()
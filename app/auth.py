@@ -1,17 +1,51 @@
-from jose import JWTError, jwt
+import asyncio
+import hashlib
+import time
+from jose import JWTError
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
+from app import metrics
+from app.cache import ExpiringLRU, MISS, event_counts
+from app.config import (
+    TOKEN_CACHE_MAX_SIZE, TOKEN_CACHE_NEGATIVE_TTL_SECONDS, PASSWORD_SCHEMES,
+    PASSWORD_BCRYPT_ROUNDS, PASSWORD_ARGON2_TIME_COST, PASSWORD_ARGON2_MEMORY_COST,
+    PASSWORD_ARGON2_PARALLELISM
+)
 
-# Configuración
-SECRET_KEY = "tu_clave_secreta_muylarga"
-ALGORITHM = "HS256"
+from app.signing import get_signer
+
+# Configuración (la firma de tokens está en app.signing)
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def build_pwd_context(schemes=PASSWORD_SCHEMES, bcrypt_rounds=PASSWORD_BCRYPT_ROUNDS,
+                      argon2_time_cost=PASSWORD_ARGON2_TIME_COST,
+                      argon2_memory_cost=PASSWORD_ARGON2_MEMORY_COST,
+                      argon2_parallelism=PASSWORD_ARGON2_PARALLELISM):
+    # min/max_desired iguales al coste por defecto: needs_update() marca los hashes
+    # con otro coste, no solo los de esquemas obsoletos
+    return CryptContext(
+        schemes=list(schemes),
+        deprecated="auto",
+        bcrypt__default_rounds=bcrypt_rounds,
+        bcrypt__min_desired_rounds=bcrypt_rounds,
+        bcrypt__max_desired_rounds=bcrypt_rounds,
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+# Los workers del pool de hash lo reconstruyen al importar, con las mismas variables
+pwd_context = build_pwd_context()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Payloads ya verificados, por digest del token; expiran en el "exp" de cada token.
+# Los tokens inválidos se recuerdan poco tiempo. None desactiva la caché.
+token_cache = (
+    ExpiringLRU(TOKEN_CACHE_MAX_SIZE, clock=time.time) if TOKEN_CACHE_MAX_SIZE > 0 else None
+)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -22,19 +56,89 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return get_signer().sign(to_encode)
 
-def decode_access_token(token: str):
+async def create_access_token_async(data: dict, expires_delta: timedelta = None):
+    if get_signer().offload:
+        return await asyncio.to_thread(create_access_token, data, expires_delta)
+    return create_access_token(data, expires_delta)
+
+def _invalid_token():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token inválido o expirado",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+class InvalidToken(Exception):
+    def __init__(self):
+        super().__init__("Token inválido o expirado")
+
+def _verify(token):
+    signer = get_signer()
+    algorithm = "unknown"
+    start = time.perf_counter()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        algorithm = signer.algorithm_for(token)
+        return signer.verify(token)
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido o expirado",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = decode_access_token(token)
-    return payload
\ No newline at end of file
+        raise InvalidToken()
+    finally:
+        metrics.TOKEN_VERIFY_LATENCY.observe(time.perf_counter() - start, algorithm=algorithm)
+
+def _cached(token):
+    # (clave de caché, payload o MISS); InvalidToken si se recuerda como inválido
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        raise InvalidToken()
+    return key, payload
+
+def _verify_and_cache(key, token):
+    try:
+        payload = _verify(token)
+    except InvalidToken:
+        token_cache.set(key, None, time.time() + TOKEN_CACHE_NEGATIVE_TTL_SECONDS)
+        raise
+    if "exp" in payload:
+        token_cache.set(key, payload, float(payload["exp"]))
+    return payload
+
+# Payload del token o InvalidToken; lo usan get_current_user y ValidateTokens
+def verify_token(token: str) -> dict:
+    if token_cache is None:
+        return _verify(token)
+    key, payload = _cached(token)
+    if payload is MISS:
+        payload = _verify_and_cache(key, token)
+    return dict(payload)
+
+# Igual, pero la verificación asimétrica se hace en un hilo; los aciertos de la
+# caché se resuelven en el bucle sin cambiar de hilo
+async def verify_token_async(token: str) -> dict:
+    if not get_signer().offload:
+        return verify_token(token)
+    if token_cache is None:
+        return await asyncio.to_thread(_verify, token)
+    key, payload = _cached(token)
+    if payload is MISS:
+        payload = await asyncio.to_thread(_verify_and_cache, key, token)
+    return dict(payload)
+
+def decode_access_token(token: str):
+    try:
+        return verify_token(token)
+    except InvalidToken:
+        raise _invalid_token()
+
+metrics.TOKEN_CACHE_EVENTS.set_function(
+    lambda: event_counts(token_cache.stats()) if token_cache is not None else {}
+)
+metrics.TOKEN_CACHE_SIZE.set_function(lambda: len(token_cache) if token_cache is not None else 0)
+
+# async para que FastAPI no gaste un hilo del threadpool en cada petición
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    try:
+        return await verify_token_async(token)
+    except InvalidToken:
+        raise _invalid_token()
\ No newline at end of file
@@ -0,0 +1,66 @@
+from bson import ObjectId, errors as bson_errors
+from app.config import USERS_MAX_BATCH_SIZE
+
+DUPLICATE_KEY_ERROR = 11000
+
+class BatchTooLarge(ValueError):
+    pass
+
+def check_batch_size(size: int):
+    if size > USERS_MAX_BATCH_SIZE:
+        raise BatchTooLarge(f"Máximo {USERS_MAX_BATCH_SIZE} elementos por lote")
+
+def parse_ids(ids):
+    oids, invalid = [], []
+    for raw in ids:
+        try:
+            oids.append(ObjectId(raw))
+        except (bson_errors.InvalidId, TypeError):
+            invalid.append(raw)
+    return oids, invalid
+
+def order_by_request(ids, users):
+    # Devuelve los usuarios en el orden pedido y los ids sin usuario
+    by_id = {str(user["_id"]): user for user in users}
+    found, not_found = [], []
+    for raw in ids:
+        try:
+            user = by_id.get(str(ObjectId(raw)))
+        except (bson_errors.InvalidId, TypeError):
+            user = None
+        if user is None:
+            not_found.append(raw)
+        else:
+            found.append(user)
+    return found, not_found
+
+def split_new_users(users):
+    # users: lista de (username, email, password); devuelve errores por índice y los válidos
+    errors, valid = {}, []
+    for index, (username, email, password) in enumerate(users):
+        if not email or not password:
+            errors[index] = "Email y contraseña son obligatorios"
+        else:
+            valid.append((index, username, email, password))
+    return errors, valid
+
+def build_documents(valid, hashes):
+    return [
+        (index, {"username": username, "email": email, "password": hashed})
+        for (index, username, email, _), hashed in zip(valid, hashes)
+    ]
+
+def insert_outcomes(documents, error=None):
+    # insert_many asigna _id a cada documento antes de enviarlo; con ordered=False
+    # los que no aparecen en writeErrors se insertaron
+    failed = {}
+    if error is not None:
+        for write_error in error.details.get("writeErrors", []):
+            if write_error["code"] == DUPLICATE_KEY_ERROR:
+                failed[write_error["index"]] = "Email ya registrado"
+            else:
+                failed[write_error["index"]] = write_error.get("errmsg", "Error al insertar")
+    return [
+        (index, None, failed[position]) if position in failed else (index, document, None)
+        for position, (index, document) in enumerate(documents)
+    ]
@@ -0,0 +1,368 @@
+import threading
+import time
+from collections import OrderedDict
+from app import metrics
+from app.projections import PROFILE_PROJECTION, document_version
+from app.config import (
+    USER_CACHE_BACKEND, USER_CACHE_MAX_SIZE,
+    USER_CACHE_TTL_SECONDS, USER_CACHE_NEGATIVE_TTL_SECONDS
+)
+
+# get_by_id/get_by_email devuelven MISS si no hay nada en caché y None si se
+# guardó que el usuario no existe (caché negativa)
+MISS = object()
+
+PROFILE_FIELDS = ("_id", "username", "email")
+
+# Campos de stats() que no son contadores de eventos
+SIZE_FIELDS = ("size", "max_size")
+
+def event_counts(stats: dict) -> dict:
+    # stats() -> {(evento,): valor} para un Counter con la etiqueta "event"
+    return {(event,): value for event, value in stats.items() if event not in SIZE_FIELDS}
+
+class ExpiringLRU:
+    # Diccionario acotado con expiración por entrada (expires_at según clock).
+    # Un valor None es una entrada negativa ("se sabe que no existe") y cuenta aparte.
+    # on_evict(key, value) se llama, con el lock tomado, por cada entrada que sale
+    # por LRU o por expirar.
+    def __init__(self, max_size: int, clock=time.monotonic, on_evict=None):
+        self.max_size = max_size
+        self._clock = clock
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+        }
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return MISS
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                if self._on_evict is not None:
+                    self._on_evict(key, value)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self._counters["hits" if value is not None else "negative_hits"] += 1
+            return value
+
+    def peek(self, key, default=None):
+        # Sin contar ni mover la entrada, y aunque haya expirado
+        with self._lock:
+            entry = self._entries.get(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                evicted, (_, old) = self._entries.popitem(last=False)
+                if self._on_evict is not None:
+                    self._on_evict(evicted, old)
+                self._counters["evictions"] += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, size=len(self._entries), max_size=self.max_size)
+
+class UserCache:
+    # Interfaz: las implementaciones compartidas (p.ej. Redis) se registran con register_backend
+    def get_by_id(self, user_id):
+        return MISS
+
+    def get_by_email(self, email):
+        return MISS
+
+    def generation(self):
+        # Se toma antes de leer del store y se pasa a set/set_missing (since=): si
+        # entretanto se invalidó alguna de sus claves, no se guarda lo leído
+        return None
+
+    def set(self, user, since=None):
+        pass
+
+    def set_missing(self, user_id=None, email=None, since=None):
+        pass
+
+    def invalidate(self, user_id=None, email=None):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+class NullUserCache(UserCache):
+    pass
+
+class LRUUserCache(UserCache):
+    # Cada perfil se guarda bajo ("id", id) y ("email", email) en un ExpiringLRU.
+    # self._lock agrupa las operaciones de varias claves (y el índice id -> email).
+    def __init__(self, max_size=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS,
+                 negative_ttl=USER_CACHE_NEGATIVE_TTL_SECONDS, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries = ExpiringLRU(max_size, clock=clock, on_evict=self._drop)
+        # id -> email de los perfiles guardados bajo su email: aunque se desaloje la
+        # entrada por id, invalidate(user_id=...) encuentra la del email anterior
+        self._emails = {}
+        self._lock = threading.Lock()
+        self._invalidations = 0
+        # Generación de la última invalidación de cada clave (acotado a max_size).
+        # Lo que sale del mapa sube _floor: un relleno anterior a _floor se descarta.
+        self._generation = 0
+        self._invalidated = OrderedDict()
+        self._floor = 0
+
+    def _drop(self, key, user):
+        # Bajo self._lock, al salir una entrada: mantiene el índice id -> email
+        kind, value = key
+        if kind == "email" and user is not None:
+            user_id = str(user["_id"])
+            if self._emails.get(user_id) == value:
+                del self._emails[user_id]
+
+    def _get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def _put(self, key, user, ttl):
+        self._entries.set(key, user, self._clock() + ttl)
+
+    def _stale(self, keys, since):
+        # Bajo self._lock
+        if since is None:
+            return False
+        return since < self._floor or any(self._invalidated.get(key, 0) > since for key in keys)
+
+    def _bump(self, keys):
+        # Bajo self._lock
+        self._generation += 1
+        for key in keys:
+            self._invalidated[key] = self._generation
+            self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_size:
+            _, generation = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, generation)
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get_by_id(self, user_id):
+        return self._get(("id", str(user_id)))
+
+    def get_by_email(self, email):
+        return self._get(("email", email))
+
+    def set(self, user, since=None):
+        # Solo el perfil público: el hash de la contraseña nunca entra en caché
+        profile = {field: user[field] for field in PROFILE_FIELDS}
+        profile["version"] = document_version(user)
+        keys = (("id", str(profile["_id"])), ("email", profile["email"]))
+        with self._lock:
+            if self._stale(keys, since):
+                return
+            self._put(("id", str(profile["_id"])), profile, self.ttl)
+            self._put(("email", profile["email"]), profile, self.ttl)
+            self._emails[str(profile["_id"])] = profile["email"]
+
+    def set_missing(self, user_id=None, email=None, since=None):
+        keys = []
+        if user_id is not None:
+            keys.append(("id", str(user_id)))
+        if email is not None:
+            keys.append(("email", email))
+        with self._lock:
+            if self._stale(keys, since):
+                return
+            if user_id is not None:
+                self._put(("id", str(user_id)), None, self.negative_ttl)
+            if email is not None:
+                self._put(("email", email), None, self.negative_ttl)
+
+    def invalidate(self, user_id=None, email=None):
+        keys = []
+        if user_id is not None:
+            keys.append(("id", str(user_id)))
+        if email is not None:
+            keys.append(("email", email))
+        with self._lock:
+            # Cada perfil vive bajo su id y su email: se borran las dos claves
+            if user_id is not None and str(user_id) in self._emails:
+                keys.append(("email", self._emails[str(user_id)]))
+            for key in list(keys):
+                user = self._entries.peek(key)
+                if user is not None:
+                    keys.append(("id", str(user["_id"])))
+                    keys.append(("email", user["email"]))
+            keys = list(dict.fromkeys(keys))
+            self._bump(keys)
+            for key in keys:
+                user = self._entries.pop(key, MISS)
+                if user is not MISS:
+                    self._drop(key, user)
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._emails.clear()
+            # Los rellenos en curso tampoco deben guardarse
+            self._invalidated.clear()
+            self._generation += 1
+            self._floor = self._generation
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._entries.stats(), invalidations=self._invalidations)
+
+_backends = {
+    "memory": LRUUserCache,
+    "none": NullUserCache,
+}
+# Backends con la caché dentro del proceso: con varios procesos (app.launcher) uno
+# no ve las invalidaciones de los demás
+LOCAL_BACKENDS = ("memory",)
+
+def register_backend(name: str, factory):
+    _backends[name] = factory
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_user_cache() -> UserCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = _backends[USER_CACHE_BACKEND]()
+        return _cache
+
+def set_user_cache(cache: UserCache):
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+metrics.USER_CACHE_EVENTS.set_function(lambda: event_counts(get_user_cache().stats()))
+metrics.USER_CACHE_SIZE.set_function(lambda: get_user_cache().stats().get("size", 0))
+
+# Lectura a través de la caché (store: app.store.UserStore / AsyncUserStore)
+def _lookup(cache, user_id, email):
+    if user_id is not None:
+        return cache.get_by_id(user_id)
+    return cache.get_by_email(email)
+
+def _remember(cache, user, user_id, email, since):
+    if user:
+        cache.set(user, since=since)
+    else:
+        cache.set_missing(user_id=user_id, email=email, since=since)
+
+# La generación se toma antes de leer del store: una invalidación concurrente
+# (PUT/PATCH/DELETE) impide guardar el perfil ya obsoleto que se acaba de leer
+def find_user(store, cache, user_id=None, email=None):
+    cached = _lookup(cache, user_id, email)
+    if cached is not MISS:
+        return cached
+    since = cache.generation()
+    if user_id is not None:
+        user = store.get_by_id(user_id)
+    else:
+        user = store.get_by_email(email)
+    _remember(cache, user, user_id, email, since)
+    return user
+
+async def find_user_async(store, cache, user_id=None, email=None):
+    cached = _lookup(cache, user_id, email)
+    if cached is not MISS:
+        return cached
+    since = cache.generation()
+    if user_id is not None:
+        user = await store.get_by_id(user_id)
+    else:
+        user = await store.get_by_email(email)
+    _remember(cache, user, user_id, email, since)
+    return user
+
+# Versión para peticiones condicionales: de la caché si está el perfil y, si no,
+# store.get_version (índice cubierto). No llena la caché: no trae el perfil.
+def _cached_version(cache, user_id, email):
+    cached = _lookup(cache, user_id, email)
+    if cached is MISS or cached is None:
+        return cached
+    return document_version(cached)
+
+def find_version(store, cache, user_id=None, email=None):
+    version = _cached_version(cache, user_id, email)
+    if version is MISS:
+        version = store.get_version(user_id=user_id, email=email)
+    return version
+
+async def find_version_async(store, cache, user_id=None, email=None):
+    version = _cached_version(cache, user_id, email)
+    if version is MISS:
+        version = await store.get_version(user_id=user_id, email=email)
+    return version
+
+# Lectura por lotes: solo se consultan al store los ids que no están en caché
+
+def _split_cached(cache, oids):
+    found, missing = [], []
+    for oid in dict.fromkeys(oids):
+        cached = cache.get_by_id(oid)
+        if cached is MISS:
+            missing.append(oid)
+        elif cached is not None:
+            found.append(cached)
+    return found, missing
+
+def _remember_many(cache, users, missing, since):
+    seen = set()
+    for user in users:
+        cache.set(user, since=since)
+        seen.add(user["_id"])
+    for oid in missing:
+        if oid not in seen:
+            cache.set_missing(user_id=oid, since=since)
+
+def find_users(store, cache, oids):
+    found, missing = _split_cached(cache, oids)
+    if missing:
+        since = cache.generation()
+        users = store.get_many(missing, PROFILE_PROJECTION)
+        _remember_many(cache, users, missing, since)
+        found.extend(users)
+    return found
+
+async def find_users_async(store, cache, oids):
+    found, missing = _split_cached(cache, oids)
+    if missing:
+        since = cache.generation()
+        users = await store.get_many(missing, PROFILE_PROJECTION)
+        _remember_many(cache, users, missing, since)
+        found.extend(users)
+    return found
@@ -0,0 +1,342 @@
+# Importación y exportación masiva de usuarios, en streaming (memoria constante).
+#   python -m app.cli import usuarios.ndjson [--format csv] [--batch-size 1000] [--workers 8]
+#   python -m app.cli export usuarios.ndjson [--format csv] [--with-password]
+#   python -m app.cli calibrate [--target-ms 250] [--scheme bcrypt]
+#   python -m app.cli keygen --dir keys --kid 2026-10 [--algorithm ES256]
+# Con "-" se lee de stdin o se escribe en stdout. Usa el store de USER_STORE_BACKEND.
+#
+# Cada fila lleva username, email y, o bien password (texto plano, se hashea en el
+# pool de procesos), o bien password_hash (bcrypt ya calculado, se guarda tal cual).
+# La importación guarda un checkpoint tras cada lote: si se corta, al relanzarla
+# continúa por la primera fila no confirmada. Antes de importar se aseguran los
+# índices: las filas de un lote sin confirmar cuentan como duplicadas al repetirlo
+# solo si existe el índice único de email.
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent import futures
+from passlib.exc import MissingBackendError
+from pymongo.errors import BulkWriteError, PyMongoError
+from app import hashing
+from app.auth import build_pwd_context, pwd_context
+from app.batch import insert_outcomes
+from app.config import JWT_KEYS_DIR
+from app.database import IndexVerificationError
+from app.projections import PROFILE_PROJECTION
+from app.signing import ASYMMETRIC_ALGORITHMS, write_key
+from app.store import get_user_store
+
+FORMATS = ("ndjson", "csv")
+EXPORT_FIELDS = ("id", "username", "email")
+
+class Progress:
+    def __init__(self, label, stream=sys.stderr, interval=1.0, clock=time.monotonic):
+        self.label = label
+        self.stream = stream
+        self.interval = interval
+        self.clock = clock
+        self.start = clock()
+        self.rows = 0
+        self._last = self.start
+
+    @property
+    def rate(self) -> float:
+        elapsed = self.clock() - self.start
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def add(self, rows, **extra):
+        self.rows += rows
+        now = self.clock()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.report(**extra)
+
+    def report(self, **extra):
+        details = "".join(f", {name}={value}" for name, value in extra.items())
+        print(f"{self.label}: {self.rows} filas, {self.rate:.0f} filas/s{details}",
+              file=self.stream, flush=True)
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return "csv" if path.endswith(".csv") else "ndjson"
+
+def read_rows(stream, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def _document(row):
+    # Devuelve (documento, contraseña en claro o None) o lanza ValueError
+    email = (row.get("email") or "").strip()
+    if not email:
+        raise ValueError("Falta el email")
+    document = {"username": row.get("username") or "", "email": email}
+    hashed = row.get("password_hash")
+    if hashed:
+        if pwd_context.identify(hashed) is None:
+            raise ValueError("password_hash no es un hash reconocido")
+        document["password"] = hashed
+        return document, None
+    if not row.get("password"):
+        raise ValueError("Falta password o password_hash")
+    return document, row["password"]
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _prepare_batch(rows, first_row, hash_many):
+    # Valida y hashea un lote; devuelve [(nº de fila, documento)] y los errores
+    documents, plain, errors = [], [], []
+    for offset, row in enumerate(rows):
+        try:
+            document, password = _document(row)
+        except (ValueError, TypeError, AttributeError) as exc:
+            errors.append((first_row + offset, str(exc)))
+            continue
+        if password is not None:
+            plain.append((len(documents), password))
+        documents.append((first_row + offset, document))
+    if plain:
+        for (position, _), hashed in zip(plain, hash_many([password for _, password in plain])):
+            documents[position][1]["password"] = hashed
+    return documents, errors
+
+def _insert_batch(store, documents):
+    if not documents:
+        return []
+    error = None
+    try:
+        store.insert_many([document for _, document in documents])
+    except BulkWriteError as exc:
+        error = exc
+    return insert_outcomes(documents, error)
+
+class Checkpoint:
+    # Número de filas de la entrada ya confirmadas; se escribe de forma atómica
+    def __init__(self, path):
+        self.path = path
+
+    def load(self) -> int:
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as handle:
+            return json.load(handle)["rows"]
+
+    def save(self, rows: int):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as handle:
+            json.dump({"rows": rows}, handle)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def import_users(store, rows, batch_size=1000, hash_many=None, checkpoint=None,
+                 progress=None, errors_out=None):
+    # El lote N se inserta en un hilo mientras se valida y hashea el N+1
+    hash_many = hash_many or hashing.get_password_hashes
+    checkpoint = checkpoint or Checkpoint(None)
+    progress = progress or Progress("import")
+    skip = checkpoint.load()
+    stats = {"inserted": 0, "duplicates": 0, "errors": 0, "skipped": skip}
+
+    def reject(row, message):
+        stats["errors"] += 1
+        if errors_out is not None:
+            print(json.dumps({"row": row, "error": message}), file=errors_out)
+
+    def finish(pending):
+        future, invalid, rows_done, count = pending
+        for row, message in invalid:
+            reject(row, message)
+        for row, document, message in future.result():
+            if document is not None:
+                stats["inserted"] += 1
+            elif message == "Email ya registrado":
+                # Al reanudar, las filas ya insertadas caen aquí y no se duplican
+                stats["duplicates"] += 1
+            else:
+                reject(row, message)
+        checkpoint.save(rows_done)
+        progress.add(count, **stats)
+
+    row_number = skip
+    pending = None
+    with futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="import-insert") as writer:
+        for batch in _batches(itertools.islice(rows, skip, None), batch_size):
+            documents, invalid = _prepare_batch(batch, row_number, hash_many)
+            row_number += len(batch)
+            if pending is not None:
+                finish(pending)
+            pending = (writer.submit(_insert_batch, store, documents), invalid,
+                       row_number, len(batch))
+        if pending is not None:
+            finish(pending)
+    checkpoint.clear()
+    progress.report(**stats)
+    return stats
+
+def export_row(user, with_password=False) -> dict:
+    row = {"id": str(user["_id"]), "username": user.get("username", ""),
+           "email": user.get("email", "")}
+    if with_password:
+        row["password_hash"] = user.get("password", "")
+    return row
+
+def export_users(store, out, fmt="ndjson", with_password=False, after="", progress=None):
+    progress = progress or Progress("export")
+    projection = dict(PROFILE_PROJECTION, password=1) if with_password else PROFILE_PROJECTION
+    writer = None
+    if fmt == "csv":
+        fields = EXPORT_FIELDS + (("password_hash",) if with_password else ())
+        writer = csv.DictWriter(out, fieldnames=fields)
+        writer.writeheader()
+    with store.iterate(after, projection) as cursor:
+        for user in cursor:
+            row = export_row(user, with_password)
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(row) + "\n")
+            progress.add(1)
+    progress.report()
+    return progress.rows
+
+# Calibración: el mayor coste cuyo verify no pasa del objetivo en esta máquina.
+# bcrypt varía rounds (cada uno dobla el tiempo); argon2, time_cost con la memoria
+# y el paralelismo configurados.
+CALIBRATION_COSTS = {
+    "bcrypt": ("bcrypt_rounds", "PASSWORD_BCRYPT_ROUNDS", range(4, 20)),
+    "argon2": ("argon2_time_cost", "PASSWORD_ARGON2_TIME_COST", range(1, 20)),
+}
+
+def verify_seconds(context, samples=3) -> float:
+    hashed = context.hash("calibracion")
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.verify("calibracion", hashed)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def calibrate(scheme="bcrypt", target_ms=250.0, samples=3, measure=verify_seconds,
+              out=sys.stderr) -> int:
+    option, _, costs = CALIBRATION_COSTS[scheme]
+    chosen = costs[0]
+    for cost in costs:
+        elapsed = measure(build_pwd_context(schemes=[scheme], **{option: cost}), samples) * 1000
+        print(f"{scheme} coste {cost}: {elapsed:.1f} ms", file=out, flush=True)
+        if elapsed > target_ms:
+            break
+        chosen = cost
+    return chosen
+
+def _open(path, mode):
+    # stdin/stdout no se cierran al salir del with
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if "r" in mode else sys.stdout)
+    return open(path, mode, newline="" if path.endswith(".csv") else None, encoding="utf-8")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="Carga usuarios desde NDJSON o CSV")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=FORMATS)
+    importer.add_argument("--batch-size", type=int, default=1000)
+    importer.add_argument("--workers", type=int, default=0,
+                          help="Procesos de hash (por defecto, PASSWORD_HASH_WORKERS)")
+    importer.add_argument("--checkpoint", help="Fichero de reanudación (por defecto, <path>.progress)")
+    importer.add_argument("--restart", action="store_true", help="Ignora el checkpoint existente")
+    importer.add_argument("--errors", help="Escribe las filas rechazadas en este fichero NDJSON")
+
+    exporter = commands.add_parser("export", help="Vuelca los usuarios a NDJSON o CSV")
+    exporter.add_argument("path")
+    exporter.add_argument("--format", choices=FORMATS)
+    exporter.add_argument("--with-password", action="store_true",
+                          help="Incluye password_hash (copias de seguridad)")
+    exporter.add_argument("--after", default="", help="Page token desde el que continuar")
+
+    calibrator = commands.add_parser("calibrate", help="Elige el coste de hash para un tiempo de verify")
+    calibrator.add_argument("--target-ms", type=float, default=250.0)
+    calibrator.add_argument("--scheme", choices=sorted(CALIBRATION_COSTS), default="bcrypt")
+    calibrator.add_argument("--samples", type=int, default=3)
+
+    keygen = commands.add_parser("keygen", help="Crea una clave de firma de tokens en JWT_KEYS_DIR")
+    keygen.add_argument("--dir", default=JWT_KEYS_DIR or "keys")
+    keygen.add_argument("--kid", required=True)
+    keygen.add_argument("--algorithm", choices=ASYMMETRIC_ALGORITHMS, default="ES256")
+
+    args = parser.parse_args(argv)
+    if args.command == "keygen":
+        try:
+            path = write_key(args.dir, args.kid, args.algorithm)
+        except FileExistsError:
+            print(f"Ya existe una clave con kid {args.kid}", file=sys.stderr)
+            return 1
+        print(path)
+        return 0
+    if args.command == "calibrate":
+        try:
+            cost = calibrate(args.scheme, args.target_ms, args.samples)
+        except MissingBackendError as exc:
+            print(f"No se puede calibrar {args.scheme}: {exc}", file=sys.stderr)
+            return 2
+        print(f"{CALIBRATION_COSTS[args.scheme][1]}={cost}")
+        return 0
+
+    fmt = _format_for(args.path, args.format)
+    store = get_user_store()
+
+    if args.command == "export":
+        with _open(args.path, "w") as out:
+            export_users(store, out, fmt, args.with_password, args.after)
+        return 0
+
+    try:
+        store.ensure_indexes()
+    except (PyMongoError, IndexVerificationError) as exc:
+        print(f"No se pueden asegurar los índices de usuarios: {exc}", file=sys.stderr)
+        return 2
+    if args.workers:
+        hashing.configure(kind="process", workers=args.workers)
+    checkpoint_path = args.checkpoint or (None if args.path == "-" else args.path + ".progress")
+    checkpoint = Checkpoint(checkpoint_path)
+    if args.restart:
+        checkpoint.clear()
+    errors_out = open(args.errors, "a", encoding="utf-8") if args.errors else None
+    try:
+        with _open(args.path, "r") as source:
+            stats = import_users(
+                store, read_rows(source, fmt), args.batch_size,
+                checkpoint=checkpoint, errors_out=errors_out,
+            )
+    finally:
+        if errors_out is not None:
+            errors_out.close()
+    return 1 if stats["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import importlib.util
+import random
+import time
+import zlib
+import grpc
+from app import metrics
+
+# Compresión de respuestas: negociación y compresores para HTTP (CompressionMiddleware),
+# algoritmos de gRPC (CompressionInterceptor, en app.instrumentation) y compresores
+# de red de Mongo. Todo lo que se comprime deja bytes, ratio y CPU en las métricas
+# response_compression_* para decidir por endpoint si compensa.
+
+# wbits de zlib: gzip lleva cabecera gzip; "deflate" en HTTP es el formato zlib
+WBITS = {"gzip": 31, "deflate": 15}
+
+GRPC_ALGORITHMS = {
+    "gzip": grpc.Compression.Gzip,
+    "deflate": grpc.Compression.Deflate,
+    "none": None,
+}
+
+# Paquete que necesita cada compresor de pymongo (zlib viene con Python)
+MONGO_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+
+def grpc_algorithm(name: str):
+    try:
+        return GRPC_ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"Compresión gRPC desconocida: {name}") from None
+
+def mongo_compressors(names: str) -> str:
+    # pymongo avisa y descarta los que no puede cargar; aquí se filtran antes
+    available = []
+    for name in (n.strip() for n in names.split(",")):
+        if name not in MONGO_COMPRESSOR_MODULES:
+            continue
+        module = MONGO_COMPRESSOR_MODULES[name]
+        if module is None or importlib.util.find_spec(module) is not None:
+            available.append(name)
+    return ",".join(available)
+
+def negotiate(accept_encoding: str, offered) -> str:
+    # Primera de `offered` que el cliente acepta con q > 0 (o None)
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in offered:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def observe(transport, endpoint, encoding, raw, compressed, seconds):
+    labels = {"transport": transport, "endpoint": endpoint, "encoding": encoding}
+    metrics.COMPRESSION_BYTES.inc(raw, stage="raw", **labels)
+    metrics.COMPRESSION_BYTES.inc(compressed, stage="compressed", **labels)
+    if raw:
+        metrics.COMPRESSION_RATIO.observe(compressed / raw, **labels)
+    metrics.COMPRESSION_SECONDS.observe(seconds, **labels)
+
+class StreamCompressor:
+    # Comprime un cuerpo por trozos; cada trozo sale entero (Z_SYNC_FLUSH) para que
+    # un stream NDJSON no se quede retenido en el compresor
+    def __init__(self, encoding: str, level: int = 6):
+        self.encoding = encoding
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+        self.raw = 0
+        self.compressed = 0
+        self.seconds = 0.0
+
+    def compress(self, chunk: bytes, final: bool = False) -> bytes:
+        start = time.thread_time()
+        data = self._compressor.compress(chunk)
+        data += self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        self.seconds += time.thread_time() - start
+        self.raw += len(chunk)
+        self.compressed += len(data)
+        return data
+
+    def record(self, transport, endpoint):
+        observe(transport, endpoint, self.encoding, self.raw, self.compressed, self.seconds)
+
+def sample(endpoint, encoding, message, rate):
+    # Estimación para gRPC: recomprime con zlib una fracción de los mensajes
+    if rate <= 0 or random.random() >= rate:
+        return
+    compressor = StreamCompressor(encoding)
+    compressor.compress(message.SerializeToString(), final=True)
+    compressor.record("grpc", endpoint)
@@ -0,0 +1,164 @@
+import os
+
+# Paginación de usuarios (ListUsers / StreamUsers)
+USERS_DEFAULT_PAGE_SIZE = int(os.getenv("USERS_DEFAULT_PAGE_SIZE", "100"))
+USERS_MAX_PAGE_SIZE = int(os.getenv("USERS_MAX_PAGE_SIZE", "1000"))
+USERS_CURSOR_BATCH_SIZE = int(os.getenv("USERS_CURSOR_BATCH_SIZE", "500"))
+
+# Hash de contraseñas (bcrypt) fuera del hilo que atiende la petición
+# PASSWORD_HASH_EXECUTOR: process | thread | inline
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "process")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or (os.cpu_count() or 1)
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+# spawn evita heredar los hilos de gRPC/uvicorn en los procesos hijos
+PASSWORD_HASH_START_METHOD = os.getenv("PASSWORD_HASH_START_METHOD", "spawn")
+
+# Política de hash (app.auth.pwd_context). El primer esquema se usa para los hashes
+# nuevos; el resto solo se verifica y se migra al hacer login ("argon2,bcrypt"
+# requiere argon2-cffi). Los costes se eligen con `python -m app.cli calibrate`.
+PASSWORD_SCHEMES = [s.strip() for s in os.getenv("PASSWORD_SCHEMES", "bcrypt").split(",") if s.strip()]
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", "3"))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", "65536"))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", "4"))
+# Rehash en segundo plano de los hashes que no siguen la política, tras un login correcto
+PASSWORD_REHASH_ON_LOGIN = os.getenv("PASSWORD_REHASH_ON_LOGIN", "1") == "1"
+# Rehashes pendientes como máximo (cada uno guarda la contraseña en memoria hasta hacerse)
+PASSWORD_REHASH_MAX_PENDING = int(os.getenv("PASSWORD_REHASH_MAX_PENDING", "100"))
+
+# Motor de almacenamiento de usuarios (app.store)
+# USER_STORE_BACKEND: mongo | memory
+USER_STORE_BACKEND = os.getenv("USER_STORE_BACKEND", "mongo")
+
+# MongoDB
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.getenv("MONGO_DB", "userdb")
+MONGO_USERS_COLLECTION = os.getenv("MONGO_USERS_COLLECTION", "users")
+MONGO_APP_NAME = os.getenv("MONGO_APP_NAME", "ms-usuarios")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+# 0 = sin timeout de socket
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))
+# primary | primaryPreferred | secondary | secondaryPreferred | nearest
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# Compresión de red por orden de preferencia (zstd/snappy necesitan zstandard y
+# python-snappy; los que no estén instalados se omiten). "" = sin compresión.
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy")
+MONGO_WARM_UP = os.getenv("MONGO_WARM_UP", "1") == "1"
+# Crea y verifica los índices (email único, etc.) al arrancar; con 0 solo se verifican.
+# Hasta verificarlos, las altas y cambios de email responden 503 / UNAVAILABLE.
+# Si Mongo no responde se reintenta con espera creciente hasta este máximo entre intentos
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1") == "1"
+MONGO_INDEX_RETRY_MAX_SECONDS = float(os.getenv("MONGO_INDEX_RETRY_MAX_SECONDS", "30"))
+
+# Servidor gRPC
+# GRPC_SERVER_MODE: thread (ThreadPoolExecutor) | aio (grpc.aio)
+GRPC_SERVER_MODE = os.getenv("GRPC_SERVER_MODE", "thread")
+GRPC_PORT = int(os.getenv("GRPC_PORT", "50051"))
+GRPC_MAX_WORKERS = int(os.getenv("GRPC_MAX_WORKERS", "10"))
+# 0 = sin límite
+GRPC_MAXIMUM_CONCURRENT_RPCS = int(os.getenv("GRPC_MAXIMUM_CONCURRENT_RPCS", "0")) or None
+# SO_REUSEPORT: varios procesos escuchan el mismo puerto y el kernel reparte las conexiones
+GRPC_REUSE_PORT = os.getenv("GRPC_REUSE_PORT", "1") == "1"
+# Presupuesto de una RPC sin deadline del cliente (0 = sin límite); con deadline se usa
+# context.time_remaining(). Se propaga a Mongo (maxTimeMS) y al pool de hash.
+GRPC_DEFAULT_TIMEOUT_SECONDS = float(os.getenv("GRPC_DEFAULT_TIMEOUT_SECONDS", "0"))
+# Presupuesto de cada petición HTTP (0 = sin límite); al agotarse, 504
+HTTP_REQUEST_TIMEOUT_SECONDS = float(os.getenv("HTTP_REQUEST_TIMEOUT_SECONDS", "10"))
+# Tiempo para terminar las peticiones en curso al recibir SIGTERM/SIGINT
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "10"))
+
+# Control de admisión (app.admission), común a gRPC y HTTP: concurrencia por clase
+# de endpoint (password: Login/Register/CreateUser..., read, stream) y rechazo
+# temprano (RESOURCE_EXHAUSTED / 503) cuando la espera por un hueco se alarga.
+# Por defecto, password admite el doble de peticiones que workers de hash;
+# en read y stream, 0 = sin límite.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_PASSWORD_CONCURRENCY = int(os.getenv("ADMISSION_PASSWORD_CONCURRENCY", "0")) or 2 * PASSWORD_HASH_WORKERS
+ADMISSION_READ_CONCURRENCY = int(os.getenv("ADMISSION_READ_CONCURRENCY", "64"))
+ADMISSION_STREAM_CONCURRENCY = int(os.getenv("ADMISSION_STREAM_CONCURRENCY", "8"))
+# Peticiones en espera por clase; con la cola llena se rechaza sin esperar
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "500"))
+# CoDel: si la espera supera el objetivo durante un intervalo entero, solo se
+# espera el objetivo (se rechaza pronto) hasta que la cola se vacíe
+ADMISSION_TARGET_QUEUE_MS = float(os.getenv("ADMISSION_TARGET_QUEUE_MS", "20"))
+ADMISSION_INTERVAL_MS = float(os.getenv("ADMISSION_INTERVAL_MS", "500"))
+
+# Lanzador multiproceso (app.launcher): N workers uvicorn y M procesos gRPC
+HTTP_ENABLED = os.getenv("HTTP_ENABLED", "1") == "1"
+HTTP_HOST = os.getenv("HTTP_HOST", "0.0.0.0")
+HTTP_PORT = int(os.getenv("HTTP_PORT", "8000"))
+HTTP_WORKERS = int(os.getenv("HTTP_WORKERS", "1"))
+GRPC_ENABLED = os.getenv("GRPC_ENABLED", "1") == "1"
+GRPC_PROCESSES = int(os.getenv("GRPC_PROCESSES", "1"))
+
+# Caché de perfiles de usuario (GET /users/me, GET /users/{id}, GetUser)
+# USER_CACHE_BACKEND: memory | none
+USER_CACHE_BACKEND = os.getenv("USER_CACHE_BACKEND", "memory")
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+# Con varios procesos (app.launcher) la caché "memory" no ve las invalidaciones de los
+# demás: su TTL se recorta a este valor, que es lo que puede durar un perfil obsoleto
+USER_CACHE_MULTIPROCESS_TTL_SECONDS = float(os.getenv("USER_CACHE_MULTIPROCESS_TTL_SECONDS", "5"))
+
+# Caché de JWT ya verificados (get_current_user); 0 desactiva la caché
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+TOKEN_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+
+# Firma de tokens (app.signing). Con JWT_KEYS_DIR (ficheros <kid>.pem, RSA o EC P-256)
+# se firma con RS256/ES256 y se publica /.well-known/jwks.json; sin él, HS256 con
+# JWT_SECRET_KEY. JWT_ACTIVE_KID vacío: firma la última clave privada por nombre.
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "tu_clave_secreta_muylarga")
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", "")
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", "300"))
+
+# Operaciones por lotes (BatchGetUsers/BatchCreateUsers/BatchDeleteUsers y /users/batch)
+USERS_MAX_BATCH_SIZE = int(os.getenv("USERS_MAX_BATCH_SIZE", "1000"))
+
+# Métricas (formato Prometheus en /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Puerto propio de /metrics para procesos sin FastAPI (servidor gRPC aislado); 0 = no
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Compresión de respuestas (app.compression)
+# gRPC: gzip | deflate | none, solo en las RPCs de listas y streams indicadas
+GRPC_COMPRESSION = os.getenv("GRPC_COMPRESSION", "gzip")
+GRPC_COMPRESSED_METHODS = tuple(
+    m for m in os.getenv("GRPC_COMPRESSED_METHODS", "ListUsers,StreamUsers,BatchGetUsers").split(",") if m
+)
+# gRPC comprime dentro de su núcleo en C: el ratio y el coste se estiman
+# recomprimiendo esta fracción de las respuestas
+GRPC_COMPRESSION_SAMPLE_RATE = float(os.getenv("GRPC_COMPRESSION_SAMPLE_RATE", "0.01"))
+# HTTP: codificaciones ofrecidas por orden de preferencia ("" = sin compresión);
+# solo cuerpos de al menos HTTP_COMPRESSION_MIN_BYTES (los streams, siempre)
+HTTP_COMPRESSION = os.getenv("HTTP_COMPRESSION", "gzip,deflate")
+HTTP_COMPRESSION_MIN_BYTES = int(os.getenv("HTTP_COMPRESSION_MIN_BYTES", "1024"))
+HTTP_COMPRESSION_LEVEL = int(os.getenv("HTTP_COMPRESSION_LEVEL", "6"))
+
+# Codificación JSON de las rutas calientes de la API HTTP
+# HTTP_JSON_ENCODER: orjson (si está instalado) | json
+HTTP_JSON_ENCODER = os.getenv("HTTP_JSON_ENCODER", "orjson")
+
+# Limitador de intentos de login (token bucket por email y por dirección de cliente).
+# Los límites son de cada proceso: con app.launcher, un cliente que reparte intentos
+# entre procesos (HTTP y gRPC, o varias conexiones) dispone de más en total.
+LOGIN_RATE_LIMIT_ENABLED = os.getenv("LOGIN_RATE_LIMIT_ENABLED", "1") == "1"
+# Ráfaga y recarga por minuto de cada cubo; una ráfaga de 0 desactiva ese cubo
+LOGIN_EMAIL_BURST = int(os.getenv("LOGIN_EMAIL_BURST", "5"))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", "10"))
+LOGIN_CLIENT_BURST = int(os.getenv("LOGIN_CLIENT_BURST", "30"))
+LOGIN_CLIENT_PER_MINUTE = float(os.getenv("LOGIN_CLIENT_PER_MINUTE", "120"))
+# Bloqueo del email tras N fallos seguidos dentro de la ventana; 0 = sin bloqueo
+LOGIN_LOCKOUT_FAILURES = int(os.getenv("LOGIN_LOCKOUT_FAILURES", "10"))
+LOGIN_LOCKOUT_SECONDS = float(os.getenv("LOGIN_LOCKOUT_SECONDS", "300"))
+# Claves activas (cubos y fallos) que se guardan como máximo (LRU)
+LOGIN_LIMITER_MAX_KEYS = int(os.getenv("LOGIN_LIMITER_MAX_KEYS", "100000"))
+# Bloqueos activos como máximo; van aparte para que el resto de claves no los desaloje
+LOGIN_LOCKOUT_MAX_KEYS = int(os.getenv("LOGIN_LOCKOUT_MAX_KEYS", "10000"))
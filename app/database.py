@@ -1,6 +1,206 @@
-from pymongo import MongoClient
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from pymongo import ASCENDING, AsyncMongoClient, IndexModel, MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+from app.config import (
+    MONGO_URI, MONGO_DB, MONGO_USERS_COLLECTION, MONGO_APP_NAME,
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_READ_PREFERENCE, MONGO_COMPRESSORS, MONGO_WARM_UP, MONGO_ENSURE_INDEXES,
+    MONGO_INDEX_RETRY_MAX_SECONDS, METRICS_ENABLED
+)
+from app.compression import mongo_compressors
+from app.instrumentation import MongoCommandListener
+
+logger = logging.getLogger(__name__)
+
+# Registro de clientes: un único MongoClient (y su pool) por proceso, compartido
+# por la app HTTP, el hilo gRPC y la CLI. El driver async se liga a un event
+# loop, así que hay un AsyncMongoClient por loop con la misma configuración.
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+# Índices de la colección de usuarios. El de email es único: el registro es un
+# solo insert_one y los duplicados llegan como DuplicateKeyError. Los de versión
+# cubren las comprobaciones de If-None-Match / if_version (store.get_version).
+USER_INDEXES = [
+    IndexModel([("email", ASCENDING)], name="email_1", unique=True),
+    IndexModel([("_id", ASCENDING), ("version", ASCENDING)], name="id_version"),
+    IndexModel([("email", ASCENDING), ("version", ASCENDING)], name="email_version"),
+]
+
+class IndexVerificationError(RuntimeError):
+    pass
+
+class IndexesNotReady(RuntimeError):
+    # Escrituras que dependen del índice único de email antes de verificarlo
+    def __init__(self, reason: str = ""):
+        super().__init__(f"Índices de usuarios sin verificar{': ' + reason if reason else ''}")
+        self.reason = reason
+
+# Se marca cuando los índices de USER_INDEXES están verificados; hasta entonces los
+# stores de Mongo rechazan las altas y los cambios de email (fail closed).
+# index_error guarda un fallo definitivo (p.ej. emails ya duplicados en la colección).
+indexes_ready = threading.Event()
+index_error = None
+
+def require_indexes():
+    if not indexes_ready.is_set():
+        raise IndexesNotReady(index_error or "")
+
+def client_options() -> dict:
+    options = {
+        "appname": MONGO_APP_NAME,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+    }
+    if MONGO_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = MONGO_SOCKET_TIMEOUT_MS
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    compressors = mongo_compressors(MONGO_COMPRESSORS)
+    if compressors:
+        options["compressors"] = compressors
+    if METRICS_ENABLED:
+        options["event_listeners"] = [MongoCommandListener()]
+    return options
+
+def get_client() -> MongoClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(MONGO_URI, **client_options())
+        return _client
 
 def get_db():
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["userdb"]
-    return db
\ No newline at end of file
+    return get_client()[MONGO_DB]
+
+def get_users_collection():
+    return get_db()[MONGO_USERS_COLLECTION]
+
+def get_async_client() -> AsyncMongoClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncMongoClient(MONGO_URI, **client_options())
+        _async_clients[loop] = client
+    return client
+
+def get_async_db():
+    return get_async_client()[MONGO_DB]
+
+def warm_up(client=None) -> bool:
+    # El primer ping selecciona servidor; a partir de ahí el pool abre minPoolSize conexiones
+    client = client or get_client()
+    try:
+        client.admin.command("ping")
+    except PyMongoError as exc:
+        logger.warning("No se pudo precalentar el pool de MongoDB: %s", exc)
+        return False
+    return True
+
+async def warm_up_async(client=None) -> bool:
+    client = client or get_async_client()
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as exc:
+        logger.warning("No se pudo precalentar el pool de MongoDB: %s", exc)
+        return False
+    return True
+
+def verify_indexes(index_information: dict):
+    for model in USER_INDEXES:
+        expected = model.document
+        found = index_information.get(expected["name"])
+        if (found is None
+                or list(found["key"]) != list(expected["key"].items())
+                or found.get("unique", False) != expected.get("unique", False)):
+            raise IndexVerificationError(
+                f"Índice {expected['name']} ausente o con otra definición: {found}"
+            )
+
+# create=False solo comprueba (MONGO_ENSURE_INDEXES=0: los índices los gestiona otro)
+def ensure_indexes(db=None, create=True):
+    collection = (db if db is not None else get_db())[MONGO_USERS_COLLECTION]
+    if create:
+        collection.create_indexes(USER_INDEXES)
+    verify_indexes(collection.index_information())
+    indexes_ready.set()
+
+async def ensure_indexes_async(db=None, create=True):
+    collection = (db if db is not None else get_async_db())[MONGO_USERS_COLLECTION]
+    if create:
+        await collection.create_indexes(USER_INDEXES)
+    verify_indexes(await collection.index_information())
+    indexes_ready.set()
+
+# Preparación al arranque: precalienta el pool y asegura los índices. El registro
+# depende del índice único de email para rechazar duplicados, así que no se da por
+# perdido: se reintenta hasta conseguirlo aunque Mongo tarde en estar disponible.
+# Si el índice no se puede crear porque ya hay emails repetidos, reintentar no sirve:
+# se registra como fallo definitivo y las altas siguen rechazadas.
+def _retry_delays(max_delay=MONGO_INDEX_RETRY_MAX_SECONDS):
+    delay = 1.0
+    while True:
+        yield delay
+        delay = min(delay * 2, max_delay)
+
+def _duplicates(exc) -> bool:
+    return isinstance(exc, OperationFailure) and exc.code in (11000, 11001)
+
+def _index_failure(exc, delay) -> bool:
+    # True si hay que dejar de reintentar
+    global index_error
+    if _duplicates(exc):
+        index_error = "hay emails duplicados en la colección; el índice único no se puede crear"
+        logger.critical("No se puede crear el índice único de email: %s. Las altas quedan "
+                        "rechazadas hasta eliminar los duplicados y reiniciar", exc)
+        return True
+    logger.error("No se pudieron asegurar los índices de usuarios (reintento en %.0fs): %s",
+                 delay, exc)
+    return False
+
+def prepare_database(sleep=time.sleep):
+    if MONGO_WARM_UP:
+        warm_up()
+    for delay in _retry_delays():
+        try:
+            ensure_indexes(create=MONGO_ENSURE_INDEXES)
+            return
+        except (PyMongoError, IndexVerificationError) as exc:
+            if _index_failure(exc, delay):
+                return
+        sleep(delay)
+
+async def prepare_database_async(sleep=asyncio.sleep):
+    if MONGO_WARM_UP:
+        await warm_up_async()
+    for delay in _retry_delays():
+        try:
+            await ensure_indexes_async(create=MONGO_ENSURE_INDEXES)
+            return
+        except (PyMongoError, IndexVerificationError) as exc:
+            if _index_failure(exc, delay):
+                return
+        await sleep(delay)
+
+def close_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+async def close_async_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
@@ -0,0 +1,63 @@
+import contextvars
+import time
+from contextlib import contextmanager
+import pymongo
+from pymongo.errors import PyMongoError
+from app.config import GRPC_DEFAULT_TIMEOUT_SECONDS
+
+# Presupuesto de tiempo de la petición en curso: en gRPC, context.time_remaining();
+# en HTTP, HTTP_REQUEST_TIMEOUT_SECONDS. Mongo lo recibe con pymongo.timeout()
+# (maxTimeMS y timeouts de socket) y el pool de hash no lanza bcrypt si ya venció.
+# Cuando se agota, la petición termina con DEADLINE_EXCEEDED o 504 en vez de
+# seguir gastando CPU y conexiones en una respuesta que nadie va a leer
+# (interceptores y middleware en app.instrumentation).
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    # stage: dónde se cortó (queue, hash, hash_queue, mongo; cancelled en grpc.aio)
+    def __init__(self, stage: str):
+        super().__init__(stage)
+        self.stage = stage
+
+def current():
+    # Instante límite en time.monotonic(), o None sin presupuesto
+    return _deadline.get()
+
+def remaining():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def check(stage: str):
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded(stage)
+
+@contextmanager
+def budget(seconds):
+    # None: sin límite. Anidados, gana el más corto (igual que pymongo.timeout)
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        # pymongo.timeout(0) significa "sin límite": el vencido lo corta check()
+        with pymongo.timeout(max(seconds, 0.001)):
+            yield
+    finally:
+        _deadline.reset(token)
+
+def exceeded_stage(exc):
+    # Etapa si la excepción es un corte por deadline, o None si es otro error
+    if isinstance(exc, DeadlineExceeded):
+        return exc.stage
+    if isinstance(exc, PyMongoError) and exc.timeout and _deadline.get() is not None:
+        return "mongo"
+    return None
+
+def grpc_budget(context):
+    remaining_seconds = context.time_remaining()
+    if remaining_seconds is None:
+        return GRPC_DEFAULT_TIMEOUT_SECONDS or None
+    return remaining_seconds
@@ -3,28 +3,33 @@ from concurrent import futures
 import time
 import sys
 import os
-from pymongo import MongoClient
-from bson import ObjectId
+from bson import ObjectId, errors as bson_errors
+from pymongo.errors import DuplicateKeyError
 
 # Añade el path para los módulos generados por protoc
 sys.path.append(os.path.join(os.path.dirname(__file__), 'proto'))
+# y la raíz del repo, para importar el paquete app al ejecutarlo como script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import user_pb2
 import user_pb2_grpc
-
-# Configuración de conexión a MongoDB
-MONGO_URI = "mongodb://localhost:27017/"
-MONGO_DB = "userdb"         # Usando tu base de datos
-MONGO_COLLECTION = "users"  # Usando tu colección
-
-mongo_client = MongoClient(MONGO_URI)
-db = mongo_client[MONGO_DB]
-users_collection = db[MONGO_COLLECTION]
+from app.database import IndexesNotReady
+from app.pagination import InvalidPageToken
+from app.store import get_user_store
 
 class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
+    def __init__(self, store=None):
+        # Mismo store que app.service (USER_STORE_BACKEND)
+        self.store = store if store is not None else get_user_store()
+
     def ListUsers(self, request, context):
+        try:
+            users_page, next_token = self.store.page(request.page_size, request.page_token)
+        except InvalidPageToken:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid page token')
+            return user_pb2.UserListResponse()
         users = []
-        users_cursor = users_collection.find()
-        for user in users_cursor:
+        for user in users_page:
             users.append(
                 user_pb2.UserResponse(
                     id=str(user.get("_id", "")),
@@ -32,7 +37,22 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
                     email=user.get("email", "")
                 )
             )
-        return user_pb2.UserListResponse(users=users)
+        return user_pb2.UserListResponse(users=users, next_page_token=next_token)
+
+    def StreamUsers(self, request, context):
+        try:
+            users_cursor = self.store.iterate(request.page_token)
+        except InvalidPageToken:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid page token')
+            return
+        with users_cursor:
+            for user in users_cursor:
+                yield user_pb2.UserResponse(
+                    id=str(user.get("_id", "")),
+                    username=user.get("username", ""),
+                    email=user.get("email", "")
+                )
 
     def CreateUser(self, request, context):
         user_data = {
@@ -40,18 +60,31 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
             "email": request.email,
             "password": request.password  # Recuerda: nunca almacenes passwords en texto plano en producción.
         }
-        result = users_collection.insert_one(user_data)
+        try:
+            user_id = self.store.insert(user_data)
+        except DuplicateKeyError:
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details('Email already registered')
+            return user_pb2.UserResponse()
+        except IndexesNotReady:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details('Service not ready, try again')
+            return user_pb2.UserResponse()
         return user_pb2.UserResponse(
-            id=str(result.inserted_id),
+            id=str(user_id),
             username=request.username,
             email=request.email
         )
 
     def GetUser(self, request, context):
+        # Solo se traduce el id mal formado; cualquier otro error llega como INTERNAL
         try:
-            user = users_collection.find_one({"_id": ObjectId(request.id)})
-        except Exception:
-            user = None
+            user_id = ObjectId(request.id)
+        except bson_errors.InvalidId:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid user id')
+            return user_pb2.UserResponse()
+        user = self.store.get_by_id(user_id)
         if user:
             return user_pb2.UserResponse(
                 id=str(user.get("_id", "")),
@@ -65,13 +98,25 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
 
     def UpdateUser(self, request, context):
         try:
-            result = users_collection.update_one(
-                {"_id": ObjectId(request.id)},
-                {"$set": {"username": request.username, "email": request.email}}
+            user_id = ObjectId(request.id)
+        except bson_errors.InvalidId:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid user id')
+            return user_pb2.UserResponse()
+        try:
+            user = self.store.update(
+                user_id,
+                {"username": request.username, "email": request.email}
             )
-        except Exception:
-            result = None
-        if result and result.matched_count:
+        except DuplicateKeyError:
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details('Email already registered')
+            return user_pb2.UserResponse()
+        except IndexesNotReady:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details('Service not ready, try again')
+            return user_pb2.UserResponse()
+        if user:
             return user_pb2.UserResponse(
                 id=request.id,
                 username=request.username,
@@ -84,9 +129,12 @@ class UserServiceServicer(user_pb2_grpc.UserServiceServicer):
 
     def DeleteUser(self, request, context):
         try:
-            result = users_collection.delete_one({"_id": ObjectId(request.id)})
-        except Exception:
-            result = None
+            user_id = ObjectId(request.id)
+        except bson_errors.InvalidId:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid user id')
+            return user_pb2.Empty()
+        self.store.delete(user_id)
         return user_pb2.Empty()
 
 def serve():
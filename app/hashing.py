@@ -0,0 +1,329 @@
+import asyncio
+import atexit
+import contextvars
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent import futures
+from pymongo.errors import PyMongoError
+from app import auth, deadline, metrics
+from app.config import (
+    PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE_SIZE, PASSWORD_HASH_START_METHOD, PASSWORD_REHASH_ON_LOGIN,
+    PASSWORD_REHASH_MAX_PENDING
+)
+
+logger = logging.getLogger(__name__)
+
+class HashingBusyError(RuntimeError):
+    pass
+
+# Se ejecuta en el worker: devuelve el resultado y el tiempo de CPU de bcrypt
+# (thread_time: solo el hilo que hace el hash, sin contar esperas ni otros hilos),
+# para separar en las métricas la espera en el pool del coste del hash.
+# deadline_at es time.monotonic(), común a todos los procesos de la máquina: un
+# trabajo que pasó su deadline esperando en la cola no llega a llamar a bcrypt.
+def _timed(deadline_at, fn, *args):
+    if deadline_at is not None and time.monotonic() >= deadline_at:
+        raise deadline.DeadlineExceeded("hash_queue")
+    start = time.thread_time()
+    result = fn(*args)
+    return result, time.thread_time() - start
+
+# Lotes: un trabajo por trozo de contraseñas, repartidos entre los workers
+def _hash_all(passwords):
+    return [auth.get_password_hash(password) for password in passwords]
+
+def _chunks(items, parts):
+    size = max(1, -(-len(items) // max(1, parts)))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+class PasswordHasher:
+    def __init__(self, kind=PASSWORD_HASH_EXECUTOR, workers=PASSWORD_HASH_WORKERS,
+                 queue_size=PASSWORD_HASH_QUEUE_SIZE,
+                 start_method=PASSWORD_HASH_START_METHOD):
+        if kind not in ("process", "thread", "inline"):
+            raise ValueError(f"Executor de hash desconocido: {kind}")
+        self.kind = kind
+        self.workers = workers
+        # Cola acotada: trabajos en ejecución + en espera
+        self.max_pending = workers + queue_size
+        self.start_method = start_method
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = futures.ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(self.start_method),
+                    )
+                else:
+                    self._executor = futures.ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="password-hash"
+                    )
+            return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args) -> futures.Future:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.PASSWORD_HASH_REJECTED.inc()
+                raise HashingBusyError("Cola de hash de contraseñas llena")
+            self._pending += 1
+        if self.kind == "inline":
+            future = futures.Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+            finally:
+                self._release()
+            return future
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _submit_timed(self, fn, *args):
+        deadline.check("hash")
+        return time.perf_counter(), self.submit(_timed, deadline.current(), fn, *args)
+
+    @staticmethod
+    def _result(future):
+        # Sin presupuesto, remaining() es None y se espera sin límite
+        try:
+            return future.result(timeout=deadline.remaining())
+        except futures.TimeoutError:
+            future.cancel()
+            raise deadline.DeadlineExceeded("hash")
+
+    @staticmethod
+    async def _result_async(future):
+        remaining = deadline.remaining()
+        if remaining is None:
+            return await asyncio.wrap_future(future)
+        try:
+            # Al vencer, wait_for cancela el futuro: si aún estaba en cola, no se ejecuta
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(remaining, 0))
+        except asyncio.TimeoutError:
+            raise deadline.DeadlineExceeded("hash")
+
+    @staticmethod
+    def _observe(operation, started, cpu_seconds):
+        metrics.PASSWORD_HASH_LATENCY.observe(time.perf_counter() - started, operation=operation)
+        metrics.PASSWORD_HASH_CPU.observe(cpu_seconds, operation=operation)
+
+    def _run(self, operation, fn, *args):
+        started, future = self._submit_timed(fn, *args)
+        result, cpu_seconds = self._result(future)
+        self._observe(operation, started, cpu_seconds)
+        return result
+
+    async def _run_async(self, operation, fn, *args):
+        started, future = self._submit_timed(fn, *args)
+        result, cpu_seconds = await self._result_async(future)
+        self._observe(operation, started, cpu_seconds)
+        return result
+
+    def hash(self, password: str) -> str:
+        return self._run("hash", auth.get_password_hash, password)
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._run("verify", auth.verify_password, plain_password, hashed_password)
+
+    async def hash_async(self, password: str) -> str:
+        return await self._run_async("hash", auth.get_password_hash, password)
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run_async(
+            "verify", auth.verify_password, plain_password, hashed_password
+        )
+
+    def hash_many(self, passwords) -> list:
+        pending = [
+            self._submit_timed(_hash_all, chunk)
+            for chunk in _chunks(list(passwords), self.workers)
+        ]
+        hashes = []
+        for started, future in pending:
+            chunk, cpu_seconds = self._result(future)
+            self._observe("hash_many", started, cpu_seconds)
+            hashes.extend(chunk)
+        return hashes
+
+    async def hash_many_async(self, passwords) -> list:
+        return [
+            hashed
+            for chunk in await asyncio.gather(*(
+                self._run_async("hash_many", _hash_all, chunk)
+                for chunk in _chunks(list(passwords), self.workers)
+            ))
+            for hashed in chunk
+        ]
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+def get_hasher() -> PasswordHasher:
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = PasswordHasher()
+        return _hasher
+
+def configure(**kwargs) -> PasswordHasher:
+    global _hasher
+    with _hasher_lock:
+        old, _hasher = _hasher, PasswordHasher(**kwargs)
+    if old is not None:
+        old.shutdown(wait=False)
+    return _hasher
+
+def shutdown(wait: bool = True):
+    global _hasher
+    with _hasher_lock:
+        old, _hasher = _hasher, None
+    if old is not None:
+        old.shutdown(wait=wait)
+
+atexit.register(shutdown)
+metrics.PASSWORD_HASH_PENDING.set_function(lambda: _hasher.pending if _hasher is not None else 0)
+
+# Mismas firmas que app.auth, pero ejecutadas en el pool de hash
+def get_password_hash(password):
+    return get_hasher().hash(password)
+
+def verify_password(plain_password, hashed_password):
+    return get_hasher().verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await get_hasher().hash_async(password)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await get_hasher().verify_async(plain_password, hashed_password)
+
+def get_password_hashes(passwords):
+    return get_hasher().hash_many(passwords)
+
+async def get_password_hashes_async(passwords):
+    return await get_hasher().hash_many_async(passwords)
+
+# ---------- Rehash al hacer login ----------
+# Tras verificar la contraseña, si el hash guardado usa otro esquema o coste que
+# la política actual, se recalcula y se guarda sin retrasar la respuesta.
+# replace_password solo escribe si el hash no ha cambiado entretanto.
+# Como mucho un rehash pendiente por email y PASSWORD_REHASH_MAX_PENDING en total:
+# el resto se descarta (el siguiente login lo vuelve a intentar).
+_rehash_executor = None
+_rehash_lock = threading.Lock()
+_rehash_tasks = set()
+_rehash_pending = set()
+
+def needs_rehash(hashed_password) -> bool:
+    if not PASSWORD_REHASH_ON_LOGIN:
+        return False
+    try:
+        return auth.pwd_context.needs_update(hashed_password)
+    except ValueError:
+        # Hash que el contexto no reconoce: no hay nada que migrar
+        return False
+
+def _claim_rehash(email) -> bool:
+    with _rehash_lock:
+        if email in _rehash_pending or len(_rehash_pending) >= PASSWORD_REHASH_MAX_PENDING:
+            metrics.PASSWORD_REHASHES.inc(result="skipped")
+            return False
+        _rehash_pending.add(email)
+        return True
+
+def _release_rehash(email):
+    with _rehash_lock:
+        _rehash_pending.discard(email)
+
+def _rehash_result(replaced):
+    result = "replaced" if replaced else "stale"
+    metrics.PASSWORD_REHASHES.inc(result=result)
+    return replaced
+
+def _rehash_failed(email, exc):
+    metrics.PASSWORD_REHASHES.inc(result="error")
+    logger.warning("No se pudo actualizar el hash de %s: %s", email, exc)
+    return False
+
+def rehash_password(store, email, password, old_hash) -> bool:
+    try:
+        new_hash = get_password_hash(password)
+        return _rehash_result(store.replace_password(email, old_hash, new_hash))
+    except (HashingBusyError, PyMongoError) as exc:
+        return _rehash_failed(email, exc)
+
+def _rehash_claimed(store, email, password, old_hash) -> bool:
+    try:
+        return rehash_password(store, email, password, old_hash)
+    finally:
+        _release_rehash(email)
+
+async def _rehash_password_async(store, email, password, old_hash) -> bool:
+    try:
+        new_hash = await get_password_hash_async(password)
+        return _rehash_result(await store.replace_password(email, old_hash, new_hash))
+    except (HashingBusyError, PyMongoError) as exc:
+        return _rehash_failed(email, exc)
+    finally:
+        _release_rehash(email)
+
+def _start_rehash_task(store, email, password, old_hash):
+    # En un contexto vacío: no hereda el presupuesto de la petición que lo lanzó
+    return contextvars.Context().run(
+        asyncio.get_running_loop().create_task,
+        _rehash_password_async(store, email, password, old_hash),
+    )
+
+async def rehash_password_async(store, email, password, old_hash) -> bool:
+    if not _claim_rehash(email):
+        return False
+    return await _start_rehash_task(store, email, password, old_hash)
+
+def rehash_in_background(store, email, password, old_hash) -> futures.Future:
+    # Servidor gRPC con hilos: un solo hilo basta, el hash va al pool igualmente
+    global _rehash_executor
+    if not _claim_rehash(email):
+        skipped = futures.Future()
+        skipped.set_result(False)
+        return skipped
+    with _rehash_lock:
+        if _rehash_executor is None:
+            _rehash_executor = futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="password-rehash"
+            )
+        return _rehash_executor.submit(_rehash_claimed, store, email, password, old_hash)
+
+def schedule_rehash(store, email, password, old_hash):
+    # grpc.aio: se guarda la referencia para que la tarea no se recoja a medias
+    if not _claim_rehash(email):
+        return None
+    task = _start_rehash_task(store, email, password, old_hash)
+    _rehash_tasks.add(task)
+    task.add_done_callback(_rehash_tasks.discard)
+    return task
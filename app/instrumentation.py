@@ -0,0 +1,496 @@
+import asyncio
+import threading
+import time
+from concurrent import futures
+import grpc
+from fastapi.responses import JSONResponse
+from pymongo import monitoring
+from starlette.datastructures import Headers, MutableHeaders
+from app import compression, deadline, metrics
+from app.admission import AdmissionRejected, get_admission_controller, http_class, rpc_class
+from app.config import (
+    HTTP_REQUEST_TIMEOUT_SECONDS, GRPC_COMPRESSION, GRPC_COMPRESSED_METHODS,
+    GRPC_COMPRESSION_SAMPLE_RATE, HTTP_COMPRESSION, HTTP_COMPRESSION_MIN_BYTES,
+    HTTP_COMPRESSION_LEVEL
+)
+
+def _method_name(handler_call_details) -> str:
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+def _status_name(context, failed: bool) -> str:
+    code = context.code() if hasattr(context, "code") else None
+    if code is None:
+        return "UNKNOWN" if failed else "OK"
+    return code.name if isinstance(code, grpc.StatusCode) else str(code)
+
+def _record_rpc(method, context, start, failed):
+    metrics.GRPC_LATENCY.observe(time.perf_counter() - start, method=method)
+    metrics.GRPC_HANDLED.inc(method=method, code=_status_name(context, failed))
+
+def _rebuild(handler, unary_unary=None, unary_stream=None):
+    if unary_unary is not None:
+        return grpc.unary_unary_rpc_method_handler(
+            unary_unary,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+    return grpc.unary_stream_rpc_method_handler(
+        unary_stream,
+        request_deserializer=handler.request_deserializer,
+        response_serializer=handler.response_serializer,
+    )
+
+class QueueCountingExecutor(futures.ThreadPoolExecutor):
+    # Pool del servidor gRPC con hilos: cuenta los trabajos enviados que aún no
+    # tienen hilo. Se cuenta aquí y no en un interceptor porque gRPC descarta sin
+    # llamar al handler las RPCs canceladas antes de llegar a un hilo.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._queued = 0
+        self._queued_lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def _dequeue(self):
+        with self._queued_lock:
+            self._queued -= 1
+
+    def submit(self, fn, /, *args, **kwargs):
+        def run():
+            self._dequeue()
+            return fn(*args, **kwargs)
+
+        with self._queued_lock:
+            self._queued += 1
+        try:
+            return super().submit(run)
+        except BaseException:
+            self._dequeue()
+            raise
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    # Latencia y código de estado por RPC para el servidor con hilos
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+        if handler.unary_unary is not None:
+            inner = handler.unary_unary
+
+            def unary_unary(request, context):
+                start = time.perf_counter()
+                failed = True
+                try:
+                    response = inner(request, context)
+                    failed = False
+                    return response
+                finally:
+                    _record_rpc(method, context, start, failed)
+            return _rebuild(handler, unary_unary=unary_unary)
+        if handler.unary_stream is not None:
+            inner_stream = handler.unary_stream
+
+            def unary_stream(request, context):
+                start = time.perf_counter()
+                failed = True
+                try:
+                    yield from inner_stream(request, context)
+                    failed = False
+                finally:
+                    _record_rpc(method, context, start, failed)
+            return _rebuild(handler, unary_stream=unary_stream)
+        return handler
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    # Igual que MetricsInterceptor, para grpc.aio
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+        if handler.unary_unary is not None:
+            inner = handler.unary_unary
+
+            async def unary_unary(request, context):
+                start = time.perf_counter()
+                failed = True
+                try:
+                    response = await inner(request, context)
+                    failed = False
+                    return response
+                finally:
+                    _record_rpc(method, context, start, failed)
+            return _rebuild(handler, unary_unary=unary_unary)
+        if handler.unary_stream is not None:
+            inner_stream = handler.unary_stream
+
+            async def unary_stream(request, context):
+                start = time.perf_counter()
+                failed = True
+                try:
+                    async for response in inner_stream(request, context):
+                        yield response
+                    failed = False
+                finally:
+                    _record_rpc(method, context, start, failed)
+            return _rebuild(handler, unary_stream=unary_stream)
+        return handler
+
+class MetricsMiddleware:
+    # Middleware ASGI puro (sin BaseHTTPMiddleware) para no añadir coste por petición
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - start, route=path, method=method)
+            metrics.HTTP_REQUESTS.inc(route=path, method=method, status=status[0])
+
+# ---------- Deadlines (app.deadline) ----------
+DEADLINE_DETAILS = "Tiempo de la petición agotado"
+# Exportación en streaming: dura lo que dure la colección, no tiene presupuesto
+DEADLINE_EXEMPT_PATHS = ("/users/export", "/metrics")
+
+class DeadlineInterceptor(grpc.ServerInterceptor):
+    # Solo RPCs unarias: un stream se corta cuando el cliente cancela
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+        inner = handler.unary_unary
+
+        def unary_unary(request, context):
+            with deadline.budget(deadline.grpc_budget(context)):
+                try:
+                    # Si esperó en la cola del pool más que su deadline, ni se empieza
+                    deadline.check("queue")
+                    return inner(request, context)
+                except Exception as exc:
+                    stage = deadline.exceeded_stage(exc)
+                    if stage is None:
+                        raise
+            metrics.DEADLINE_EXCEEDED.inc(stage=stage)
+            context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, DEADLINE_DETAILS)
+        return _rebuild(handler, unary_unary=unary_unary)
+
+class AsyncDeadlineInterceptor(grpc.aio.ServerInterceptor):
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+        inner = handler.unary_unary
+
+        async def unary_unary(request, context):
+            with deadline.budget(deadline.grpc_budget(context)):
+                try:
+                    deadline.check("queue")
+                    return await inner(request, context)
+                except asyncio.CancelledError:
+                    # grpc.aio cancela la tarea cuando vence la deadline del cliente
+                    metrics.DEADLINE_EXCEEDED.inc(stage="cancelled")
+                    raise
+                except Exception as exc:
+                    stage = deadline.exceeded_stage(exc)
+                    if stage is None:
+                        raise
+            metrics.DEADLINE_EXCEEDED.inc(stage=stage)
+            await context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, DEADLINE_DETAILS)
+        return _rebuild(handler, unary_unary=unary_unary)
+
+class DeadlineMiddleware:
+    # Middleware ASGI puro, como MetricsMiddleware; 0 desactiva el presupuesto HTTP
+    def __init__(self, app, timeout=HTTP_REQUEST_TIMEOUT_SECONDS, exempt=DEADLINE_EXEMPT_PATHS):
+        self.app = app
+        self.timeout = timeout
+        self.exempt = exempt
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.timeout or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+        started = [False]
+
+        async def send_with_state(message):
+            if message["type"] == "http.response.start":
+                started[0] = True
+            await send(message)
+
+        with deadline.budget(self.timeout):
+            try:
+                await self.app(scope, receive, send_with_state)
+                return
+            except Exception as exc:
+                stage = deadline.exceeded_stage(exc)
+                if stage is None or started[0]:
+                    raise
+        metrics.DEADLINE_EXCEEDED.inc(stage=stage)
+        response = JSONResponse(status_code=504, content={"detail": DEADLINE_DETAILS})
+        await response(scope, receive, send)
+
+# ---------- Control de admisión (app.admission) ----------
+ADMISSION_DETAILS = "Servidor ocupado, intente de nuevo"
+
+def _rpc_limiter(handler_call_details):
+    return get_admission_controller().get(rpc_class(_method_name(handler_call_details)))
+
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    # Va dentro del de deadline: la espera en cola no pasa de lo que queda de deadline
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        limiter = _rpc_limiter(handler_call_details) if handler is not None else None
+        if limiter is None:
+            return handler
+        if handler.unary_unary is not None:
+            inner = handler.unary_unary
+
+            def unary_unary(request, context):
+                try:
+                    limiter.acquire()
+                except AdmissionRejected:
+                    context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, ADMISSION_DETAILS)
+                try:
+                    return inner(request, context)
+                finally:
+                    limiter.release()
+            return _rebuild(handler, unary_unary=unary_unary)
+        if handler.unary_stream is not None:
+            inner_stream = handler.unary_stream
+
+            def unary_stream(request, context):
+                try:
+                    limiter.acquire()
+                except AdmissionRejected:
+                    context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, ADMISSION_DETAILS)
+                # El hueco se ocupa hasta que termina el stream (o el cliente lo cancela)
+                try:
+                    yield from inner_stream(request, context)
+                finally:
+                    limiter.release()
+            return _rebuild(handler, unary_stream=unary_stream)
+        return handler
+
+class AsyncAdmissionInterceptor(grpc.aio.ServerInterceptor):
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        limiter = _rpc_limiter(handler_call_details) if handler is not None else None
+        if limiter is None:
+            return handler
+        if handler.unary_unary is not None:
+            inner = handler.unary_unary
+
+            async def unary_unary(request, context):
+                try:
+                    await limiter.acquire_async()
+                except AdmissionRejected:
+                    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, ADMISSION_DETAILS)
+                try:
+                    return await inner(request, context)
+                finally:
+                    limiter.release()
+            return _rebuild(handler, unary_unary=unary_unary)
+        if handler.unary_stream is not None:
+            inner_stream = handler.unary_stream
+
+            async def unary_stream(request, context):
+                try:
+                    await limiter.acquire_async()
+                except AdmissionRejected:
+                    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, ADMISSION_DETAILS)
+                try:
+                    async for response in inner_stream(request, context):
+                        yield response
+                finally:
+                    limiter.release()
+            return _rebuild(handler, unary_stream=unary_stream)
+        return handler
+
+class AdmissionMiddleware:
+    # Dentro de DeadlineMiddleware, por lo mismo que AdmissionInterceptor
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limiter = None
+        if scope["type"] == "http":
+            limiter = get_admission_controller().get(http_class(scope["method"], scope["path"]))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await limiter.acquire_async()
+        except AdmissionRejected:
+            response = JSONResponse(status_code=503, content={"detail": ADMISSION_DETAILS},
+                                    headers={"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+# ---------- Compresión de respuestas (app.compression) ----------
+class _CompressionInterceptorBase:
+    def __init__(self, algorithm=GRPC_COMPRESSION, methods=GRPC_COMPRESSED_METHODS,
+                 sample_rate=GRPC_COMPRESSION_SAMPLE_RATE):
+        self.encoding = algorithm
+        self.compression = compression.grpc_algorithm(algorithm)
+        self.methods = set(methods)
+        self.sample_rate = sample_rate
+
+    def _method(self, handler, handler_call_details):
+        # Nombre de la RPC si hay que comprimirla, o None
+        if handler is None or self.compression is None:
+            return None
+        method = _method_name(handler_call_details)
+        return method if method in self.methods else None
+
+class CompressionInterceptor(_CompressionInterceptorBase, grpc.ServerInterceptor):
+    # Compresión por llamada: solo las RPCs de listas y streams, el resto va sin comprimir
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        method = self._method(handler, handler_call_details)
+        if method is None:
+            return handler
+        if handler.unary_unary is not None:
+            inner = handler.unary_unary
+
+            def unary_unary(request, context):
+                context.set_compression(self.compression)
+                response = inner(request, context)
+                compression.sample(method, self.encoding, response, self.sample_rate)
+                return response
+            return _rebuild(handler, unary_unary=unary_unary)
+        if handler.unary_stream is not None:
+            inner_stream = handler.unary_stream
+
+            def unary_stream(request, context):
+                context.set_compression(self.compression)
+                for response in inner_stream(request, context):
+                    compression.sample(method, self.encoding, response, self.sample_rate)
+                    yield response
+            return _rebuild(handler, unary_stream=unary_stream)
+        return handler
+
+class AsyncCompressionInterceptor(_CompressionInterceptorBase, grpc.aio.ServerInterceptor):
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        method = self._method(handler, handler_call_details)
+        if method is None:
+            return handler
+        if handler.unary_unary is not None:
+            inner = handler.unary_unary
+
+            async def unary_unary(request, context):
+                context.set_compression(self.compression)
+                response = await inner(request, context)
+                compression.sample(method, self.encoding, response, self.sample_rate)
+                return response
+            return _rebuild(handler, unary_unary=unary_unary)
+        if handler.unary_stream is not None:
+            inner_stream = handler.unary_stream
+
+            async def unary_stream(request, context):
+                context.set_compression(self.compression)
+                async for response in inner_stream(request, context):
+                    compression.sample(method, self.encoding, response, self.sample_rate)
+                    yield response
+            return _rebuild(handler, unary_stream=unary_stream)
+        return handler
+
+class CompressionMiddleware:
+    # Middleware ASGI puro. Comprime los cuerpos de al menos minimum_size bytes y los
+    # streams (StreamingResponse, /users/export) trozo a trozo; lo demás pasa tal cual.
+    def __init__(self, app, encodings=HTTP_COMPRESSION, minimum_size=HTTP_COMPRESSION_MIN_BYTES,
+                 level=HTTP_COMPRESSION_LEVEL):
+        self.app = app
+        self.encodings = tuple(e.strip() for e in encodings.split(",") if e.strip())
+        unknown = set(self.encodings) - set(compression.WBITS)
+        if unknown:
+            raise ValueError(f"Compresión HTTP desconocida: {', '.join(sorted(unknown))}")
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http" and self.encodings:
+            accept = Headers(scope=scope).get("accept-encoding", "")
+            encoding = compression.negotiate(accept, self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        # start: cabecera retenida hasta ver el primer trozo del cuerpo;
+        # compressor: None si se decidió no comprimir
+        state = {"start": None, "compressor": None}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            start, state["start"] = state["start"], None
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if ("content-encoding" in headers or start["status"] in (204, 304)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    await send(start)
+                    await send(message)
+                    return
+                state["compressor"] = compression.StreamCompressor(encoding, self.level)
+                del headers["content-length"]
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                # La representación comprimida ya no es byte a byte la del ETag fuerte
+                tag = headers.get("etag")
+                if tag and not tag.startswith("W/"):
+                    headers["etag"] = "W/" + tag
+                compressed = state["compressor"].compress(body, final=not more_body)
+                if not more_body:
+                    headers["content-length"] = str(len(compressed))
+                await send(start)
+            elif state["compressor"] is None:
+                await send(message)
+                return
+            else:
+                compressed = state["compressor"].compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            if not more_body:
+                route = getattr(scope.get("route"), "path", "unmatched")
+                state["compressor"].record("http", route)
+
+        await self.app(scope, receive, send_compressed)
+
+class MongoCommandListener(monitoring.CommandListener):
+    # Se registra en el cliente vía event_listeners (ver app.database.client_options)
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name)
+        metrics.MONGO_COMMANDS.inc(command=event.command_name, status="ok")
+
+    def failed(self, event):
+        metrics.MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name)
+        metrics.MONGO_COMMANDS.inc(command=event.command_name, status="error")
@@ -0,0 +1,206 @@
+# Arranca la API HTTP y el servidor gRPC en procesos separados, cada uno con su
+# intérprete y su GIL:
+#   python -m app.launcher [--http-workers 4] [--grpc-processes 2] [--no-http | --no-grpc]
+# Los workers uvicorn comparten un socket que abre el supervisor; los procesos gRPC
+# escuchan el mismo puerto con SO_REUSEPORT y el kernel reparte las conexiones.
+# Un proceso que muere se relanza (con espera creciente si muere nada más arrancar).
+# SIGTERM/SIGINT se reenvía a los hijos, que terminan lo que tienen en curso.
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from multiprocessing.connection import wait
+from app.cache import LOCAL_BACKENDS
+from app.config import (
+    HTTP_ENABLED, HTTP_HOST, HTTP_PORT, HTTP_WORKERS, GRPC_ENABLED, GRPC_PROCESSES,
+    GRPC_PORT, GRPC_REUSE_PORT, SHUTDOWN_GRACE_SECONDS, METRICS_PORT, USER_STORE_BACKEND,
+    USER_CACHE_BACKEND, USER_CACHE_TTL_SECONDS, USER_CACHE_NEGATIVE_TTL_SECONDS,
+    USER_CACHE_MULTIPROCESS_TTL_SECONDS
+)
+
+# Un proceso que aguanta más que esto se considera estable y reinicia el backoff
+STABLE_SECONDS = 10.0
+MAX_RESTART_DELAY = 30.0
+
+def _child(target, args):
+    # Grupo de procesos propio: el Ctrl+C de la terminal solo llega al supervisor,
+    # que es quien decide cómo parar a los hijos
+    os.setpgrp()
+    try:
+        target(*args)
+    finally:
+        # En los hijos de multiprocessing no corren los atexit: sin esto el proceso
+        # se queda esperando a los workers del pool de hash al salir
+        from app import hashing
+        hashing.shutdown()
+
+def run_http(sock, grace):
+    import uvicorn
+    from app.main import app
+    config = uvicorn.Config(app, timeout_graceful_shutdown=grace)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def run_grpc(port, grace, reuse_port, metrics_port):
+    from app.service import serve
+    serve(port=port, reuse_port=reuse_port, grace=grace, metrics_port=metrics_port)
+
+def bind_socket(host, port) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+class Worker:
+    def __init__(self, name, target, args=()):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.started = 0.0
+        self.failures = 0
+        self.restart_at = 0.0
+
+class Supervisor:
+    def __init__(self, workers, grace=SHUTDOWN_GRACE_SECONDS, context=None,
+                 clock=time.monotonic, out=sys.stdout):
+        self.workers = workers
+        self.grace = grace
+        # spawn: los hijos no heredan hilos ni clientes de Mongo del supervisor
+        self.context = context or multiprocessing.get_context("spawn")
+        self.clock = clock
+        self.out = out
+        self.stopping = False
+        self.restarts = 0
+
+    def _log(self, message):
+        print(f"[launcher] {message}", file=self.out, flush=True)
+
+    def start(self, worker):
+        worker.process = self.context.Process(
+            target=_child, args=(worker.target, worker.args), name=worker.name
+        )
+        worker.process.start()
+        worker.started = self.clock()
+        self._log(f"{worker.name} arrancado (pid {worker.process.pid})")
+
+    def start_all(self):
+        for worker in self.workers:
+            self.start(worker)
+
+    def poll(self, timeout=0.5):
+        # Espera a que muera algún hijo (o timeout) y relanza los que toque
+        running = [w.process.sentinel for w in self.workers if w.process is not None]
+        if running:
+            wait(running, timeout)
+        else:
+            time.sleep(timeout)
+        now = self.clock()
+        for worker in self.workers:
+            process = worker.process
+            if process is not None and not process.is_alive():
+                process.join()
+                stable = now - worker.started >= STABLE_SECONDS
+                worker.failures = 0 if stable else worker.failures + 1
+                delay = min(MAX_RESTART_DELAY, 2 ** (worker.failures - 1)) if worker.failures else 0
+                worker.process = None
+                worker.restart_at = now + delay
+                self._log(f"{worker.name} terminó con código {process.exitcode}; "
+                          f"se relanza en {delay:.0f}s")
+            if worker.process is None and not self.stopping and now >= worker.restart_at:
+                self.restarts += 1
+                self.start(worker)
+
+    def stop(self):
+        self.stopping = True
+        alive = [w.process for w in self.workers if w.process is not None and w.process.is_alive()]
+        for process in alive:
+            process.terminate()
+        # Margen sobre `grace` para que los hijos cierren Mongo y el pool de hash
+        deadline = self.clock() + self.grace + 5
+        for process in alive:
+            process.join(max(0.0, deadline - self.clock()))
+        for process in alive:
+            if process.is_alive():
+                self._log(f"{process.name} no terminó a tiempo; se mata")
+                process.kill()
+                process.join()
+
+    def run(self):
+        def request_stop(*_):
+            self.stopping = True
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, request_stop)
+        self.start_all()
+        while not self.stopping:
+            self.poll()
+        self._log("parando...")
+        self.stop()
+
+def build_workers(http_workers, grpc_processes, host=HTTP_HOST, http_port=HTTP_PORT,
+                  grpc_port=GRPC_PORT, grace=SHUTDOWN_GRACE_SECONDS, metrics_port=METRICS_PORT,
+                  reuse_port=GRPC_REUSE_PORT):
+    workers = []
+    if http_workers:
+        sock = bind_socket(host, http_port)
+        workers += [Worker(f"http-{i}", run_http, (sock, grace)) for i in range(http_workers)]
+    for i in range(grpc_processes):
+        # Cada proceso gRPC expone sus métricas en su propio puerto
+        port = metrics_port + i if metrics_port else 0
+        workers.append(Worker(f"grpc-{i}", run_grpc, (grpc_port, grace, reuse_port, port)))
+    return workers
+
+def child_environment(total, environ=os.environ) -> dict:
+    # Variables que se fijan antes de lanzar los hijos (spawn: las leen al importar
+    # app.config). Los límites de login no se tocan: son de cada proceso.
+    env = {}
+    # Los procesos de hash se reparten entre los servidores en vez de multiplicarse
+    if "PASSWORD_HASH_WORKERS" not in environ:
+        env["PASSWORD_HASH_WORKERS"] = str(max(1, (os.cpu_count() or 1) // total))
+    # Una caché local por proceso no ve las invalidaciones de los demás: se mantiene,
+    # pero un perfil (o un 304) obsoleto dura como mucho el TTL recortado
+    if total > 1 and USER_CACHE_BACKEND in LOCAL_BACKENDS:
+        ttl = USER_CACHE_MULTIPROCESS_TTL_SECONDS
+        if USER_CACHE_TTL_SECONDS > ttl:
+            env["USER_CACHE_TTL_SECONDS"] = str(ttl)
+        if USER_CACHE_NEGATIVE_TTL_SECONDS > ttl:
+            env["USER_CACHE_NEGATIVE_TTL_SECONDS"] = str(ttl)
+    return env
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.launcher")
+    parser.add_argument("--http-workers", type=int, default=HTTP_WORKERS)
+    parser.add_argument("--grpc-processes", type=int, default=GRPC_PROCESSES)
+    parser.add_argument("--no-http", action="store_true", default=not HTTP_ENABLED)
+    parser.add_argument("--no-grpc", action="store_true", default=not GRPC_ENABLED)
+    parser.add_argument("--grace", type=float, default=SHUTDOWN_GRACE_SECONDS)
+    args = parser.parse_args(argv)
+
+    http_workers = 0 if args.no_http else max(0, args.http_workers)
+    grpc_processes = 0 if args.no_grpc else max(0, args.grpc_processes)
+    total = http_workers + grpc_processes
+    if not total:
+        print("Nada que arrancar: HTTP y gRPC desactivados", file=sys.stderr)
+        return 2
+    env = child_environment(total)
+    os.environ.update(env)
+    if "USER_CACHE_TTL_SECONDS" in env:
+        print(f"Aviso: {total} procesos con caché de usuarios local; las invalidaciones no "
+              f"cruzan procesos y el TTL se recorta a {env['USER_CACHE_TTL_SECONDS']}s "
+              f"(USER_CACHE_MULTIPROCESS_TTL_SECONDS)", file=sys.stderr)
+    if USER_STORE_BACKEND == "memory" and total > 1:
+        print("Aviso: con USER_STORE_BACKEND=memory cada proceso tiene sus propios usuarios",
+              file=sys.stderr)
+    if grpc_processes > 1 and not GRPC_REUSE_PORT:
+        print("Aviso: sin GRPC_REUSE_PORT solo un proceso gRPC podrá abrir el puerto",
+              file=sys.stderr)
+    Supervisor(build_workers(http_workers, grpc_processes, grace=args.grace),
+               grace=args.grace).run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,151 @@
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+import math
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Dict, List, Optional
 from pydantic import BaseModel
-from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from bson import ObjectId
-from app.auth import (
-    get_password_hash, verify_password, create_access_token,
-    get_current_user
+from app import hashing, metrics
+from app.auth import create_access_token_async, get_current_user
+from app.batch import (
+    BatchTooLarge, check_batch_size, parse_ids, order_by_request,
+    split_new_users, build_documents, insert_outcomes
 )
+from app.cache import find_user_async, find_users_async, find_version_async, get_user_cache
+from app.config import (
+    JWKS_MAX_AGE_SECONDS, METRICS_ENABLED, USERS_CURSOR_BATCH_SIZE, USERS_DEFAULT_PAGE_SIZE
+)
+from app.database import IndexesNotReady, close_async_client
+from app.instrumentation import (
+    AdmissionMiddleware, CompressionMiddleware, DeadlineMiddleware, MetricsMiddleware
+)
+from app.hashing import (
+    HashingBusyError, get_password_hash_async, get_password_hashes_async,
+    verify_password_async, needs_rehash, rehash_password_async
+)
+from app.pagination import InvalidPageToken
+from app.projections import AUTH_PROJECTION, PROFILE_PROJECTION
+from app.ratelimit import LoginThrottled, get_login_limiter
+from app.responses import (
+    FastJSONResponse, etag, etag_matches, ndjson, user_etag, user_serializer
+)
+from app.signing import get_signer
+from app.store import get_async_user_store
 from fastapi.security import OAuth2PasswordRequestForm
-import threading
-from app.service import serve as grpc_serve
 
-app = FastAPI()
-client = MongoClient("mongodb://localhost:27017/")
-db = client["userdb"]
-users_collection = db["users"]
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Store async del registro; con Mongo, su cliente queda ligado al event loop de uvicorn
+    app.state.user_store = get_async_user_store()
+    # Precalentamiento e índices en segundo plano: no bloquean el arranque si Mongo tarda
+    prepare = asyncio.create_task(app.state.user_store.prepare())
+    try:
+        yield
+    finally:
+        prepare.cancel()
+        await close_async_client()
+        hashing.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
+# add_middleware envuelve lo anterior: el de métricas queda fuera y ve los 503/504,
+# y la admisión dentro de la deadline para no esperar más de lo que queda
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(DeadlineMiddleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+async def get_user_store(request: Request):
+    return request.app.state.user_store
+
+@app.exception_handler(HashingBusyError)
+def hashing_busy_handler(request: Request, exc: HashingBusyError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado, intente de nuevo"},
+        headers={"Retry-After": "1"},
+    )
+
+# Altas y cambios de email antes de verificar el índice único de email
+@app.exception_handler(IndexesNotReady)
+def indexes_not_ready_handler(request: Request, exc: IndexesNotReady):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servicio no disponible todavía, intente de nuevo"},
+        headers={"Retry-After": "5"},
+    )
+
+@app.exception_handler(LoginThrottled)
+def login_throttled_handler(request: Request, exc: LoginThrottled):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Demasiados intentos, intente más tarde"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
 
 class User(BaseModel):
     username: str
     email: str
     password: str
 
-def user_serializer(user) -> dict:
-    return {
-        "id": str(user["_id"]),
-        "username": user["username"],
-        "email": user["email"],
-    }
+class UserPatch(BaseModel):
+    username: Optional[str] = None
+    email: Optional[str] = None
+    password: Optional[str] = None
+
+class UserIds(BaseModel):
+    ids: List[str]
+
+class UserBatch(BaseModel):
+    users: List[User]
+
+# Respuestas
+class UserOut(BaseModel):
+    id: str
+    username: str
+    email: str
+
+class UserPage(BaseModel):
+    users: List[UserOut]
+    next_after: Optional[str] = None
+
+class CreatedId(BaseModel):
+    id: str
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+
+class Message(BaseModel):
+    msg: str
+
+class BatchGetResult(BaseModel):
+    users: List[UserOut]
+    not_found: List[str]
+
+class BatchCreateItem(BaseModel):
+    index: int
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchCreateResult(BaseModel):
+    results: List[BatchCreateItem]
+
+class BatchDeleteResult(BaseModel):
+    deleted: int
+    invalid_ids: List[str]
+
+def validate_batch_size(size: int):
+    try:
+        check_batch_size(size)
+    except BatchTooLarge as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+def list_filters(username: Optional[str], email: Optional[str]) -> dict:
+    filters = {"username": username, "email": email}
+    return {field: value for field, value in filters.items() if value is not None}
 
 def validate_object_id(user_id: str):
     try:
@@ -33,63 +153,228 @@ def validate_object_id(user_id: str):
     except Exception:
         raise HTTPException(status_code=400, detail="ID de usuario inválido")
 
-@app.post("/register")
-def register(user: User):
-    if users_collection.find_one({"email": user.email}):
-        raise HTTPException(status_code=400, detail="Email ya registrado")
-    hashed_pw = get_password_hash(user.password)
-    user_dict = user.dict()
+@app.post("/register", response_model=CreatedId)
+async def register(user: User, store=Depends(get_user_store)):
+    hashed_pw = await get_password_hash_async(user.password)
+    user_dict = user.model_dump()
     user_dict["password"] = hashed_pw
-    result = users_collection.insert_one(user_dict)
-    return {"id": str(result.inserted_id)}
+    # Un solo viaje a Mongo: el índice único de email rechaza los duplicados
+    try:
+        user_id = await store.insert(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email ya registrado")
+    # Borra una posible entrada negativa para este email
+    get_user_cache().invalidate(email=user.email)
+    return {"id": str(user_id)}
 
-@app.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = users_collection.find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user["password"]):
+@app.post("/login", response_model=Token)
+async def login(request: Request, background_tasks: BackgroundTasks,
+                form_data: OAuth2PasswordRequestForm = Depends(),
+                store=Depends(get_user_store)):
+    # Antes de leer el usuario y de bcrypt: lanza LoginThrottled (429)
+    limiter = get_login_limiter()
+    limiter.check(form_data.username, request.client.host if request.client else "")
+    user = await store.get_by_email(form_data.username, AUTH_PROJECTION)
+    if not user or not await verify_password_async(form_data.password, user["password"]):
+        limiter.record_failure(form_data.username)
         raise HTTPException(status_code=401, detail="Credenciales incorrectas")
-    token = create_access_token({"sub": user["email"]})
+    limiter.record_success(form_data.username)
+    # Se guarda después de enviar la respuesta
+    if needs_rehash(user["password"]):
+        background_tasks.add_task(
+            rehash_password_async, store, user["email"], form_data.password, user["password"]
+        )
+    token = await create_access_token_async({"sub": user["email"]})
     return {"access_token": token, "token_type": "bearer"}
 
-@app.get("/users/me")
-def get_me(current_user=Depends(get_current_user)):
-    user = users_collection.find_one({"email": current_user["sub"]})
+@app.post("/users/batch/get", response_model=BatchGetResult)
+async def batch_get_users(body: UserIds, current_user=Depends(get_current_user),
+                          store=Depends(get_user_store)):
+    validate_batch_size(len(body.ids))
+    oids, _ = parse_ids(body.ids)
+    users = await find_users_async(store, get_user_cache(), oids) if oids else []
+    found, not_found = order_by_request(body.ids, users)
+    return FastJSONResponse(
+        {"users": [user_serializer(user) for user in found], "not_found": not_found}
+    )
+
+@app.post("/users/batch", response_model=BatchCreateResult, response_model_exclude_none=True)
+async def batch_create_users(body: UserBatch, current_user=Depends(get_current_user),
+                             store=Depends(get_user_store)):
+    validate_batch_size(len(body.users))
+    errors, valid = split_new_users(
+        [(user.username, user.email, user.password) for user in body.users]
+    )
+    hashes = await get_password_hashes_async([password for *_, password in valid])
+    documents = build_documents(valid, hashes)
+    error = None
+    if documents:
+        try:
+            await store.insert_many([doc for _, doc in documents])
+        except BulkWriteError as exc:
+            error = exc
+    results = [{"index": index, "error": message} for index, message in errors.items()]
+    for index, document, message in insert_outcomes(documents, error):
+        if document is None:
+            results.append({"index": index, "error": message})
+        else:
+            get_user_cache().invalidate(email=document["email"])
+            results.append({"index": index, "id": str(document["_id"])})
+    results.sort(key=lambda result: result["index"])
+    return {"results": results}
+
+@app.post("/users/batch/delete", response_model=BatchDeleteResult)
+async def batch_delete_users(body: UserIds, current_user=Depends(get_current_user),
+                             store=Depends(get_user_store)):
+    validate_batch_size(len(body.ids))
+    oids, invalid = parse_ids(body.ids)
+    deleted = 0
+    if oids:
+        deleted = await store.delete_many(oids)
+        for oid in oids:
+            get_user_cache().invalidate(user_id=oid)
+    return {"deleted": deleted, "invalid_ids": invalid}
+
+@app.get("/users", response_model=UserPage)
+async def list_users(limit: int = USERS_DEFAULT_PAGE_SIZE, after: str = "",
+                     username: Optional[str] = None, email: Optional[str] = None,
+                     current_user=Depends(get_current_user),
+                     store=Depends(get_user_store)):
+    # Keyset sobre _id: cada página es un rango del índice, sin skip()
+    try:
+        users, next_after = await store.page(limit, after, list_filters(username, email))
+    except InvalidPageToken:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return FastJSONResponse(
+        {"users": [user_serializer(user) for user in users], "next_after": next_after or None}
+    )
+
+async def export_lines(cursor):
+    # Se codifica un chunk por cada lote del cursor
+    users = []
+    async with cursor:
+        async for user in cursor:
+            users.append(user)
+            if len(users) >= USERS_CURSOR_BATCH_SIZE:
+                yield ndjson(users)
+                users = []
+    if users:
+        yield ndjson(users)
+
+@app.get("/users/export")
+async def export_users(after: str = "", username: Optional[str] = None,
+                       email: Optional[str] = None, current_user=Depends(get_current_user),
+                       store=Depends(get_user_store)):
+    try:
+        cursor = store.iterate(after, PROFILE_PROJECTION, list_filters(username, email))
+    except InvalidPageToken:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return StreamingResponse(export_lines(cursor), media_type="application/x-ndjson")
+
+async def not_modified(request: Request, store, headers=None, user_id=None, email=None):
+    # 304 sin leer el perfil si el cliente ya tiene la versión vigente
+    condition = request.headers.get("if-none-match")
+    if not condition:
+        return None
+    version = await find_version_async(store, get_user_cache(), user_id=user_id, email=email)
+    if version is None or not etag_matches(condition, etag(version)):
+        return None
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag(version)})
+
+# /users/me es la misma URL para todos: las cachés intermedias la separan por token
+ME_HEADERS = {"Vary": "Authorization"}
+
+@app.get("/users/me", response_model=UserOut)
+async def get_me(request: Request, current_user=Depends(get_current_user),
+                 store=Depends(get_user_store)):
+    cached = await not_modified(request, store, ME_HEADERS, email=current_user["sub"])
+    if cached:
+        return cached
+    user = await find_user_async(
+        store, get_user_cache(), email=current_user["sub"]
+    )
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    return user_serializer(user)
+    return FastJSONResponse(user_serializer(user),
+                            headers={**ME_HEADERS, "ETag": user_etag(user)})
 
-@app.get("/users/{user_id}")
-def get_user(user_id: str, current_user=Depends(get_current_user)):
+@app.get("/users/{user_id}", response_model=UserOut)
+async def get_user(user_id: str, request: Request, current_user=Depends(get_current_user),
+                   store=Depends(get_user_store)):
     oid = validate_object_id(user_id)
-    user = users_collection.find_one({"_id": oid})
+    cached = await not_modified(request, store, user_id=oid)
+    if cached:
+        return cached
+    user = await find_user_async(store, get_user_cache(), user_id=oid)
     if user:
-        return user_serializer(user)
+        return FastJSONResponse(user_serializer(user), headers={"ETag": user_etag(user)})
     raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-@app.put("/users/{user_id}")
-def update_user(user_id: str, user: User, current_user=Depends(get_current_user)):
+@app.put("/users/{user_id}", response_model=Message)
+async def update_user(user_id: str, user: User, current_user=Depends(get_current_user),
+                      store=Depends(get_user_store)):
     oid = validate_object_id(user_id)
-    hashed_pw = get_password_hash(user.password)
-    user_dict = user.dict()
+    hashed_pw = await get_password_hash_async(user.password)
+    user_dict = user.model_dump()
     user_dict["password"] = hashed_pw
-    result = users_collection.update_one({"_id": oid}, {"$set": user_dict})
-    if result.matched_count:
+    try:
+        updated = await store.update(oid, user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email ya registrado")
+    get_user_cache().invalidate(user_id=oid, email=user.email)
+    if updated:
         return {"msg": "Usuario actualizado"}
     raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-@app.delete("/users/{user_id}")
-def delete_user(user_id: str, current_user=Depends(get_current_user)):
+@app.patch("/users/{user_id}", response_model=UserOut)
+async def patch_user(user_id: str, user: UserPatch, current_user=Depends(get_current_user),
+                     store=Depends(get_user_store)):
+    oid = validate_object_id(user_id)
+    fields = user.model_dump(exclude_none=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nada que actualizar")
+    # bcrypt solo si llega una contraseña nueva
+    if "password" in fields:
+        if not fields["password"]:
+            raise HTTPException(status_code=400, detail="La contraseña no puede estar vacía")
+        fields["password"] = await get_password_hash_async(fields["password"])
+    try:
+        updated = await store.update(oid, fields)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email ya registrado")
+    get_user_cache().invalidate(user_id=oid, email=fields.get("email"))
+    if updated:
+        return FastJSONResponse(user_serializer(updated), headers={"ETag": user_etag(updated)})
+    raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+@app.delete("/users/{user_id}", response_model=Message)
+async def delete_user(user_id: str, current_user=Depends(get_current_user),
+                      store=Depends(get_user_store)):
     oid = validate_object_id(user_id)
-    result = users_collection.delete_one({"_id": oid})
-    if result.deleted_count:
+    deleted = await store.delete(oid)
+    get_user_cache().invalidate(user_id=oid)
+    if deleted:
         return {"msg": "Usuario eliminado"}
     raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-def start_grpc():
-    grpc_serve()
+# Claves públicas para que otros servicios verifiquen los tokens sin llamarnos
+@app.get("/.well-known/jwks.json")
+async def jwks():
+    return FastJSONResponse(
+        get_signer().jwks(),
+        headers={"Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}"},
+    )
+
+@app.get("/cache/stats", response_model=Dict[str, int])
+async def cache_stats(current_user=Depends(get_current_user)):
+    return get_user_cache().stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
+# HTTP y gRPC en procesos separados (ver app.launcher)
 if __name__ == "__main__":
-    import uvicorn
-    t = threading.Thread(target=start_grpc, daemon=True)
-    t.start()
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import sys
+    from app.launcher import main as launch
+    sys.exit(launch())
@@ -0,0 +1,265 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Registro mínimo de métricas con salida en formato de texto de Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class _ValueMetric(_Metric):
+    # Valores por etiquetas, más los que devuelva la función registrada al exportar
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set_function(self, function):
+        # function() devuelve un número, o un dict {tupla de etiquetas: valor}
+        self._function = function
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        if self._function is not None:
+            current = self._function()
+            if isinstance(current, dict):
+                items.extend(current.items())
+            else:
+                items.append(((), current))
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Counter(_ValueMetric):
+    # Con set_function, la función debe devolver valores que solo crecen
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+class Gauge(_ValueMetric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# HTTP
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Peticiones HTTP por ruta, método y estado", ("route", "method", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP", ("route", "method"))
+
+# gRPC
+GRPC_HANDLED = REGISTRY.counter(
+    "grpc_server_handled_total", "RPCs terminadas por método y código", ("method", "code"))
+GRPC_LATENCY = REGISTRY.histogram(
+    "grpc_server_handling_seconds", "Latencia de las RPCs", ("method",))
+GRPC_POOL_QUEUE = REGISTRY.gauge(
+    "grpc_thread_pool_queue_depth", "RPCs esperando un hilo libre en el servidor gRPC")
+
+# Compresión de respuestas; bytes por stage (raw/compressed) para el ratio por endpoint
+COMPRESSION_BYTES = REGISTRY.counter(
+    "response_compression_bytes_total", "Bytes de respuesta antes y después de comprimir",
+    ("transport", "endpoint", "encoding", "stage"))
+COMPRESSION_RATIO = REGISTRY.histogram(
+    "response_compression_ratio", "Tamaño comprimido / original por respuesta",
+    ("transport", "endpoint", "encoding"),
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+COMPRESSION_SECONDS = REGISTRY.histogram(
+    "response_compression_seconds", "CPU dedicada a comprimir cada respuesta",
+    ("transport", "endpoint", "encoding"))
+
+# MongoDB (CommandListener)
+MONGO_COMMANDS = REGISTRY.counter(
+    "mongo_commands_total", "Comandos enviados a MongoDB", ("command", "status"))
+MONGO_LATENCY = REGISTRY.histogram(
+    "mongo_command_duration_seconds", "Duración de los comandos de MongoDB", ("command",))
+
+# Deadlines
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "deadline_exceeded_total", "Peticiones cortadas por deadline vencida, por etapa",
+    ("stage",))
+
+# Control de admisión
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected_total", "Peticiones rechazadas por el control de admisión",
+    ("endpoint", "reason"))
+ADMISSION_QUEUE_SECONDS = REGISTRY.histogram(
+    "admission_queue_seconds", "Espera hasta obtener un hueco de concurrencia", ("endpoint",))
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "admission_in_flight", "Peticiones admitidas en curso por clase", ("endpoint",))
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "admission_queued", "Peticiones esperando hueco por clase", ("endpoint",))
+
+# Hash de contraseñas
+PASSWORD_HASH_LATENCY = REGISTRY.histogram(
+    "password_hash_seconds", "Tiempo total de hash/verify, incluida la espera en el pool",
+    ("operation",))
+PASSWORD_HASH_CPU = REGISTRY.histogram(
+    "password_hash_cpu_seconds", "CPU del hilo del worker en bcrypt (thread_time)", ("operation",))
+PASSWORD_HASH_REJECTED = REGISTRY.counter(
+    "password_hash_rejected_total", "Trabajos de hash rechazados por cola llena")
+PASSWORD_HASH_PENDING = REGISTRY.gauge(
+    "password_hash_pending", "Trabajos de hash en ejecución o en cola")
+PASSWORD_REHASHES = REGISTRY.counter(
+    "password_rehash_total", "Hashes migrados a la política actual al hacer login",
+    ("result",))
+
+# Caché de usuarios
+USER_CACHE_EVENTS = REGISTRY.counter(
+    "user_cache_events_total", "Eventos de la caché de usuarios (hits, misses, evictions...)",
+    ("event",))
+USER_CACHE_SIZE = REGISTRY.gauge(
+    "user_cache_entries", "Entradas en la caché de usuarios")
+
+# Tokens
+TOKEN_VERIFY_LATENCY = REGISTRY.histogram(
+    "token_verify_seconds", "Verificación de firma de JWT (fallos de la caché de tokens)",
+    ("algorithm",))
+TOKEN_CACHE_EVENTS = REGISTRY.counter(
+    "token_cache_events_total", "Eventos de la caché de JWT verificados", ("event",))
+TOKEN_CACHE_SIZE = REGISTRY.gauge(
+    "token_cache_entries", "Entradas en la caché de JWT verificados")
+
+# Limitador de login
+LOGIN_THROTTLED = REGISTRY.counter(
+    "login_throttled_total", "Intentos de login rechazados antes de verificar la contraseña",
+    ("reason",))
+LOGIN_LOCKOUTS = REGISTRY.counter(
+    "login_lockouts_total", "Emails bloqueados por fallos seguidos")
+LOGIN_LIMITER_KEYS = REGISTRY.gauge(
+    "login_limiter_keys", "Claves activas en el limitador de login")
+
+def render() -> str:
+    return REGISTRY.render()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    # Para procesos sin FastAPI (p.ej. el servidor gRPC por separado)
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
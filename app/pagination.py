@@ -0,0 +1,74 @@
+import base64
+import binascii
+from bson import ObjectId, errors as bson_errors
+from app.config import (
+    USERS_DEFAULT_PAGE_SIZE, USERS_MAX_PAGE_SIZE, USERS_CURSOR_BATCH_SIZE
+)
+from app.projections import PROFILE_PROJECTION
+
+# Solo los campos públicos: nunca se lee el hash de la contraseña al listar
+USER_LIST_PROJECTION = PROFILE_PROJECTION
+
+class InvalidPageToken(ValueError):
+    pass
+
+def clamp_page_size(page_size: int) -> int:
+    if page_size <= 0:
+        return USERS_DEFAULT_PAGE_SIZE
+    return min(page_size, USERS_MAX_PAGE_SIZE)
+
+def encode_page_token(last_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(last_id.binary).decode().rstrip("=")
+
+def decode_page_token(token: str):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        return ObjectId(raw)
+    except (binascii.Error, bson_errors.InvalidId, ValueError, TypeError):
+        raise InvalidPageToken(token)
+
+# Filtros de igualdad admitidos al listar (GET /users)
+FILTER_FIELDS = ("username", "email")
+
+def keyset_filter(page_token: str, filters: dict = None) -> dict:
+    query = dict(filters or {})
+    after = decode_page_token(page_token)
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    return query
+
+def _page_cursor(collection, size: int, page_token: str, filters=None):
+    # Pide un documento extra para saber si hay otra página sin hacer count()
+    return (
+        collection.find(keyset_filter(page_token, filters), USER_LIST_PROJECTION)
+        .sort("_id", 1)
+        .limit(size + 1)
+        .batch_size(size + 1)
+    )
+
+def split_page(users: list, size: int):
+    next_token = ""
+    if len(users) > size:
+        users = users[:size]
+        next_token = encode_page_token(users[-1]["_id"])
+    return users, next_token
+
+def fetch_page(collection, page_size: int, page_token: str = "", filters=None):
+    size = clamp_page_size(page_size)
+    return split_page(list(_page_cursor(collection, size, page_token, filters)), size)
+
+async def fetch_page_async(collection, page_size: int, page_token: str = "", filters=None):
+    size = clamp_page_size(page_size)
+    cursor = _page_cursor(collection, size, page_token, filters)
+    return split_page(await cursor.to_list(), size)
+
+# Sirve para colecciones síncronas y async: devuelve el cursor sin consumirlo
+def iter_users(collection, page_token: str = "", projection=USER_LIST_PROJECTION,
+               filters=None):
+    return (
+        collection.find(keyset_filter(page_token, filters), projection)
+        .sort("_id", 1)
+        .batch_size(USERS_CURSOR_BATCH_SIZE)
+    )
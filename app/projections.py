@@ -0,0 +1,17 @@
+# Proyecciones con nombre para leer usuarios. Cada lectura pide la más pequeña
+# que le sirve: el hash de bcrypt solo viaja desde Mongo en el login.
+
+# Perfil público: lo que devuelven user_serializer y UserResponse (_id va incluido).
+# version sube en cada actualización y es la base del ETag.
+PROFILE_PROJECTION = {"username": 1, "email": 1, "version": 1}
+
+# Solo la versión, para peticiones condicionales: la cubren los índices
+# id_version/email_version (app.database) sin leer el documento
+VERSION_PROJECTION = {"_id": 0, "version": 1}
+
+# Verificación de credenciales
+AUTH_PROJECTION = {"_id": 0, "email": 1, "password": 1}
+
+def document_version(user) -> int:
+    # Los documentos anteriores al contador no tienen version: cuentan como 0
+    return user.get("version") or 0
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# user_pb2_grpc (generado por protoc) hace "import user_pb2" absoluto
+sys.path.append(os.path.dirname(__file__))
@@ -22,37 +22,60 @@ _runtime_version.ValidateProtobufRuntimeVersion(
 _sym_db = _symbol_database.Default()
 
 
+from google.protobuf import field_mask_pb2 as google_dot_protobuf_dot_field__mask__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nuser.proto\x12\x04user\"F\n\x11\x43reateUserRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\r\n\x05\x65mail\x18\x02 \x01(\t\x12\x10\n\x08password\x18\x03 \x01(\t\"\x1c\n\x0eGetUserRequest\x12\n\n\x02id\x18\x01 \x01(\t\"R\n\x11UpdateUserRequest\x12\n\n\x02id\x18\x01 \x01(\t\x12\x10\n\x08username\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x10\n\x08password\x18\x04 \x01(\t\"\x1f\n\x11\x44\x65leteUserRequest\x12\n\n\x02id\x18\x01 \x01(\t\"\x07\n\x05\x45mpty\";\n\x0cUserResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12\x10\n\x08username\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\"5\n\x10UserListResponse\x12!\n\x05users\x18\x01 \x03(\x0b\x32\x12.user.UserResponse\"D\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\r\n\x05\x65mail\x18\x02 \x01(\t\x12\x10\n\x08password\x18\x03 \x01(\t\"\x1e\n\x10RegisterResponse\x12\n\n\x02id\x18\x01 \x01(\t\"/\n\x0cLoginRequest\x12\r\n\x05\x65mail\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"9\n\rLoginResponse\x12\x14\n\x0c\x61\x63\x63\x65ss_token\x18\x01 \x01(\t\x12\x12\n\ntoken_type\x18\x02 \x01(\t2\x8b\x03\n\x0bUserService\x12\x39\n\nCreateUser\x12\x17.user.CreateUserRequest\x1a\x12.user.UserResponse\x12\x33\n\x07GetUser\x12\x14.user.GetUserRequest\x1a\x12.user.UserResponse\x12\x39\n\nUpdateUser\x12\x17.user.UpdateUserRequest\x1a\x12.user.UserResponse\x12\x32\n\nDeleteUser\x12\x17.user.DeleteUserRequest\x1a\x0b.user.Empty\x12\x30\n\tListUsers\x12\x0b.user.Empty\x1a\x16.user.UserListResponse\x12\x39\n\x08Register\x12\x15.user.RegisterRequest\x1a\x16.user.RegisterResponse\x12\x30\n\x05Login\x12\x12.user.LoginRequest\x1a\x13.user.LoginResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nuser.proto\x12\x04user\x1a google/protobuf/field_mask.proto\"F\n\x11\x43reateUserRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\r\n\x05\x65mail\x18\x02 \x01(\t\x12\x10\n\x08password\x18\x03 \x01(\t\"0\n\x0eGetUserRequest\x12\n\n\x02id\x18\x01 \x01(\t\x12\x12\n\nif_version\x18\x02 \x01(\x03\"\x83\x01\n\x11UpdateUserRequest\x12\n\n\x02id\x18\x01 \x01(\t\x12\x10\n\x08username\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x10\n\x08password\x18\x04 \x01(\t\x12/\n\x0bupdate_mask\x18\x05 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\"\x1f\n\x11\x44\x65leteUserRequest\x12\n\n\x02id\x18\x01 \x01(\t\"\x07\n\x05\x45mpty\"b\n\x0cUserResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12\x10\n\x08username\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x0f\n\x07version\x18\x04 \x01(\x03\x12\x14\n\x0cnot_modified\x18\x05 \x01(\x08\"9\n\x10ListUsersRequest\x12\x11\n\tpage_size\x18\x01 \x01(\x05\x12\x12\n\npage_token\x18\x02 \x01(\t\"N\n\x10UserListResponse\x12!\n\x05users\x18\x01 \x03(\x0b\x32\x12.user.UserResponse\x12\x17\n\x0fnext_page_token\x18\x02 \x01(\t\"#\n\x14\x42\x61tchGetUsersRequest\x12\x0b\n\x03ids\x18\x01 \x03(\t\"Q\n\x15\x42\x61tchGetUsersResponse\x12!\n\x05users\x18\x01 \x03(\x0b\x32\x12.user.UserResponse\x12\x15\n\rnot_found_ids\x18\x02 \x03(\t\"A\n\x17\x42\x61tchCreateUsersRequest\x12&\n\x05users\x18\x01 \x03(\x0b\x32\x17.user.CreateUserRequest\"W\n\x15\x42\x61tchCreateUserResult\x12\r\n\x05index\x18\x01 \x01(\x05\x12 \n\x04user\x18\x02 \x01(\x0b\x32\x12.user.UserResponse\x12\r\n\x05\x65rror\x18\x03 \x01(\t\"H\n\x18\x42\x61tchCreateUsersResponse\x12,\n\x07results\x18\x01 \x03(\x0b\x32\x1b.user.BatchCreateUserResult\"&\n\x17\x42\x61tchDeleteUsersRequest\x12\x0b\n\x03ids\x18\x01 \x03(\t\"F\n\x18\x42\x61tchDeleteUsersResponse\x12\x15\n\rdeleted_count\x18\x01 \x01(\x03\x12\x13\n\x0binvalid_ids\x18\x02 \x03(\t\"D\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\r\n\x05\x65mail\x18\x02 \x01(\t\x12\x10\n\x08password\x18\x03 \x01(\t\"\x1e\n\x10RegisterResponse\x12\n\n\x02id\x18\x01 \x01(\t\"/\n\x0cLoginRequest\x12\r\n\x05\x65mail\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"9\n\rLoginResponse\x12\x14\n\x0c\x61\x63\x63\x65ss_token\x18\x01 \x01(\t\x12\x12\n\ntoken_type\x18\x02 \x01(\t\"\'\n\x15ValidateTokensRequest\x12\x0e\n\x06tokens\x18\x01 \x03(\t\"T\n\x0fTokenValidation\x12\r\n\x05valid\x18\x01 \x01(\x08\x12\x0f\n\x07subject\x18\x02 \x01(\t\x12\x12\n\nexpires_at\x18\x03 \x01(\x03\x12\r\n\x05\x65rror\x18\x04 \x01(\t\"@\n\x16ValidateTokensResponse\x12&\n\x07results\x18\x01 \x03(\x0b\x32\x15.user.TokenValidation2\x90\x06\n\x0bUserService\x12\x39\n\nCreateUser\x12\x17.user.CreateUserRequest\x1a\x12.user.UserResponse\x12\x33\n\x07GetUser\x12\x14.user.GetUserRequest\x1a\x12.user.UserResponse\x12\x39\n\nUpdateUser\x12\x17.user.UpdateUserRequest\x1a\x12.user.UserResponse\x12\x32\n\nDeleteUser\x12\x17.user.DeleteUserRequest\x1a\x0b.user.Empty\x12;\n\tListUsers\x12\x16.user.ListUsersRequest\x1a\x16.user.UserListResponse\x12;\n\x0bStreamUsers\x12\x16.user.ListUsersRequest\x1a\x12.user.UserResponse0\x01\x12H\n\rBatchGetUsers\x12\x1a.user.BatchGetUsersRequest\x1a\x1b.user.BatchGetUsersResponse\x12Q\n\x10\x42\x61tchCreateUsers\x12\x1d.user.BatchCreateUsersRequest\x1a\x1e.user.BatchCreateUsersResponse\x12Q\n\x10\x42\x61tchDeleteUsers\x12\x1d.user.BatchDeleteUsersRequest\x1a\x1e.user.BatchDeleteUsersResponse\x12\x39\n\x08Register\x12\x15.user.RegisterRequest\x1a\x16.user.RegisterResponse\x12\x30\n\x05Login\x12\x12.user.LoginRequest\x1a\x13.user.LoginResponse\x12K\n\x0eValidateTokens\x12\x1b.user.ValidateTokensRequest\x1a\x1c.user.ValidateTokensResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'user_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_CREATEUSERREQUEST']._serialized_start=20
-  _globals['_CREATEUSERREQUEST']._serialized_end=90
-  _globals['_GETUSERREQUEST']._serialized_start=92
-  _globals['_GETUSERREQUEST']._serialized_end=120
-  _globals['_UPDATEUSERREQUEST']._serialized_start=122
-  _globals['_UPDATEUSERREQUEST']._serialized_end=204
-  _globals['_DELETEUSERREQUEST']._serialized_start=206
-  _globals['_DELETEUSERREQUEST']._serialized_end=237
-  _globals['_EMPTY']._serialized_start=239
-  _globals['_EMPTY']._serialized_end=246
-  _globals['_USERRESPONSE']._serialized_start=248
-  _globals['_USERRESPONSE']._serialized_end=307
-  _globals['_USERLISTRESPONSE']._serialized_start=309
-  _globals['_USERLISTRESPONSE']._serialized_end=362
-  _globals['_REGISTERREQUEST']._serialized_start=364
-  _globals['_REGISTERREQUEST']._serialized_end=432
-  _globals['_REGISTERRESPONSE']._serialized_start=434
-  _globals['_REGISTERRESPONSE']._serialized_end=464
-  _globals['_LOGINREQUEST']._serialized_start=466
-  _globals['_LOGINREQUEST']._serialized_end=513
-  _globals['_LOGINRESPONSE']._serialized_start=515
-  _globals['_LOGINRESPONSE']._serialized_end=572
-  _globals['_USERSERVICE']._serialized_start=575
-  _globals['_USERSERVICE']._serialized_end=970
+  _globals['_CREATEUSERREQUEST']._serialized_start=54
+  _globals['_CREATEUSERREQUEST']._serialized_end=124
+  _globals['_GETUSERREQUEST']._serialized_start=126
+  _globals['_GETUSERREQUEST']._serialized_end=174
+  _globals['_UPDATEUSERREQUEST']._serialized_start=177
+  _globals['_UPDATEUSERREQUEST']._serialized_end=308
+  _globals['_DELETEUSERREQUEST']._serialized_start=310
+  _globals['_DELETEUSERREQUEST']._serialized_end=341
+  _globals['_EMPTY']._serialized_start=343
+  _globals['_EMPTY']._serialized_end=350
+  _globals['_USERRESPONSE']._serialized_start=352
+  _globals['_USERRESPONSE']._serialized_end=450
+  _globals['_LISTUSERSREQUEST']._serialized_start=452
+  _globals['_LISTUSERSREQUEST']._serialized_end=509
+  _globals['_USERLISTRESPONSE']._serialized_start=511
+  _globals['_USERLISTRESPONSE']._serialized_end=589
+  _globals['_BATCHGETUSERSREQUEST']._serialized_start=591
+  _globals['_BATCHGETUSERSREQUEST']._serialized_end=626
+  _globals['_BATCHGETUSERSRESPONSE']._serialized_start=628
+  _globals['_BATCHGETUSERSRESPONSE']._serialized_end=709
+  _globals['_BATCHCREATEUSERSREQUEST']._serialized_start=711
+  _globals['_BATCHCREATEUSERSREQUEST']._serialized_end=776
+  _globals['_BATCHCREATEUSERRESULT']._serialized_start=778
+  _globals['_BATCHCREATEUSERRESULT']._serialized_end=865
+  _globals['_BATCHCREATEUSERSRESPONSE']._serialized_start=867
+  _globals['_BATCHCREATEUSERSRESPONSE']._serialized_end=939
+  _globals['_BATCHDELETEUSERSREQUEST']._serialized_start=941
+  _globals['_BATCHDELETEUSERSREQUEST']._serialized_end=979
+  _globals['_BATCHDELETEUSERSRESPONSE']._serialized_start=981
+  _globals['_BATCHDELETEUSERSRESPONSE']._serialized_end=1051
+  _globals['_REGISTERREQUEST']._serialized_start=1053
+  _globals['_REGISTERREQUEST']._serialized_end=1121
+  _globals['_REGISTERRESPONSE']._serialized_start=1123
+  _globals['_REGISTERRESPONSE']._serialized_end=1153
+  _globals['_LOGINREQUEST']._serialized_start=1155
+  _globals['_LOGINREQUEST']._serialized_end=1202
+  _globals['_LOGINRESPONSE']._serialized_start=1204
+  _globals['_LOGINRESPONSE']._serialized_end=1261
+  _globals['_VALIDATETOKENSREQUEST']._serialized_start=1263
+  _globals['_VALIDATETOKENSREQUEST']._serialized_end=1302
+  _globals['_TOKENVALIDATION']._serialized_start=1304
+  _globals['_TOKENVALIDATION']._serialized_end=1388
+  _globals['_VALIDATETOKENSRESPONSE']._serialized_start=1390
+  _globals['_VALIDATETOKENSRESPONSE']._serialized_end=1454
+  _globals['_USERSERVICE']._serialized_start=1457
+  _globals['_USERSERVICE']._serialized_end=2241
 # @@protoc_insertion_point(module_scope)
@@ -56,9 +56,29 @@ class UserServiceStub(object):
                 _registered_method=True)
         self.ListUsers = channel.unary_unary(
                 '/user.UserService/ListUsers',
-                request_serializer=user__pb2.Empty.SerializeToString,
+                request_serializer=user__pb2.ListUsersRequest.SerializeToString,
                 response_deserializer=user__pb2.UserListResponse.FromString,
                 _registered_method=True)
+        self.StreamUsers = channel.unary_stream(
+                '/user.UserService/StreamUsers',
+                request_serializer=user__pb2.ListUsersRequest.SerializeToString,
+                response_deserializer=user__pb2.UserResponse.FromString,
+                _registered_method=True)
+        self.BatchGetUsers = channel.unary_unary(
+                '/user.UserService/BatchGetUsers',
+                request_serializer=user__pb2.BatchGetUsersRequest.SerializeToString,
+                response_deserializer=user__pb2.BatchGetUsersResponse.FromString,
+                _registered_method=True)
+        self.BatchCreateUsers = channel.unary_unary(
+                '/user.UserService/BatchCreateUsers',
+                request_serializer=user__pb2.BatchCreateUsersRequest.SerializeToString,
+                response_deserializer=user__pb2.BatchCreateUsersResponse.FromString,
+                _registered_method=True)
+        self.BatchDeleteUsers = channel.unary_unary(
+                '/user.UserService/BatchDeleteUsers',
+                request_serializer=user__pb2.BatchDeleteUsersRequest.SerializeToString,
+                response_deserializer=user__pb2.BatchDeleteUsersResponse.FromString,
+                _registered_method=True)
         self.Register = channel.unary_unary(
                 '/user.UserService/Register',
                 request_serializer=user__pb2.RegisterRequest.SerializeToString,
@@ -69,6 +89,11 @@ class UserServiceStub(object):
                 request_serializer=user__pb2.LoginRequest.SerializeToString,
                 response_deserializer=user__pb2.LoginResponse.FromString,
                 _registered_method=True)
+        self.ValidateTokens = channel.unary_unary(
+                '/user.UserService/ValidateTokens',
+                request_serializer=user__pb2.ValidateTokensRequest.SerializeToString,
+                response_deserializer=user__pb2.ValidateTokensResponse.FromString,
+                _registered_method=True)
 
 
 class UserServiceServicer(object):
@@ -104,6 +129,30 @@ class UserServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamUsers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchGetUsers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchCreateUsers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchDeleteUsers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def Register(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -116,6 +165,13 @@ class UserServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ValidateTokens(self, request, context):
+        """Para servicios que aún no verifican con /.well-known/jwks.json
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_UserServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -141,9 +197,29 @@ def add_UserServiceServicer_to_server(servicer, server):
             ),
             'ListUsers': grpc.unary_unary_rpc_method_handler(
                     servicer.ListUsers,
-                    request_deserializer=user__pb2.Empty.FromString,
+                    request_deserializer=user__pb2.ListUsersRequest.FromString,
                     response_serializer=user__pb2.UserListResponse.SerializeToString,
             ),
+            'StreamUsers': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamUsers,
+                    request_deserializer=user__pb2.ListUsersRequest.FromString,
+                    response_serializer=user__pb2.UserResponse.SerializeToString,
+            ),
+            'BatchGetUsers': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchGetUsers,
+                    request_deserializer=user__pb2.BatchGetUsersRequest.FromString,
+                    response_serializer=user__pb2.BatchGetUsersResponse.SerializeToString,
+            ),
+            'BatchCreateUsers': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchCreateUsers,
+                    request_deserializer=user__pb2.BatchCreateUsersRequest.FromString,
+                    response_serializer=user__pb2.BatchCreateUsersResponse.SerializeToString,
+            ),
+            'BatchDeleteUsers': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchDeleteUsers,
+                    request_deserializer=user__pb2.BatchDeleteUsersRequest.FromString,
+                    response_serializer=user__pb2.BatchDeleteUsersResponse.SerializeToString,
+            ),
             'Register': grpc.unary_unary_rpc_method_handler(
                     servicer.Register,
                     request_deserializer=user__pb2.RegisterRequest.FromString,
@@ -154,6 +230,11 @@ def add_UserServiceServicer_to_server(servicer, server):
                     request_deserializer=user__pb2.LoginRequest.FromString,
                     response_serializer=user__pb2.LoginResponse.SerializeToString,
             ),
+            'ValidateTokens': grpc.unary_unary_rpc_method_handler(
+                    servicer.ValidateTokens,
+                    request_deserializer=user__pb2.ValidateTokensRequest.FromString,
+                    response_serializer=user__pb2.ValidateTokensResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'user.UserService', rpc_method_handlers)
@@ -288,7 +369,7 @@ class UserService(object):
             request,
             target,
             '/user.UserService/ListUsers',
-            user__pb2.Empty.SerializeToString,
+            user__pb2.ListUsersRequest.SerializeToString,
             user__pb2.UserListResponse.FromString,
             options,
             channel_credentials,
@@ -300,6 +381,114 @@ class UserService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def StreamUsers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/user.UserService/StreamUsers',
+            user__pb2.ListUsersRequest.SerializeToString,
+            user__pb2.UserResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchGetUsers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/user.UserService/BatchGetUsers',
+            user__pb2.BatchGetUsersRequest.SerializeToString,
+            user__pb2.BatchGetUsersResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchCreateUsers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/user.UserService/BatchCreateUsers',
+            user__pb2.BatchCreateUsersRequest.SerializeToString,
+            user__pb2.BatchCreateUsersResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchDeleteUsers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/user.UserService/BatchDeleteUsers',
+            user__pb2.BatchDeleteUsersRequest.SerializeToString,
+            user__pb2.BatchDeleteUsersResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def Register(request,
             target,
@@ -353,3 +542,30 @@ class UserService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def ValidateTokens(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/user.UserService/ValidateTokens',
+            user__pb2.ValidateTokensRequest.SerializeToString,
+            user__pb2.ValidateTokensResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
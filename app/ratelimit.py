@@ -0,0 +1,133 @@
+import threading
+import time
+from app import metrics
+from app.cache import MISS, ExpiringLRU
+from app.config import (
+    LOGIN_RATE_LIMIT_ENABLED, LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE,
+    LOGIN_CLIENT_BURST, LOGIN_CLIENT_PER_MINUTE, LOGIN_LOCKOUT_FAILURES,
+    LOGIN_LOCKOUT_SECONDS, LOGIN_LIMITER_MAX_KEYS, LOGIN_LOCKOUT_MAX_KEYS
+)
+
+# Se comprueba antes de leer el usuario y de llamar a bcrypt: un intento
+# rechazado no cuesta CPU de hash.
+class LoginThrottled(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Demasiados intentos de login ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+def peer_address(peer: str) -> str:
+    # context.peer() de gRPC: "ipv4:1.2.3.4:5678", "ipv6:[::1]:5678", "unix:..."
+    kind, _, address = (peer or "").partition(":")
+    if kind in ("ipv4", "ipv6"):
+        return address.rsplit(":", 1)[0]
+    return peer or ""
+
+class NullLoginLimiter:
+    def check(self, email: str, client: str):
+        pass
+
+    def record_failure(self, email: str):
+        pass
+
+    def record_success(self, email: str):
+        pass
+
+    def stats(self) -> dict:
+        return {"size": 0}
+
+class LoginLimiter(NullLoginLimiter):
+    # Estado en un ExpiringLRU: los cubos expiran cuando volverían a estar llenos
+    # y los fallos al acabar la ventana, así solo ocupan memoria las claves activas.
+    # Los bloqueos van en su propio LRU: inundar con claves distintas no los desaloja.
+    def __init__(self, email_burst=LOGIN_EMAIL_BURST, email_per_minute=LOGIN_EMAIL_PER_MINUTE,
+                 client_burst=LOGIN_CLIENT_BURST, client_per_minute=LOGIN_CLIENT_PER_MINUTE,
+                 lockout_failures=LOGIN_LOCKOUT_FAILURES, lockout_seconds=LOGIN_LOCKOUT_SECONDS,
+                 max_keys=LOGIN_LIMITER_MAX_KEYS, max_lockouts=LOGIN_LOCKOUT_MAX_KEYS,
+                 clock=time.monotonic):
+        self._limits = {
+            "email": (email_burst, email_per_minute / 60),
+            "client": (client_burst, client_per_minute / 60),
+        }
+        self.lockout_failures = lockout_failures
+        self.lockout_seconds = lockout_seconds
+        self._clock = clock
+        self._entries = ExpiringLRU(max_keys, clock=clock)
+        self._lockouts = ExpiringLRU(max_lockouts, clock=clock)
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, capacity, rate, now) -> float:
+        state = self._entries.get(key)
+        if state is MISS:
+            return float(capacity)
+        tokens, updated = state
+        return min(capacity, tokens + (now - updated) * rate)
+
+    def _reject(self, reason, retry_after):
+        metrics.LOGIN_THROTTLED.inc(reason=reason)
+        raise LoginThrottled(reason, max(retry_after, 0.0))
+
+    def check(self, email, client):
+        email = normalize_email(email)
+        now = self._clock()
+        with self._lock:
+            locked_until = self._lockouts.get(email)
+            if locked_until is not MISS:
+                self._reject("lockout", locked_until - now)
+            # Solo se consume un token si los dos cubos lo tienen
+            taken = []
+            for kind, value in (("email", email), ("client", client)):
+                capacity, rate = self._limits[kind]
+                if not value or capacity <= 0 or rate <= 0:
+                    continue
+                tokens = self._tokens((kind, value), capacity, rate, now)
+                if tokens < 1:
+                    self._reject(kind, (1 - tokens) / rate)
+                taken.append(((kind, value), tokens - 1, capacity, rate))
+            for key, tokens, capacity, rate in taken:
+                self._entries.set(key, (tokens, now), now + (capacity - tokens) / rate)
+
+    def record_failure(self, email):
+        if self.lockout_failures <= 0:
+            return
+        email = normalize_email(email)
+        now = self._clock()
+        with self._lock:
+            failures = self._entries.get(("failures", email))
+            failures = 1 if failures is MISS else failures + 1
+            if failures >= self.lockout_failures:
+                self._entries.pop(("failures", email))
+                locked_until = now + self.lockout_seconds
+                self._lockouts.set(email, locked_until, locked_until)
+                metrics.LOGIN_LOCKOUTS.inc()
+            else:
+                self._entries.set(("failures", email), failures, now + self.lockout_seconds)
+
+    def record_success(self, email):
+        with self._lock:
+            self._entries.pop(("failures", normalize_email(email)))
+
+    def stats(self) -> dict:
+        stats = self._entries.stats()
+        stats["lockouts"] = len(self._lockouts)
+        return stats
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_login_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = LoginLimiter() if LOGIN_RATE_LIMIT_ENABLED else NullLoginLimiter()
+        return _limiter
+
+def set_login_limiter(limiter):
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
+
+metrics.LOGIN_LIMITER_KEYS.set_function(lambda: get_login_limiter().stats()["size"])
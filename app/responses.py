@@ -0,0 +1,49 @@
+import json
+from fastapi.responses import JSONResponse
+from app.config import HTTP_JSON_ENCODER
+from app.projections import document_version
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional: sin ella se usa json de la stdlib
+    orjson = None
+
+def dumps_stdlib(content) -> bytes:
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def dumps_orjson(content) -> bytes:
+    return orjson.dumps(content)
+
+dumps = dumps_orjson if HTTP_JSON_ENCODER == "orjson" and orjson is not None else dumps_stdlib
+
+# Para las rutas calientes: el contenido ya son tipos JSON (str, int, listas y
+# dicts), así que se codifica a bytes de una vez, sin jsonable_encoder ni validar
+# contra el response_model (que queda solo para la documentación OpenAPI).
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def user_serializer(user) -> dict:
+    return {
+        "id": str(user["_id"]),
+        "username": user["username"],
+        "email": user["email"],
+    }
+
+# ETag de un usuario: su versión. El cuerpo solo cambia con update, que la sube.
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+def user_etag(user) -> str:
+    return etag(document_version(user))
+
+def etag_matches(if_none_match: str, tag: str) -> bool:
+    # If-None-Match usa comparación débil: W/"3" vale igual que "3"
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(",")
+    )
+
+def ndjson(users) -> bytes:
+    return b"".join(dumps(user_serializer(user)) + b"\n" for user in users)
@@ -1,16 +1,106 @@
+import asyncio
+import functools
 import grpc
-from concurrent import futures
+import signal
+import threading
 from bson import ObjectId, errors as bson_errors
-from app.database import get_db
-from app.auth import get_password_hash, verify_password, create_access_token
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app import metrics
+from app.config import (
+    GRPC_SERVER_MODE, GRPC_PORT, GRPC_MAX_WORKERS, GRPC_MAXIMUM_CONCURRENT_RPCS,
+    GRPC_REUSE_PORT, SHUTDOWN_GRACE_SECONDS, METRICS_ENABLED, METRICS_PORT
+)
+from app.auth import InvalidToken, create_access_token, verify_token
+from app.batch import (
+    BatchTooLarge, check_batch_size, parse_ids, order_by_request,
+    split_new_users, build_documents, insert_outcomes
+)
+from app.cache import find_user, find_users, find_version, get_user_cache
+from app.database import IndexesNotReady
+from app.hashing import (
+    HashingBusyError, get_password_hash, get_password_hashes, verify_password,
+    needs_rehash, rehash_in_background
+)
+from app.admission import build_admission_controller, set_admission_controller
+from app.instrumentation import (
+    AdmissionInterceptor, CompressionInterceptor, DeadlineInterceptor, MetricsInterceptor,
+    QueueCountingExecutor
+)
+from app.pagination import InvalidPageToken
+from app.projections import AUTH_PROJECTION, document_version
+from app.ratelimit import LoginThrottled, get_login_limiter, peer_address
+from app.store import get_user_store
 import app.proto.user_pb2 as user_pb2
 import app.proto.user_pb2_grpc as user_pb2_grpc
 
+def user_response(user) -> user_pb2.UserResponse:
+    return user_pb2.UserResponse(
+        id=str(user["_id"]),
+        username=user["username"],
+        email=user["email"],
+        version=document_version(user)
+    )
+
+def not_modified_response(request, version) -> user_pb2.UserResponse:
+    # GetUser con if_version vigente: sin perfil, el cliente ya lo tiene
+    return user_pb2.UserResponse(id=request.id, version=version, not_modified=True)
+
+def token_validation(token: str) -> user_pb2.TokenValidation:
+    try:
+        payload = verify_token(token)
+    except InvalidToken as exc:
+        return user_pb2.TokenValidation(valid=False, error=str(exc))
+    return user_pb2.TokenValidation(
+        valid=True, subject=str(payload.get("sub", "")), expires_at=int(payload.get("exp", 0))
+    )
+
+def validate_tokens(tokens) -> user_pb2.ValidateTokensResponse:
+    # Los repetidos y los ya vistos salen de la caché de tokens de app.auth
+    return user_pb2.ValidateTokensResponse(results=[token_validation(token) for token in tokens])
+
+UPDATABLE_FIELDS = ("username", "email", "password")
+
+def update_fields(request) -> dict:
+    # Sin update_mask se mantiene el comportamiento anterior (sin re-hashear si no hay password)
+    paths = list(request.update_mask.paths)
+    if not paths:
+        fields = {"username": request.username, "email": request.email}
+        if request.password:
+            fields["password"] = request.password
+        return fields
+    unknown = sorted(set(paths) - set(UPDATABLE_FIELDS))
+    if unknown:
+        raise ValueError(f"Campos no actualizables: {', '.join(unknown)}")
+    fields = {path: getattr(request, path) for path in paths}
+    if "password" in fields and not fields["password"]:
+        raise ValueError("La contraseña no puede estar vacía")
+    return fields
+
+def reject_when_unavailable(response_cls):
+    # Si la cola de bcrypt está llena, o aún no hay índice único de email para
+    # las altas, se responde al instante en vez de encolar
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, context):
+            try:
+                return method(self, request, context)
+            except HashingBusyError:
+                context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+                context.set_details('Servidor ocupado, intente de nuevo')
+                return response_cls()
+            except IndexesNotReady:
+                context.set_code(grpc.StatusCode.UNAVAILABLE)
+                context.set_details('Servicio no disponible todavía, intente de nuevo')
+                return response_cls()
+        return wrapper
+    return decorator
+
 class UserService(user_pb2_grpc.UserServiceServicer):
-    def __init__(self):
-        self.db = get_db()
-        self.collection = self.db["users"]
+    def __init__(self, store=None):
+        self.store = store if store is not None else get_user_store()
+        self.cache = get_user_cache()
 
+    @reject_when_unavailable(user_pb2.UserResponse)
     def CreateUser(self, request, context):
         # ¡CORREGIDO! Hashea la contraseña al crear usuario
         hashed_pw = get_password_hash(request.password)
@@ -19,28 +109,38 @@ class UserService(user_pb2_grpc.UserServiceServicer):
             "email": request.email,
             "password": hashed_pw
         }
-        result = self.collection.insert_one(user)
+        try:
+            user_id = self.store.insert(user)
+        except DuplicateKeyError:
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details("Email ya registrado")
+            return user_pb2.UserResponse()
+        self.cache.invalidate(email=user["email"])
         return user_pb2.UserResponse(
-            id=str(result.inserted_id),
+            id=str(user_id),
             username=user["username"],
             email=user["email"]
         )
 
     def GetUser(self, request, context):
         try:
-            user = self.collection.find_one({"_id": ObjectId(request.id)})
+            user_id = ObjectId(request.id)
         except bson_errors.InvalidId:
-            user = None
+            user_id = None
+        user = None
+        if user_id is not None:
+            if request.if_version:
+                version = find_version(self.store, self.cache, user_id=user_id)
+                if version == request.if_version:
+                    return not_modified_response(request, version)
+            user = find_user(self.store, self.cache, user_id=user_id)
         if user:
-            return user_pb2.UserResponse(
-                id=str(user["_id"]),
-                username=user["username"],
-                email=user["email"]
-            )
+            return user_response(user)
         context.set_code(grpc.StatusCode.NOT_FOUND)
         context.set_details('User not found')
         return user_pb2.UserResponse()
 
+    @reject_when_unavailable(user_pb2.UserResponse)
     def UpdateUser(self, request, context):
         try:
             user_id = ObjectId(request.id)
@@ -48,23 +148,24 @@ class UserService(user_pb2_grpc.UserServiceServicer):
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details('Invalid user id')
             return user_pb2.UserResponse()
-        # ¡CORREGIDO! Hashea la contraseña al actualizar usuario
-        hashed_pw = get_password_hash(request.password)
-        result = self.collection.update_one(
-            {"_id": user_id},
-            {"$set": {
-                "username": request.username,
-                "email": request.email,
-                "password": hashed_pw
-            }}
-        )
-        if result.matched_count:
-            user = self.collection.find_one({"_id": user_id})
-            return user_pb2.UserResponse(
-                id=str(user["_id"]),
-                username=user["username"],
-                email=user["email"]
-            )
+        try:
+            fields = update_fields(request)
+        except ValueError as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.UserResponse()
+        # bcrypt solo si llega una contraseña nueva
+        if "password" in fields:
+            fields["password"] = get_password_hash(fields["password"])
+        try:
+            user = self.store.update(user_id, fields)
+        except DuplicateKeyError:
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details("Email ya registrado")
+            return user_pb2.UserResponse()
+        self.cache.invalidate(user_id=user_id, email=fields.get("email"))
+        if user:
+            return user_response(user)
         context.set_code(grpc.StatusCode.NOT_FOUND)
         context.set_details('User not found')
         return user_pb2.UserResponse()
@@ -76,59 +177,193 @@ class UserService(user_pb2_grpc.UserServiceServicer):
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details('Invalid user id')
             return user_pb2.Empty()
-        result = self.collection.delete_one({"_id": user_id})
-        if result.deleted_count == 0:
+        deleted = self.store.delete(user_id)
+        self.cache.invalidate(user_id=user_id)
+        if not deleted:
             context.set_code(grpc.StatusCode.NOT_FOUND)
             context.set_details('User not found')
         return user_pb2.Empty()
 
     def ListUsers(self, request, context):
-        users = self.collection.find()
-        user_list = []
-        for user in users:
-            user_list.append(user_pb2.UserResponse(
-                id=str(user["_id"]),
-                username=user["username"],
-                email=user["email"]
-            ))
-        return user_pb2.UserListResponse(users=user_list)
+        try:
+            users, next_token = self.store.page(request.page_size, request.page_token)
+        except InvalidPageToken:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid page token')
+            return user_pb2.UserListResponse()
+        return user_pb2.UserListResponse(
+            users=[user_response(user) for user in users],
+            next_page_token=next_token
+        )
+
+    def StreamUsers(self, request, context):
+        try:
+            cursor = self.store.iterate(request.page_token)
+        except InvalidPageToken:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details('Invalid page token')
+            return
+        # El cursor trae lotes de batch_size: la memoria no depende del total
+        with cursor:
+            for user in cursor:
+                yield user_response(user)
+
+    # ---------- Lotes ----------
+    def BatchGetUsers(self, request, context):
+        try:
+            check_batch_size(len(request.ids))
+        except BatchTooLarge as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.BatchGetUsersResponse()
+        oids, _ = parse_ids(request.ids)
+        users = find_users(self.store, self.cache, oids) if oids else []
+        found, not_found = order_by_request(request.ids, users)
+        return user_pb2.BatchGetUsersResponse(
+            users=[user_response(user) for user in found],
+            not_found_ids=not_found
+        )
+
+    @reject_when_unavailable(user_pb2.BatchCreateUsersResponse)
+    def BatchCreateUsers(self, request, context):
+        try:
+            check_batch_size(len(request.users))
+        except BatchTooLarge as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.BatchCreateUsersResponse()
+        errors, valid = split_new_users(
+            [(item.username, item.email, item.password) for item in request.users]
+        )
+        hashes = get_password_hashes([password for *_, password in valid])
+        documents = build_documents(valid, hashes)
+        error = None
+        if documents:
+            try:
+                self.store.insert_many([doc for _, doc in documents])
+            except BulkWriteError as exc:
+                error = exc
+        results = [
+            user_pb2.BatchCreateUserResult(index=index, error=message)
+            for index, message in errors.items()
+        ]
+        for index, document, message in insert_outcomes(documents, error):
+            if document is None:
+                results.append(user_pb2.BatchCreateUserResult(index=index, error=message))
+            else:
+                self.cache.invalidate(email=document["email"])
+                results.append(user_pb2.BatchCreateUserResult(
+                    index=index, user=user_response(document)
+                ))
+        results.sort(key=lambda result: result.index)
+        return user_pb2.BatchCreateUsersResponse(results=results)
+
+    def BatchDeleteUsers(self, request, context):
+        try:
+            check_batch_size(len(request.ids))
+        except BatchTooLarge as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.BatchDeleteUsersResponse()
+        oids, invalid = parse_ids(request.ids)
+        deleted = 0
+        if oids:
+            deleted = self.store.delete_many(oids)
+            for oid in oids:
+                self.cache.invalidate(user_id=oid)
+        return user_pb2.BatchDeleteUsersResponse(deleted_count=deleted, invalid_ids=invalid)
 
     # ---------- NUEVOS MÉTODOS gRPC ----------
+    @reject_when_unavailable(user_pb2.RegisterResponse)
     def Register(self, request, context):
-        if self.collection.find_one({"email": request.email}):
-            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
-            context.set_details("Email ya registrado")
-            return user_pb2.RegisterResponse()
         hashed_pw = get_password_hash(request.password)
         user = {
             "username": request.username,
             "email": request.email,
             "password": hashed_pw
         }
-        result = self.collection.insert_one(user)
-        return user_pb2.RegisterResponse(id=str(result.inserted_id))
+        # Un solo insert: el índice único de email detecta el duplicado
+        try:
+            user_id = self.store.insert(user)
+        except DuplicateKeyError:
+            context.set_code(grpc.StatusCode.ALREADY_EXISTS)
+            context.set_details("Email ya registrado")
+            return user_pb2.RegisterResponse()
+        self.cache.invalidate(email=user["email"])
+        return user_pb2.RegisterResponse(id=str(user_id))
 
+    @reject_when_unavailable(user_pb2.LoginResponse)
     def Login(self, request, context):
-        user = self.collection.find_one({"email": request.email})
-        # Agrega debug temporal
-        print("user:", user)
-        print("request.password:", request.password)
-        if user:
-            print("user['password']:", user["password"])
-            print("verify_password result:", verify_password(request.password, user["password"]))
+        limiter = get_login_limiter()
+        try:
+            limiter.check(request.email, peer_address(context.peer()))
+        except LoginThrottled:
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details("Demasiados intentos, intente más tarde")
+            return user_pb2.LoginResponse(access_token="", token_type="")
+        user = self.store.get_by_email(request.email, AUTH_PROJECTION)
         if not user or not verify_password(request.password, user["password"]):
+            limiter.record_failure(request.email)
             context.set_code(grpc.StatusCode.UNAUTHENTICATED)
             context.set_details("Credenciales incorrectas")
             return user_pb2.LoginResponse(access_token="", token_type="")
+        limiter.record_success(request.email)
+        if needs_rehash(user["password"]):
+            rehash_in_background(self.store, user["email"], request.password, user["password"])
         token = create_access_token({"sub": user["email"]})
         return user_pb2.LoginResponse(access_token=token, token_type="bearer")
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    user_pb2_grpc.add_UserServiceServicer_to_server(UserService(), server)
-    server.add_insecure_port('[::]:50051')
+    def ValidateTokens(self, request, context):
+        try:
+            check_batch_size(len(request.tokens))
+        except BatchTooLarge as exc:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(exc))
+            return user_pb2.ValidateTokensResponse()
+        return validate_tokens(request.tokens)
+
+def server_options(reuse_port=GRPC_REUSE_PORT) -> list:
+    return [("grpc.so_reuseport", 1 if reuse_port else 0)]
+
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+def serve(mode=GRPC_SERVER_MODE, port=GRPC_PORT, max_workers=GRPC_MAX_WORKERS,
+          maximum_concurrent_rpcs=GRPC_MAXIMUM_CONCURRENT_RPCS, reuse_port=GRPC_REUSE_PORT,
+          grace=SHUTDOWN_GRACE_SECONDS, metrics_port=METRICS_PORT):
+    if metrics_port:
+        metrics.start_metrics_server(metrics_port)
+    if mode == "aio":
+        from app.aio_service import serve as serve_aio
+        asyncio.run(serve_aio(port, max_workers, maximum_concurrent_rpcs, reuse_port, grace))
+        return
+    if mode != "thread":
+        raise ValueError(f"Modo de servidor gRPC desconocido: {mode}")
+    # Servidor con hilos: se mantiene como alternativa para comparar con aio
+    executor = QueueCountingExecutor(max_workers=max_workers)
+    # El de métricas va fuera para contar también los DEADLINE_EXCEEDED
+    interceptors = [MetricsInterceptor()] if METRICS_ENABLED else []
+    # Con hilos, quien espera hueco ocupa un hilo: los límites se recortan a max_workers
+    set_admission_controller(build_admission_controller(max_threads=max_workers))
+    server = grpc.server(
+        executor,
+        interceptors=interceptors + [
+            DeadlineInterceptor(), AdmissionInterceptor(), CompressionInterceptor()
+        ],
+        options=server_options(reuse_port),
+        maximum_concurrent_rpcs=maximum_concurrent_rpcs,
+    )
+    metrics.GRPC_POOL_QUEUE.set_function(lambda: executor.queued)
+    service = UserService()
+    user_pb2_grpc.add_UserServiceServicer_to_server(service, server)
+    server.add_insecure_port(f'[::]:{port}')
+    threading.Thread(target=service.store.prepare, daemon=True).start()
     server.start()
-    print("gRPC UserService running on port 50051")
+    print(f"gRPC UserService running on port {port}")
+    # Señal de parada: no se aceptan RPCs nuevas y las activas tienen `grace` segundos.
+    # Solo en el hilo principal (no cuando se arranca en un hilo junto a uvicorn).
+    if threading.current_thread() is threading.main_thread():
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, lambda *_: server.stop(grace))
     server.wait_for_termination()
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+import os
+import threading
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+from app.config import JWT_ACTIVE_KID, JWT_KEYS_DIR, JWT_SECRET_KEY
+
+# Firma y verificación de los JWT. Con claves asimétricas cada token lleva el "kid"
+# de la clave que lo firmó y las públicas se sirven en /.well-known/jwks.json: los
+# demás servicios verifican en local, sin compartir secreto ni llamarnos.
+# Rotación: se añade <kid>.pem nueva y se activa (JWT_ACTIVE_KID o nombre mayor);
+# la anterior se deja, o solo su parte pública, hasta que caduquen sus tokens.
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+class SigningKey:
+    # private es None en las claves retiradas: solo verifican y se publican
+    def __init__(self, kid: str, algorithm: str, public, private=None):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.public = public
+        self.private = private
+
+    @classmethod
+    def from_pem(cls, kid: str, pem: str, algorithm: str = None):
+        for candidate in ([algorithm] if algorithm else ASYMMETRIC_ALGORITHMS):
+            try:
+                key = jwk.construct(pem, candidate)
+            except Exception:
+                # Cada backend (rsa, ecdsa, cryptography) falla con sus propias excepciones
+                continue
+            if key.is_public():
+                return cls(kid, candidate, key)
+            return cls(kid, candidate, key.public_key(), key)
+        raise ValueError(f"Clave {kid}: se esperaba RSA o EC P-256 en PEM")
+
+    def jwk(self) -> dict:
+        return dict(self.public.to_dict(), kid=self.kid, use="sig")
+
+class KeyRing:
+    # rsa/ecdsa en Python puro: firmar y verificar cuesta milisegundos de CPU, así que
+    # el código async lo hace fuera del bucle de eventos (ver app.auth)
+    offload = True
+
+    def __init__(self, keys, active_kid: str = ""):
+        self.keys = {key.kid: key for key in keys}
+        signing = [key for key in keys if key.private is not None]
+        if active_kid:
+            self.active = self.keys.get(active_kid)
+        else:
+            self.active = max(signing, key=lambda key: key.kid, default=None)
+        if self.active is None or self.active.private is None:
+            raise ValueError(f"No hay clave privada activa ({active_kid or 'ninguna'})")
+
+    @property
+    def algorithm(self) -> str:
+        return self.active.algorithm
+
+    @classmethod
+    def from_dir(cls, path: str, active_kid: str = ""):
+        keys = []
+        for name in sorted(os.listdir(path)):
+            if not name.endswith(".pem"):
+                continue
+            with open(os.path.join(path, name)) as handle:
+                keys.append(SigningKey.from_pem(name[:-len(".pem")], handle.read()))
+        return cls(keys, active_kid)
+
+    def sign(self, claims: dict) -> str:
+        return jwt.encode(claims, self.active.private, algorithm=self.active.algorithm,
+                          headers={"kid": self.active.kid})
+
+    def key_for(self, token: str) -> SigningKey:
+        key = self.keys.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise JWTError("kid desconocido")
+        return key
+
+    def algorithm_for(self, token: str) -> str:
+        # Algoritmo de la clave que verifica el token, que no tiene por qué ser la activa
+        return self.key_for(token).algorithm
+
+    def verify(self, token: str) -> dict:
+        # Se elige la clave por kid y solo se acepta su algoritmo (nada de "none" ni HS256)
+        key = self.key_for(token)
+        return jwt.decode(token, key.public, algorithms=[key.algorithm])
+
+    def jwks(self) -> dict:
+        return {"keys": [key.jwk() for key in self.keys.values()]}
+
+class SharedSecret:
+    # HS256 con una clave compartida: comportamiento anterior, sin nada que publicar
+    algorithm = "HS256"
+    offload = False
+
+    def __init__(self, secret: str):
+        self.secret = secret
+
+    def algorithm_for(self, token: str) -> str:
+        return self.algorithm
+
+    def sign(self, claims: dict) -> str:
+        return jwt.encode(claims, self.secret, algorithm=self.algorithm)
+
+    def verify(self, token: str) -> dict:
+        return jwt.decode(token, self.secret, algorithms=[self.algorithm])
+
+    def jwks(self) -> dict:
+        return {"keys": []}
+
+def generate_key(algorithm: str = "ES256") -> str:
+    # rsa y ecdsa vienen con python-jose; la clave RSA en Python puro tarda unos segundos
+    if algorithm == "RS256":
+        import rsa
+        _, private = rsa.newkeys(2048)
+        return private.save_pkcs1().decode()
+    if algorithm == "ES256":
+        import ecdsa
+        return ecdsa.SigningKey.generate(curve=ecdsa.NIST256p).to_pem().decode()
+    raise ValueError(f"Algoritmo no soportado: {algorithm}")
+
+def write_key(directory: str, kid: str, algorithm: str = "ES256") -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kid}.pem")
+    # O_EXCL: nunca se sobrescribe una clave con tokens vivos
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as handle:
+        handle.write(generate_key(algorithm))
+    return path
+
+_signer = None
+_signer_lock = threading.Lock()
+
+def get_signer():
+    global _signer
+    with _signer_lock:
+        if _signer is None:
+            _signer = (KeyRing.from_dir(JWT_KEYS_DIR, JWT_ACTIVE_KID) if JWT_KEYS_DIR
+                       else SharedSecret(JWT_SECRET_KEY))
+        return _signer
+
+def set_signer(signer):
+    global _signer
+    with _signer_lock:
+        _signer = signer
@@ -0,0 +1,549 @@
+import bisect
+import itertools
+import threading
+from abc import ABC, abstractmethod
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from app.config import (
+    MONGO_ENSURE_INDEXES, MONGO_USERS_COLLECTION, USER_STORE_BACKEND, USERS_CURSOR_BATCH_SIZE
+)
+from app.database import (
+    ensure_indexes, ensure_indexes_async, get_users_collection, get_async_db,
+    prepare_database, prepare_database_async, require_indexes
+)
+from app.projections import PROFILE_PROJECTION, VERSION_PROJECTION, document_version
+from app.pagination import (
+    USER_LIST_PROJECTION, clamp_page_size, decode_page_token,
+    fetch_page, fetch_page_async, iter_users, split_page
+)
+
+# Acceso a los usuarios detrás de una interfaz: los handlers HTTP y gRPC no
+# llaman a pymongo directamente. Los errores siguen siendo los de pymongo
+# (DuplicateKeyError, BulkWriteError) para no duplicar el manejo en cada motor.
+# Las lecturas devuelven el perfil público salvo que se pida otra proyección
+# (app.projections); projection=None trae el documento entero.
+# Los stores de Mongo lanzan IndexesNotReady en altas y cambios de email mientras
+# el índice único no esté verificado (app.database.indexes_ready).
+class UserStore(ABC):
+    @abstractmethod
+    def get_by_id(self, user_id: ObjectId, projection=PROFILE_PROJECTION):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_by_email(self, email: str, projection=PROFILE_PROJECTION):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many(self, user_ids, projection=PROFILE_PROJECTION) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_version(self, user_id: ObjectId = None, email: str = None):
+        # Versión del usuario (por id o por email) sin traer el perfil; None si no existe
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert(self, user: dict) -> ObjectId:
+        # Rellena user["_id"], como insert_one, y user["version"] = 1
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_many(self, users: list):
+        # Sin orden: los duplicados llegan juntos en un BulkWriteError
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, user_id: ObjectId, fields: dict, projection=PROFILE_PROJECTION):
+        # Incrementa version. Devuelve el documento ya actualizado, o None si no existe
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace_password(self, email: str, old_hash: str, new_hash: str) -> bool:
+        # Solo si el hash sigue siendo old_hash: no pisa un cambio de contraseña concurrente
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, user_id: ObjectId) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_many(self, user_ids) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def page(self, page_size: int, page_token: str = "", filters=None):
+        # filters: igualdad sobre pagination.FILTER_FIELDS
+        raise NotImplementedError
+
+    @abstractmethod
+    def iterate(self, page_token: str = "", projection=PROFILE_PROJECTION, filters=None):
+        # Cursor para `with` + `for`; InvalidPageToken se lanza al llamar
+        raise NotImplementedError
+
+    def prepare(self):
+        pass
+
+    def ensure_indexes(self):
+        # Sin reintentos: para procesos cortos (app.cli) que no deben escribir sin índices
+        pass
+
+# Misma interfaz con corrutinas, para la app FastAPI y grpc.aio.
+# iterate() no es corrutina: devuelve un cursor para `async with` + `async for`.
+class AsyncUserStore(ABC):
+    @abstractmethod
+    async def get_by_id(self, user_id, projection=PROFILE_PROJECTION):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_by_email(self, email, projection=PROFILE_PROJECTION):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_many(self, user_ids, projection=PROFILE_PROJECTION) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_version(self, user_id=None, email=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert(self, user):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_many(self, users):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, user_id, fields, projection=PROFILE_PROJECTION):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def replace_password(self, email, old_hash, new_hash) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, user_id) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_many(self, user_ids) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def page(self, page_size, page_token="", filters=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def iterate(self, page_token="", projection=PROFILE_PROJECTION, filters=None):
+        raise NotImplementedError
+
+    async def prepare(self):
+        pass
+
+    async def ensure_indexes(self):
+        pass
+
+# ---------- MongoDB ----------
+def _version_query(user_id, email):
+    # Con el hint, Mongo responde desde el índice (consulta cubierta, sin FETCH)
+    if user_id is not None:
+        return {"_id": user_id}, "id_version"
+    return {"email": email}, "email_version"
+
+def _missing_hint(exc: OperationFailure) -> bool:
+    # BadValue (2) "hint provided does not correspond to an existing index": los
+    # índices los crea prepare() en segundo plano y puede no haberlo conseguido aún
+    return exc.code == 2 and "hint" in str(exc).lower()
+
+def _with_version(users):
+    for user in users:
+        user.setdefault("version", 1)
+    return users
+
+_BUMP_VERSION = {"$inc": {"version": 1}}
+
+class MongoUserStore(UserStore):
+    def __init__(self, collection=None):
+        self.collection = collection if collection is not None else get_users_collection()
+
+    def get_by_id(self, user_id, projection=PROFILE_PROJECTION):
+        return self.collection.find_one({"_id": user_id}, projection)
+
+    def get_by_email(self, email, projection=PROFILE_PROJECTION):
+        return self.collection.find_one({"email": email}, projection)
+
+    def get_many(self, user_ids, projection=PROFILE_PROJECTION):
+        return list(self.collection.find({"_id": {"$in": list(user_ids)}}, projection))
+
+    def get_version(self, user_id=None, email=None):
+        query, index = _version_query(user_id, email)
+        try:
+            doc = self.collection.find_one(query, VERSION_PROJECTION, hint=index)
+        except OperationFailure as exc:
+            if not _missing_hint(exc):
+                raise
+            # Sin el índice la consulta sigue valiendo, solo que no es cubierta
+            doc = self.collection.find_one(query, VERSION_PROJECTION)
+        return document_version(doc) if doc is not None else None
+
+    def insert(self, user):
+        require_indexes()
+        return self.collection.insert_one(_with_version([user])[0]).inserted_id
+
+    def insert_many(self, users):
+        require_indexes()
+        self.collection.insert_many(_with_version(users), ordered=False)
+
+    def update(self, user_id, fields, projection=PROFILE_PROJECTION):
+        if "email" in fields:
+            require_indexes()
+        return self.collection.find_one_and_update(
+            {"_id": user_id},
+            {"$set": fields, **_BUMP_VERSION},
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def replace_password(self, email, old_hash, new_hash):
+        result = self.collection.update_one(
+            {"email": email, "password": old_hash}, {"$set": {"password": new_hash}}
+        )
+        return bool(result.modified_count)
+
+    def delete(self, user_id):
+        return bool(self.collection.delete_one({"_id": user_id}).deleted_count)
+
+    def delete_many(self, user_ids):
+        return self.collection.delete_many({"_id": {"$in": list(user_ids)}}).deleted_count
+
+    def page(self, page_size, page_token="", filters=None):
+        return fetch_page(self.collection, page_size, page_token, filters)
+
+    def iterate(self, page_token="", projection=PROFILE_PROJECTION, filters=None):
+        return iter_users(self.collection, page_token, projection, filters)
+
+    def prepare(self):
+        prepare_database()
+
+    def ensure_indexes(self):
+        ensure_indexes(self.collection.database, create=MONGO_ENSURE_INDEXES)
+
+class AsyncMongoUserStore(AsyncUserStore):
+    def __init__(self, collection=None):
+        if collection is None:
+            collection = get_async_db()[MONGO_USERS_COLLECTION]
+        self.collection = collection
+
+    async def get_by_id(self, user_id, projection=PROFILE_PROJECTION):
+        return await self.collection.find_one({"_id": user_id}, projection)
+
+    async def get_by_email(self, email, projection=PROFILE_PROJECTION):
+        return await self.collection.find_one({"email": email}, projection)
+
+    async def get_many(self, user_ids, projection=PROFILE_PROJECTION):
+        cursor = self.collection.find({"_id": {"$in": list(user_ids)}}, projection)
+        return await cursor.to_list()
+
+    async def get_version(self, user_id=None, email=None):
+        query, index = _version_query(user_id, email)
+        try:
+            doc = await self.collection.find_one(query, VERSION_PROJECTION, hint=index)
+        except OperationFailure as exc:
+            if not _missing_hint(exc):
+                raise
+            doc = await self.collection.find_one(query, VERSION_PROJECTION)
+        return document_version(doc) if doc is not None else None
+
+    async def insert(self, user):
+        require_indexes()
+        return (await self.collection.insert_one(_with_version([user])[0])).inserted_id
+
+    async def insert_many(self, users):
+        require_indexes()
+        await self.collection.insert_many(_with_version(users), ordered=False)
+
+    async def update(self, user_id, fields, projection=PROFILE_PROJECTION):
+        if "email" in fields:
+            require_indexes()
+        return await self.collection.find_one_and_update(
+            {"_id": user_id},
+            {"$set": fields, **_BUMP_VERSION},
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def replace_password(self, email, old_hash, new_hash):
+        result = await self.collection.update_one(
+            {"email": email, "password": old_hash}, {"$set": {"password": new_hash}}
+        )
+        return bool(result.modified_count)
+
+    async def delete(self, user_id):
+        return bool((await self.collection.delete_one({"_id": user_id})).deleted_count)
+
+    async def delete_many(self, user_ids):
+        result = await self.collection.delete_many({"_id": {"$in": list(user_ids)}})
+        return result.deleted_count
+
+    async def page(self, page_size, page_token="", filters=None):
+        return await fetch_page_async(self.collection, page_size, page_token, filters)
+
+    def iterate(self, page_token="", projection=PROFILE_PROJECTION, filters=None):
+        return iter_users(self.collection, page_token, projection, filters)
+
+    async def prepare(self):
+        await prepare_database_async()
+
+    async def ensure_indexes(self):
+        await ensure_indexes_async(self.collection.database, create=MONGO_ENSURE_INDEXES)
+
+# ---------- Memoria ----------
+def _project(doc, projection):
+    if not projection:
+        return dict(doc)
+    keep = {field for field, included in projection.items() if included}
+    if projection.get("_id", 1):
+        keep.add("_id")
+    return {field: value for field, value in doc.items() if field in keep}
+
+def _matches(doc, filters):
+    return all(doc.get(field) == value for field, value in filters.items())
+
+def _duplicate_email(email):
+    return DuplicateKeyError(f"E11000 duplicate key error: email {email}", 11000)
+
+class _MemoryCursor:
+    # Recorre los ids ordenados por lotes, tomando el lock solo por lote
+    def __init__(self, store, after, projection, filters=None,
+                 batch_size=USERS_CURSOR_BATCH_SIZE):
+        self._store = store
+        self._after = after
+        self._projection = projection
+        self._filters = filters
+        self._batch_size = batch_size
+
+    def __iter__(self):
+        while True:
+            batch, last = self._store._slice(
+                self._after, self._batch_size, self._projection, self._filters
+            )
+            yield from batch
+            if len(batch) < self._batch_size:
+                return
+            self._after = last
+
+    async def __aiter__(self):
+        for user in self:
+            yield user
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class MemoryUserStore(UserStore):
+    # Índices en dicts por _id y por email, y los ids ordenados para paginar.
+    # Sirve para pruebas y benchmarks: aísla el coste de CPU propio de la latencia de Mongo.
+    def __init__(self):
+        self._docs = {}
+        self._emails = {}
+        self._ids = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _insert(self, user):
+        user.setdefault("_id", ObjectId())
+        user.setdefault("version", 1)
+        if user.get("email") in self._emails:
+            raise _duplicate_email(user.get("email"))
+        self._docs[user["_id"]] = dict(user)
+        self._emails[user.get("email")] = user["_id"]
+        bisect.insort(self._ids, user["_id"])
+
+    def _remove(self, user_id):
+        doc = self._docs.pop(user_id, None)
+        if doc is None:
+            return False
+        self._emails.pop(doc.get("email"), None)
+        del self._ids[bisect.bisect_left(self._ids, user_id)]
+        return True
+
+    def _slice(self, after, count, projection, filters=None):
+        # Devuelve también el último _id, por si la proyección lo excluye
+        with self._lock:
+            start = bisect.bisect_right(self._ids, after) if after is not None else 0
+            if not filters:
+                ids = self._ids[start:start + count]
+            elif set(filters) == {"email"}:
+                oid = self._emails.get(filters["email"])
+                ids = [oid] if oid is not None and (after is None or oid > after) else []
+            else:
+                ids = list(itertools.islice(
+                    (oid for oid in itertools.islice(self._ids, start, None)
+                     if _matches(self._docs[oid], filters)),
+                    count
+                ))
+            docs = [_project(self._docs[oid], projection) for oid in ids]
+        return docs, ids[-1] if ids else None
+
+    def get_by_id(self, user_id, projection=PROFILE_PROJECTION):
+        with self._lock:
+            doc = self._docs.get(user_id)
+            return _project(doc, projection) if doc is not None else None
+
+    def get_by_email(self, email, projection=PROFILE_PROJECTION):
+        with self._lock:
+            user_id = self._emails.get(email)
+            return _project(self._docs[user_id], projection) if user_id is not None else None
+
+    def get_many(self, user_ids, projection=PROFILE_PROJECTION):
+        with self._lock:
+            return [
+                _project(self._docs[oid], projection)
+                for oid in dict.fromkeys(user_ids) if oid in self._docs
+            ]
+
+    def get_version(self, user_id=None, email=None):
+        with self._lock:
+            if user_id is None:
+                user_id = self._emails.get(email)
+            doc = self._docs.get(user_id)
+            return document_version(doc) if doc is not None else None
+
+    def insert(self, user):
+        with self._lock:
+            self._insert(user)
+        return user["_id"]
+
+    def insert_many(self, users):
+        errors = []
+        with self._lock:
+            for index, user in enumerate(users):
+                try:
+                    self._insert(user)
+                except DuplicateKeyError as exc:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(exc)})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(users) - len(errors)})
+
+    def update(self, user_id, fields, projection=PROFILE_PROJECTION):
+        with self._lock:
+            doc = self._docs.get(user_id)
+            if doc is None:
+                return None
+            email = fields.get("email", doc.get("email"))
+            owner = self._emails.get(email)
+            if owner is not None and owner != user_id:
+                raise _duplicate_email(email)
+            self._emails.pop(doc.get("email"), None)
+            doc.update(fields)
+            doc["version"] = document_version(doc) + 1
+            self._emails[doc.get("email")] = user_id
+            return _project(doc, projection)
+
+    def replace_password(self, email, old_hash, new_hash):
+        with self._lock:
+            user_id = self._emails.get(email)
+            if user_id is None or self._docs[user_id].get("password") != old_hash:
+                return False
+            self._docs[user_id]["password"] = new_hash
+            return True
+
+    def delete(self, user_id):
+        with self._lock:
+            return self._remove(user_id)
+
+    def delete_many(self, user_ids):
+        with self._lock:
+            return sum(self._remove(oid) for oid in set(user_ids))
+
+    def page(self, page_size, page_token="", filters=None):
+        size = clamp_page_size(page_size)
+        after = decode_page_token(page_token)
+        users, _ = self._slice(after, size + 1, USER_LIST_PROJECTION, filters)
+        return split_page(users, size)
+
+    def iterate(self, page_token="", projection=PROFILE_PROJECTION, filters=None):
+        return _MemoryCursor(self, decode_page_token(page_token), projection, filters)
+
+class AsyncMemoryUserStore(AsyncUserStore):
+    # Envuelve un MemoryUserStore: las operaciones son en memoria y no bloquean el loop
+    def __init__(self, store: MemoryUserStore = None):
+        self.store = store if store is not None else MemoryUserStore()
+
+    async def get_by_id(self, user_id, projection=PROFILE_PROJECTION):
+        return self.store.get_by_id(user_id, projection)
+
+    async def get_by_email(self, email, projection=PROFILE_PROJECTION):
+        return self.store.get_by_email(email, projection)
+
+    async def get_many(self, user_ids, projection=PROFILE_PROJECTION):
+        return self.store.get_many(user_ids, projection)
+
+    async def get_version(self, user_id=None, email=None):
+        return self.store.get_version(user_id, email)
+
+    async def insert(self, user):
+        return self.store.insert(user)
+
+    async def insert_many(self, users):
+        self.store.insert_many(users)
+
+    async def update(self, user_id, fields, projection=PROFILE_PROJECTION):
+        return self.store.update(user_id, fields, projection)
+
+    async def replace_password(self, email, old_hash, new_hash):
+        return self.store.replace_password(email, old_hash, new_hash)
+
+    async def delete(self, user_id):
+        return self.store.delete(user_id)
+
+    async def delete_many(self, user_ids):
+        return self.store.delete_many(user_ids)
+
+    async def page(self, page_size, page_token="", filters=None):
+        return self.store.page(page_size, page_token, filters)
+
+    def iterate(self, page_token="", projection=PROFILE_PROJECTION, filters=None):
+        return self.store.iterate(page_token, projection, filters)
+
+# ---------- Registro ----------
+# USER_STORE_BACKEND elige el motor. Con "memory" las dos interfaces comparten
+# los mismos datos, así HTTP y gRPC ven los mismos usuarios en un proceso.
+_backends = {
+    "mongo": (MongoUserStore, AsyncMongoUserStore),
+    "memory": (MemoryUserStore, lambda: AsyncMemoryUserStore(get_user_store())),
+}
+
+def register_backend(name: str, factory, async_factory):
+    _backends[name] = (factory, async_factory)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_user_store() -> UserStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = _backends[USER_STORE_BACKEND][0]()
+        return _store
+
+def set_user_store(store: UserStore):
+    global _store
+    with _store_lock:
+        _store = store
+
+def get_async_user_store() -> AsyncUserStore:
+    # Con Mongo, el cliente async queda ligado al event loop que llama
+    return _backends[USER_STORE_BACKEND][1]()
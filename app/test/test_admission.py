@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+from concurrent import futures
+import grpc
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app import admission, deadline, metrics
+from app.admission import (
+    AdmissionController, AdmissionLimiter, AdmissionRejected, set_admission_controller
+)
+from app.aio_service import AsyncUserService
+from app.instrumentation import (
+    AdmissionInterceptor, AdmissionMiddleware, AsyncAdmissionInterceptor
+)
+from app.service import UserService
+from app.store import AsyncMemoryUserStore, MemoryUserStore
+import app.proto.user_pb2 as user_pb2
+import app.proto.user_pb2_grpc as user_pb2_grpc
+
+@pytest.fixture
+def saturated():
+    # Clase password llena y sin cola; lecturas con hueco de sobra
+    password = AdmissionLimiter(admission.PASSWORD, limit=1, max_queue=0)
+    controller = AdmissionController([
+        password,
+        AdmissionLimiter(admission.READ, limit=4),
+        AdmissionLimiter(admission.STREAM, limit=1),
+    ])
+    set_admission_controller(controller)
+    password.acquire()
+    yield controller
+    password.release()
+    set_admission_controller(None)
+
+def test_classification():
+    assert admission.rpc_class("Login") == admission.PASSWORD
+    assert admission.rpc_class("StreamUsers") == admission.STREAM
+    assert admission.rpc_class("GetUser") == admission.READ
+    assert admission.http_class("POST", "/login") == admission.PASSWORD
+    assert admission.http_class("PUT", "/users/abc") == admission.PASSWORD
+    assert admission.http_class("PATCH", "/users/abc") == admission.PASSWORD
+    assert admission.http_class("GET", "/users/abc") == admission.READ
+    assert admission.http_class("POST", "/users/batch/get") == admission.READ
+    assert admission.http_class("GET", "/users/export") == admission.STREAM
+    assert admission.http_class("GET", "/metrics") is None
+
+def test_limiter_hands_off_in_order_and_times_out():
+    limiter = AdmissionLimiter("test", limit=1, max_queue=1, queue_timeout=0.05)
+    limiter.acquire()
+    with pytest.raises(AdmissionRejected) as exc:
+        limiter.acquire()
+    assert exc.value.reason == "queue_timeout"
+    assert limiter.queued == 0
+
+    limiter.queue_timeout = 5
+    waiter = threading.Thread(target=limiter.acquire)
+    waiter.start()
+    while not limiter.queued:
+        time.sleep(0.001)
+    # Con la cola llena se rechaza sin esperar
+    with pytest.raises(AdmissionRejected) as exc:
+        limiter.acquire()
+    assert exc.value.reason == "queue_full"
+    limiter.release()
+    waiter.join(1)
+    assert not waiter.is_alive()
+    assert (limiter.active, limiter.queued) == (1, 0)
+    limiter.release()
+    assert limiter.active == 0
+
+def test_queue_wait_bounded_by_deadline():
+    limiter = AdmissionLimiter("test", limit=1, max_queue=1, queue_timeout=5)
+    limiter.acquire()
+    start = time.monotonic()
+    with deadline.budget(0.05), pytest.raises(AdmissionRejected):
+        limiter.acquire()
+    assert time.monotonic() - start < 1
+    with deadline.budget(0), pytest.raises(AdmissionRejected) as exc:
+        limiter.acquire()
+    assert exc.value.reason == "deadline"
+
+def test_sustained_queueing_switches_to_short_waits():
+    now = [0.0]
+    limiter = AdmissionLimiter("test", limit=1, max_queue=4, queue_timeout=0.5,
+                               target=0.02, interval=0.5, clock=lambda: now[0])
+    limiter.acquire()
+    with limiter._lock:
+        limiter._observe(0.1)
+        now[0] = 0.3
+        limiter._observe(0.1)
+        assert not limiter.overloaded
+        now[0] = 0.6
+        limiter._observe(0.1)
+    assert limiter.overloaded
+    _, timeout = limiter._enter(lambda: None)
+    assert timeout == 0.02
+    # Una espera por debajo del objetivo vuelve al modo normal
+    with limiter._lock:
+        limiter._observe(0.0)
+    assert not limiter.overloaded
+
+def test_cancelled_async_waiters_do_not_leak_slots():
+    limiter = AdmissionLimiter("test", limit=1, max_queue=2, queue_timeout=5)
+
+    async def run():
+        await limiter.acquire_async()
+        waiting = asyncio.create_task(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert limiter.queued == 0
+        # Cancelada justo cuando recibe el hueco: o lo devuelve o se lo queda
+        granted = asyncio.create_task(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        limiter.release()
+        granted.cancel()
+        try:
+            await granted
+            limiter.release()
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    assert (limiter.active, limiter.queued) == (0, 0)
+
+def test_from_config_leaves_threads_for_reads():
+    controller = AdmissionController.from_config(max_threads=8)
+    password = controller.get(admission.PASSWORD)
+    stream = controller.get(admission.STREAM)
+    assert password.limit + password.max_queue <= 4
+    assert stream.limit + stream.max_queue <= 2
+
+def test_grpc_reads_pass_while_passwords_rejected(saturated):
+    store = MemoryUserStore()
+    user_id = store.insert({"username": "u", "email": "e@x", "password": "hash"})
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2),
+                         interceptors=[AdmissionInterceptor()])
+    user_pb2_grpc.add_UserServiceServicer_to_server(UserService(store), server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    before = metrics.ADMISSION_REJECTED.value(endpoint="password", reason="queue_full")
+    try:
+        with grpc.insecure_channel(f"localhost:{port}") as channel:
+            stub = user_pb2_grpc.UserServiceStub(channel)
+            with pytest.raises(grpc.RpcError) as exc:
+                stub.Login(user_pb2.LoginRequest(email="e@x", password="pw"))
+            assert exc.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+            assert stub.GetUser(user_pb2.GetUserRequest(id=str(user_id))).email == "e@x"
+            assert len(list(stub.StreamUsers(user_pb2.ListUsersRequest()))) == 1
+        assert metrics.ADMISSION_REJECTED.value(endpoint="password", reason="queue_full") == before + 1
+        assert saturated.get(admission.READ).active == 0
+    finally:
+        server.stop(None)
+
+def test_aio_rejects_passwords(saturated):
+    store = AsyncMemoryUserStore()
+
+    async def run():
+        server = grpc.aio.server(interceptors=[AsyncAdmissionInterceptor()])
+        user_pb2_grpc.add_UserServiceServicer_to_server(AsyncUserService(store), server)
+        port = server.add_insecure_port("localhost:0")
+        await server.start()
+        try:
+            async with grpc.aio.insecure_channel(f"localhost:{port}") as channel:
+                stub = user_pb2_grpc.UserServiceStub(channel)
+                with pytest.raises(grpc.aio.AioRpcError) as exc:
+                    await stub.Register(user_pb2.RegisterRequest(
+                        username="u", email="e@x", password="pw"))
+                assert exc.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+                with pytest.raises(grpc.aio.AioRpcError) as exc:
+                    await stub.GetUser(user_pb2.GetUserRequest(id=str(ObjectId())))
+                assert exc.value.code() == grpc.StatusCode.NOT_FOUND
+        finally:
+            await server.stop(None)
+
+    asyncio.run(run())
+
+def test_http_returns_503_for_passwords_only(saturated):
+    api = FastAPI()
+    api.add_middleware(AdmissionMiddleware)
+
+    @api.post("/login")
+    async def login():
+        return {}
+
+    @api.get("/users/{user_id}")
+    async def get_user(user_id: str):
+        return {"id": user_id}
+
+    @api.patch("/users/{user_id}")
+    async def patch_user(user_id: str):
+        return {"id": user_id}
+
+    client = TestClient(api)
+    resp = client.post("/login")
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    assert client.patch("/users/abc").status_code == 503
+    assert client.get("/users/abc").json() == {"id": "abc"}
+    assert saturated.get(admission.READ).active == 0
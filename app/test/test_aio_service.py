@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+import grpc
+from app.aio_service import AsyncUserService
+from app.auth import create_access_token
+from app.database import indexes_ready
+from app.ratelimit import LoginLimiter, set_login_limiter
+from app.store import AsyncMongoUserStore
+import app.proto.user_pb2 as user_pb2
+import app.proto.user_pb2_grpc as user_pb2_grpc
+
+class DummyContext:
+    def __init__(self):
+        self.code = None
+        self.details = None
+    def set_code(self, code):
+        self.code = code
+    def set_details(self, details):
+        self.details = details
+    def peer(self):
+        return "ipv4:127.0.0.1:50000"
+
+class AsyncCursor:
+    def __init__(self, docs):
+        self.docs = docs
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, *exc):
+        return False
+    def __aiter__(self):
+        return self._iter()
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+@pytest.fixture
+def collection():
+    mock_collection = MagicMock()
+    mock_collection.find_one = AsyncMock(return_value=None)
+    mock_collection.insert_one = AsyncMock()
+    mock_collection.update_one = AsyncMock()
+    mock_collection.delete_one = AsyncMock()
+    indexes_ready.set()
+    yield mock_collection
+    indexes_ready.clear()
+
+@pytest.fixture
+def service(collection):
+    set_login_limiter(LoginLimiter())
+    return AsyncUserService(AsyncMongoUserStore(collection))
+
+def test_create_user(service, collection):
+    collection.insert_one.return_value.inserted_id = "123"
+    with patch("app.aio_service.get_password_hash_async", AsyncMock(return_value="hashed")):
+        req = user_pb2.CreateUserRequest(username="user", email="mail@test.com", password="pw")
+        resp = asyncio.run(service.CreateUser(req, DummyContext()))
+    assert resp.id == "123"
+    assert collection.insert_one.call_args[0][0]["password"] == "hashed"
+
+def test_get_user_found(service, collection):
+    oid = ObjectId()
+    collection.find_one.return_value = {"_id": oid, "username": "u", "email": "e"}
+    resp = asyncio.run(service.GetUser(user_pb2.GetUserRequest(id=str(oid)), DummyContext()))
+    assert resp.id == str(oid)
+    assert resp.username == "u"
+
+def test_get_user_not_found(service):
+    ctx = DummyContext()
+    asyncio.run(service.GetUser(user_pb2.GetUserRequest(id="notfound"), ctx))
+    assert ctx.code == grpc.StatusCode.NOT_FOUND
+
+def test_update_user_invalid_id(service):
+    ctx = DummyContext()
+    asyncio.run(service.UpdateUser(user_pb2.UpdateUserRequest(id="X"), ctx))
+    assert ctx.code == grpc.StatusCode.INVALID_ARGUMENT
+
+def test_list_users(service, collection):
+    docs = [{"_id": ObjectId(), "username": f"u{i}", "email": f"e{i}"} for i in range(3)]
+    page = collection.find.return_value.sort.return_value.limit.return_value.batch_size.return_value
+    page.to_list = AsyncMock(return_value=docs)
+    resp = asyncio.run(service.ListUsers(user_pb2.ListUsersRequest(page_size=2), DummyContext()))
+    assert [u.username for u in resp.users] == ["u0", "u1"]
+    assert resp.next_page_token
+
+def test_stream_users(service, collection):
+    docs = [{"_id": ObjectId(), "username": f"u{i}", "email": f"e{i}"} for i in range(3)]
+    collection.find.return_value.sort.return_value.batch_size.return_value = AsyncCursor(docs)
+    async def collect():
+        return [u async for u in service.StreamUsers(user_pb2.ListUsersRequest(), DummyContext())]
+    assert [u.username for u in asyncio.run(collect())] == ["u0", "u1", "u2"]
+
+def test_login_fail(service, collection):
+    collection.find_one.return_value = {"email": "e", "password": "hashed"}
+    with patch("app.aio_service.verify_password_async", AsyncMock(return_value=False)):
+        ctx = DummyContext()
+        asyncio.run(service.Login(user_pb2.LoginRequest(email="e", password="pw"), ctx))
+    assert ctx.code == grpc.StatusCode.UNAUTHENTICATED
+
+def test_validate_tokens(service):
+    req = user_pb2.ValidateTokensRequest(tokens=[create_access_token({"sub": "a"}), "x"])
+    resp = asyncio.run(service.ValidateTokens(req, DummyContext()))
+    assert [(result.valid, result.subject) for result in resp.results] == [(True, "a"), (False, "")]
+
+def test_aio_server_roundtrip(collection):
+    oid = ObjectId()
+    collection.find_one.return_value = {"_id": oid, "username": "u", "email": "e"}
+
+    async def run():
+        server = grpc.aio.server()
+        user_pb2_grpc.add_UserServiceServicer_to_server(AsyncUserService(AsyncMongoUserStore(collection)), server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        await server.start()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+                stub = user_pb2_grpc.UserServiceStub(channel)
+                return await stub.GetUser(user_pb2.GetUserRequest(id=str(oid)))
+        finally:
+            await server.stop(None)
+
+    assert asyncio.run(run()).username == "u"
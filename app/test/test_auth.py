@@ -1,4 +1,7 @@
+from datetime import timedelta
+from unittest.mock import patch
 import pytest
+from fastapi import HTTPException
 from app.auth import get_password_hash, verify_password, create_access_token, decode_access_token
 
 def test_hash_and_verify():
@@ -10,4 +13,23 @@ def test_hash_and_verify():
 def test_jwt_token():
     token = create_access_token({"sub": "testuser"})
     payload = decode_access_token(token)
-    assert payload["sub"] == "testuser"
\ No newline at end of file
+    assert payload["sub"] == "testuser"
+
+def test_jwt_token_cached():
+    token = create_access_token({"sub": "cached"})
+    decode_access_token(token)
+    with patch("app.signing.jwt.decode", side_effect=AssertionError("no debería verificar")):
+        assert decode_access_token(token)["sub"] == "cached"
+
+def test_invalid_token_cached_negatively():
+    with pytest.raises(HTTPException):
+        decode_access_token("token.no.valido")
+    with patch("app.signing.jwt.decode") as decode:
+        with pytest.raises(HTTPException):
+            decode_access_token("token.no.valido")
+        decode.assert_not_called()
+
+def test_expired_token_not_served_from_cache():
+    token = create_access_token({"sub": "old"}, expires_delta=timedelta(seconds=-1))
+    with pytest.raises(HTTPException):
+        decode_access_token(token)
@@ -0,0 +1,39 @@
+import pytest
+from unittest.mock import patch
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from app import batch
+from app.batch import (
+    BatchTooLarge, check_batch_size, parse_ids, order_by_request,
+    split_new_users, build_documents, insert_outcomes
+)
+
+def test_parse_ids():
+    oid = ObjectId()
+    oids, invalid = parse_ids([str(oid), "malo"])
+    assert oids == [oid]
+    assert invalid == ["malo"]
+
+def test_order_by_request_keeps_order():
+    first, second = ObjectId(), ObjectId()
+    users = [{"_id": second, "email": "b"}, {"_id": first, "email": "a"}]
+    found, not_found = order_by_request([str(first), "malo", str(second), str(ObjectId())], users)
+    assert [user["email"] for user in found] == ["a", "b"]
+    assert len(not_found) == 2
+
+def test_check_batch_size():
+    with patch.object(batch, "USERS_MAX_BATCH_SIZE", 2):
+        check_batch_size(2)
+        with pytest.raises(BatchTooLarge):
+            check_batch_size(3)
+
+def test_insert_outcomes_reports_duplicates():
+    errors, valid = split_new_users([("a", "a@x", "pw"), ("b", "", "pw"), ("c", "c@x", "pw")])
+    assert errors == {1: "Email y contraseña son obligatorios"}
+    documents = build_documents(valid, ["h1", "h2"])
+    for _, document in documents:
+        document["_id"] = ObjectId()
+    error = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "dup"}]})
+    outcomes = insert_outcomes(documents, error)
+    assert outcomes[0][0] == 0 and outcomes[0][1]["password"] == "h1"
+    assert outcomes[1] == (2, None, "Email ya registrado")
@@ -0,0 +1,133 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from bson import ObjectId
+from app.cache import LRUUserCache, MISS, find_user, find_user_async
+from app.projections import PROFILE_PROJECTION
+from app.store import AsyncMongoUserStore, MongoUserStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def make_user(email="e@test.com"):
+    return {"_id": ObjectId(), "username": "u", "email": email, "password": "hash"}
+
+def test_set_and_get_by_id_and_email():
+    cache = LRUUserCache(max_size=10, ttl=60, negative_ttl=5)
+    user = make_user()
+    cache.set(user)
+    assert cache.get_by_id(user["_id"])["username"] == "u"
+    assert cache.get_by_email("e@test.com")["_id"] == user["_id"]
+    assert "password" not in cache.get_by_id(user["_id"])
+    assert cache.stats()["hits"] == 3
+
+def test_ttl_expiration():
+    clock = FakeClock()
+    cache = LRUUserCache(max_size=10, ttl=60, negative_ttl=5, clock=clock)
+    user = make_user()
+    cache.set(user)
+    clock.now = 61
+    assert cache.get_by_id(user["_id"]) is MISS
+    assert cache.stats()["expirations"] == 1
+
+def test_negative_caching():
+    clock = FakeClock()
+    cache = LRUUserCache(max_size=10, ttl=60, negative_ttl=5, clock=clock)
+    cache.set_missing(email="nadie@test.com")
+    assert cache.get_by_email("nadie@test.com") is None
+    assert cache.stats()["negative_hits"] == 1
+    clock.now = 6
+    assert cache.get_by_email("nadie@test.com") is MISS
+
+def test_lru_eviction():
+    cache = LRUUserCache(max_size=4, ttl=60, negative_ttl=5)
+    first, second, third = make_user("a"), make_user("b"), make_user("c")
+    cache.set(first)
+    cache.set(second)
+    cache.get_by_id(first["_id"])
+    cache.set(third)
+    # Salen las dos claves menos usadas: el email de first y el id de second
+    assert cache.get_by_email("a") is MISS
+    assert cache.get_by_id(second["_id"]) is MISS
+    assert cache.get_by_id(first["_id"]) is not MISS
+    assert cache.stats()["evictions"] == 2
+
+def test_invalidate_removes_both_keys():
+    cache = LRUUserCache(max_size=10, ttl=60, negative_ttl=5)
+    user = make_user()
+    cache.set(user)
+    cache.invalidate(user_id=user["_id"])
+    assert cache.get_by_id(user["_id"]) is MISS
+    assert cache.get_by_email("e@test.com") is MISS
+    assert cache.stats()["size"] == 0
+
+def test_invalidate_finds_old_email_after_id_eviction():
+    cache = LRUUserCache(max_size=4, ttl=60, negative_ttl=5)
+    user, other, third = make_user("old@test.com"), make_user("b"), make_user("c")
+    cache.set(user)
+    cache.set(other)
+    cache.get_by_email("old@test.com")
+    cache.set(third)
+    assert cache.get_by_id(user["_id"]) is MISS
+    # Cambio de email: el perfil bajo el email anterior no sobrevive
+    cache.invalidate(user_id=user["_id"], email="new@test.com")
+    assert cache.get_by_email("old@test.com") is MISS
+    assert len(cache._emails) <= cache.stats()["size"]
+
+def test_find_user_reads_through():
+    cache = LRUUserCache(max_size=10, ttl=60, negative_ttl=5)
+    user = make_user()
+    collection = MagicMock()
+    collection.find_one.return_value = user
+    store = MongoUserStore(collection)
+    assert find_user(store, cache, user_id=user["_id"])["email"] == "e@test.com"
+    assert find_user(store, cache, email="e@test.com")["_id"] == user["_id"]
+    collection.find_one.assert_called_once_with({"_id": user["_id"]}, PROFILE_PROJECTION)
+
+def test_find_user_async_caches_miss():
+    cache = LRUUserCache(max_size=10, ttl=60, negative_ttl=5)
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=None)
+    store = AsyncMongoUserStore(collection)
+    async def run():
+        await find_user_async(store, cache, email="nadie@test.com")
+        return await find_user_async(store, cache, email="nadie@test.com")
+    assert asyncio.run(run()) is None
+    collection.find_one.assert_awaited_once()
+
+def test_find_user_skips_fill_invalidated_during_read():
+    cache = LRUUserCache(max_size=10, ttl=60, negative_ttl=5)
+    user = make_user()
+    collection = MagicMock()
+    def read_then_update(*args):
+        # Un PUT concurrente invalida mientras la lectura está en curso
+        cache.invalidate(user_id=user["_id"], email="e@test.com")
+        return user
+    collection.find_one.side_effect = read_then_update
+    store = MongoUserStore(collection)
+    assert find_user(store, cache, user_id=user["_id"])["_id"] == user["_id"]
+    assert cache.get_by_id(user["_id"]) is MISS
+    assert cache.get_by_email("e@test.com") is MISS
+
+def test_invalidate_other_key_keeps_fill():
+    cache = LRUUserCache(max_size=10, ttl=60, negative_ttl=5)
+    user, other = make_user(), make_user("b")
+    since = cache.generation()
+    cache.invalidate(user_id=other["_id"])
+    cache.set(user, since=since)
+    cache.set_missing(email="nadie@test.com", since=since)
+    assert cache.get_by_id(user["_id"]) is not MISS
+    assert cache.get_by_email("nadie@test.com") is None
+
+def test_stale_fill_skipped_after_generation_trimmed():
+    cache = LRUUserCache(max_size=2, ttl=60, negative_ttl=5)
+    user = make_user()
+    since = cache.generation()
+    cache.invalidate(user_id=user["_id"], email="e@test.com")
+    for n in range(3):
+        cache.invalidate(email=f"{n}@test.com")
+    # Ya no se recuerda la clave concreta, pero el relleno es anterior al suelo
+    cache.set(user, since=since)
+    assert cache.get_by_id(user["_id"]) is MISS
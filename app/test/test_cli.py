@@ -0,0 +1,98 @@
+import io
+import json
+import sys
+from unittest.mock import MagicMock, patch
+from app import cli
+from app.database import IndexVerificationError
+from app.auth import get_password_hash
+from app.store import MemoryUserStore
+
+HASH = get_password_hash("pw")
+
+def fake_hashes(passwords):
+    return [f"hash:{password}" for password in passwords]
+
+def quiet():
+    return cli.Progress("test", stream=io.StringIO())
+
+def ndjson(rows):
+    return io.StringIO("".join(json.dumps(row) + "\n" for row in rows))
+
+def test_import_hashes_plain_and_keeps_prehashed():
+    store = MemoryUserStore()
+    rows = cli.read_rows(ndjson([
+        {"username": "a", "email": "a@x", "password": "pw"},
+        {"username": "b", "email": "b@x", "password_hash": HASH},
+        {"username": "c", "email": "c@x", "password_hash": "no-es-bcrypt"},
+        {"username": "d"},
+    ]), "ndjson")
+    errors = io.StringIO()
+    stats = cli.import_users(store, rows, batch_size=2, hash_many=fake_hashes,
+                             progress=quiet(), errors_out=errors)
+    assert stats == {"inserted": 2, "duplicates": 0, "errors": 2, "skipped": 0}
+    assert store.get_by_email("a@x", {"password": 1})["password"] == "hash:pw"
+    assert store.get_by_email("b@x", {"password": 1})["password"] == HASH
+    assert [json.loads(line)["row"] for line in errors.getvalue().splitlines()] == [2, 3]
+
+def test_import_resumes_from_checkpoint(tmp_path):
+    store = MemoryUserStore()
+    rows = [{"username": f"u{i}", "email": f"u{i}@x", "password": "pw"} for i in range(5)]
+    checkpoint = cli.Checkpoint(str(tmp_path / "import.progress"))
+    checkpoint.save(3)
+    stats = cli.import_users(store, iter(rows), batch_size=2, hash_many=fake_hashes,
+                             checkpoint=checkpoint, progress=quiet())
+    assert stats["inserted"] == 2 and stats["skipped"] == 3
+    assert store.get_by_email("u2@x") is None and store.get_by_email("u3@x")
+    assert not (tmp_path / "import.progress").exists()
+
+def test_import_counts_duplicates():
+    store = MemoryUserStore()
+    store.insert({"username": "a", "email": "a@x", "password": HASH})
+    rows = [{"username": "a", "email": "a@x", "password": "pw"},
+            {"username": "b", "email": "b@x", "password": "pw"}]
+    stats = cli.import_users(store, iter(rows), hash_many=fake_hashes, progress=quiet())
+    assert stats["inserted"] == 1 and stats["duplicates"] == 1
+
+def test_csv_export_import_roundtrip():
+    source = MemoryUserStore()
+    for i in range(3):
+        source.insert({"username": f"u{i}", "email": f"u{i}@x", "password": HASH})
+    out = io.StringIO()
+    assert cli.export_users(source, out, "csv", with_password=True, progress=quiet()) == 3
+    target = MemoryUserStore()
+    stats = cli.import_users(target, cli.read_rows(io.StringIO(out.getvalue()), "csv"),
+                             hash_many=fake_hashes, progress=quiet())
+    assert stats["inserted"] == 3
+    assert target.get_by_email("u1@x", {"password": 1})["password"] == HASH
+
+def test_export_ndjson_omits_password_by_default():
+    store = MemoryUserStore()
+    store.insert({"username": "a", "email": "a@x", "password": HASH})
+    out = io.StringIO()
+    cli.export_users(store, out, progress=quiet())
+    assert set(json.loads(out.getvalue())) == {"id", "username", "email"}
+
+def test_import_aborts_without_unique_index(tmp_path):
+    path = tmp_path / "users.ndjson"
+    path.write_text(json.dumps({"username": "a", "email": "a@x", "password": "pw"}) + "\n")
+    store = MagicMock()
+    store.ensure_indexes.side_effect = IndexVerificationError("email_1")
+    with patch.object(cli, "get_user_store", return_value=store):
+        assert cli.main(["import", str(path)]) == 2
+    store.insert_many.assert_not_called()
+    assert not (tmp_path / "users.ndjson.progress").exists()
+
+def test_export_to_stdout_leaves_it_open(capsys):
+    store = MemoryUserStore()
+    store.insert({"username": "a", "email": "a@x", "password": HASH})
+    with patch.object(cli, "get_user_store", return_value=store):
+        assert cli.main(["export", "-"]) == 0
+    assert not sys.stdout.closed
+    assert json.loads(capsys.readouterr().out)["email"] == "a@x"
+
+def test_calibrate_picks_largest_cost_under_target():
+    timings = {4: 0.002, 5: 0.004, 6: 0.008, 7: 0.016}
+    def measure(context, samples):
+        return timings[context.handler("bcrypt").default_rounds]
+    assert cli.calibrate("bcrypt", target_ms=10, measure=measure, out=io.StringIO()) == 6
+    assert cli.calibrate("bcrypt", target_ms=1, measure=measure, out=io.StringIO()) == 4
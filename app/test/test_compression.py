@@ -0,0 +1,112 @@
+import zlib
+from concurrent import futures
+from unittest.mock import MagicMock, patch
+import grpc
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from app import compression, metrics
+from app.instrumentation import CompressionInterceptor, CompressionMiddleware
+from app.service import UserService
+from app.store import MemoryUserStore
+import app.proto.user_pb2 as user_pb2
+import app.proto.user_pb2_grpc as user_pb2_grpc
+
+def test_negotiate():
+    offered = ("gzip", "deflate")
+    assert compression.negotiate("gzip, deflate, br", offered) == "gzip"
+    assert compression.negotiate("gzip;q=0, deflate", offered) == "deflate"
+    assert compression.negotiate("*", offered) == "gzip"
+    assert compression.negotiate("br, identity", offered) is None
+    assert compression.negotiate("", offered) is None
+
+def test_mongo_compressors_skip_missing_packages():
+    with patch("importlib.util.find_spec", side_effect=lambda name: name == "snappy" or None):
+        assert compression.mongo_compressors("zstd,snappy,zlib") == "snappy,zlib"
+        assert compression.mongo_compressors("zstd") == ""
+    assert compression.mongo_compressors("") == ""
+
+def test_stream_compressor_round_trip():
+    compressor = compression.StreamCompressor("deflate")
+    data = compressor.compress(b"a" * 1000) + compressor.compress(b"b" * 1000, final=True)
+    assert zlib.decompress(data) == b"a" * 1000 + b"b" * 1000
+    assert compressor.raw == 2000 and compressor.compressed == len(data)
+
+@pytest.fixture
+def client():
+    api = FastAPI()
+    api.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @api.get("/big")
+    async def big():
+        return JSONResponse({"users": ["x" * 40] * 50}, headers={"ETag": '"7"'})
+
+    @api.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @api.get("/stream")
+    async def stream():
+        lines = (b'{"id": %d}\n' % i for i in range(100))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    return TestClient(api)
+
+def test_http_compresses_above_threshold(client):
+    before = metrics.COMPRESSION_RATIO.count(transport="http", endpoint="/big", encoding="gzip")
+    resp = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert resp.headers["ETag"] == 'W/"7"'
+    assert int(resp.headers["Content-Length"]) < 500
+    assert len(resp.json()["users"]) == 50
+    assert metrics.COMPRESSION_RATIO.count(
+        transport="http", endpoint="/big", encoding="gzip") == before + 1
+
+    resp = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in resp.headers
+    resp = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in resp.headers
+
+def test_http_compresses_streams(client):
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "deflate"}) as resp:
+        raw = b"".join(resp.iter_raw())
+    assert resp.headers["Content-Encoding"] == "deflate"
+    assert "Content-Length" not in resp.headers
+    assert zlib.decompress(raw).count(b"\n") == 100
+
+def test_grpc_compresses_list_rpcs_only():
+    store = MemoryUserStore()
+    user_id = store.insert({"username": "u", "email": "e@x", "password": "hash"})
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2),
+                         interceptors=[CompressionInterceptor(sample_rate=1.0)])
+    user_pb2_grpc.add_UserServiceServicer_to_server(UserService(store), server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    labels = {"transport": "grpc", "encoding": "gzip"}
+    listed = metrics.COMPRESSION_RATIO.count(endpoint="ListUsers", **labels)
+    try:
+        with grpc.insecure_channel(f"localhost:{port}") as channel:
+            stub = user_pb2_grpc.UserServiceStub(channel)
+            assert len(stub.ListUsers(user_pb2.ListUsersRequest()).users) == 1
+            assert len(list(stub.StreamUsers(user_pb2.ListUsersRequest()))) == 1
+            assert stub.GetUser(user_pb2.GetUserRequest(id=str(user_id))).email == "e@x"
+        assert metrics.COMPRESSION_RATIO.count(endpoint="ListUsers", **labels) == listed + 1
+        assert metrics.COMPRESSION_RATIO.count(endpoint="StreamUsers", **labels) >= 1
+        assert metrics.COMPRESSION_RATIO.count(endpoint="GetUser", **labels) == 0
+    finally:
+        server.stop(None)
+
+def test_interceptor_sets_per_call_compression():
+    interceptor = CompressionInterceptor("deflate", methods=("ListUsers",), sample_rate=0)
+    handler = grpc.unary_unary_rpc_method_handler(lambda request, context: "ok")
+    context = MagicMock()
+    details = MagicMock(method="/user.UserService/ListUsers")
+    wrapped = interceptor.intercept_service(lambda _: handler, details)
+    assert wrapped.unary_unary(None, context) == "ok"
+    context.set_compression.assert_called_once_with(grpc.Compression.Deflate)
+    details.method = "/user.UserService/GetUser"
+    assert interceptor.intercept_service(lambda _: handler, details) is handler
+    with pytest.raises(ValueError):
+        CompressionInterceptor("brotli")
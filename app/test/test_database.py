@@ -1,6 +1,108 @@
-from app.database import get_db
+import asyncio
+from unittest.mock import MagicMock, patch
+import pytest
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+from app import database
+from app.database import (
+    get_db, get_client, get_async_client, client_options, close_client, close_async_client,
+    ensure_indexes, verify_indexes, IndexVerificationError, IndexesNotReady, indexes_ready
+)
 
 def test_get_db_returns_db():
     db = get_db()
     assert db is not None
-    assert hasattr(db, "name")
\ No newline at end of file
+    assert hasattr(db, "name")
+
+def test_get_db_shares_one_client():
+    assert get_db().client is get_db().client
+    assert get_client() is get_db().client
+
+def test_client_options_from_config():
+    with patch.multiple(database, MONGO_MAX_POOL_SIZE=7, MONGO_MIN_POOL_SIZE=2,
+                        MONGO_COMPRESSORS="zlib", MONGO_SOCKET_TIMEOUT_MS=0):
+        options = client_options()
+    assert options["maxPoolSize"] == 7
+    assert options["minPoolSize"] == 2
+    assert options["compressors"] == "zlib"
+    assert "socketTimeoutMS" not in options
+
+def test_close_client_resets_registry():
+    first = get_client()
+    close_client()
+    assert get_client() is not first
+
+def test_async_client_per_loop():
+    async def same_loop():
+        client = get_async_client()
+        assert get_async_client() is client
+        await close_async_client()
+        return client
+    assert asyncio.run(same_loop()) is not asyncio.run(same_loop())
+
+def test_ensure_indexes_creates_unique_email():
+    db = MagicMock()
+    collection = db.__getitem__.return_value
+    collection.index_information.return_value = {
+        "_id_": {"key": [("_id", 1)]},
+        "email_1": {"key": [("email", 1)], "unique": True},
+        "id_version": {"key": [("_id", 1), ("version", 1)]},
+        "email_version": {"key": [("email", 1), ("version", 1)]},
+    }
+    indexes_ready.clear()
+    ensure_indexes(db)
+    models = collection.create_indexes.call_args[0][0]
+    assert models[0].document["unique"] is True
+    assert indexes_ready.is_set()
+    indexes_ready.clear()
+
+def test_verify_indexes_rejects_non_unique_email():
+    with pytest.raises(IndexVerificationError):
+        verify_indexes({"email_1": {"key": [("email", 1)]}})
+    with pytest.raises(IndexVerificationError):
+        verify_indexes({})
+
+def test_prepare_retries_until_indexes_exist():
+    failures = [ServerSelectionTimeoutError("sin servidor")] * 2
+    attempts = []
+
+    def ensure(create=True):
+        attempts.append(1)
+        if failures:
+            raise failures.pop()
+
+    delays = []
+    with patch.multiple(database, MONGO_WARM_UP=False, MONGO_ENSURE_INDEXES=True,
+                        ensure_indexes=ensure):
+        database.prepare_database(sleep=delays.append)
+    assert len(attempts) == 3
+    assert delays == [1.0, 2.0]
+
+def test_prepare_async_keeps_going_when_warm_up_fails():
+    ensure = MagicMock(side_effect=[IndexVerificationError("email_1"), None])
+
+    async def ensure_async(create=True):
+        ensure()
+
+    async def no_server():
+        return False
+
+    async def no_sleep(delay):
+        pass
+
+    with patch.multiple(database, MONGO_WARM_UP=True, MONGO_ENSURE_INDEXES=True,
+                        warm_up_async=no_server, ensure_indexes_async=ensure_async):
+        asyncio.run(database.prepare_database_async(sleep=no_sleep))
+    assert ensure.call_count == 2
+
+def test_prepare_stops_on_duplicate_emails_and_keeps_writes_closed():
+    duplicates = OperationFailure("E11000 duplicate key error", code=11000)
+    ensure = MagicMock(side_effect=duplicates)
+    delays = []
+    indexes_ready.clear()
+    with patch.multiple(database, MONGO_WARM_UP=False, MONGO_ENSURE_INDEXES=True,
+                        ensure_indexes=ensure, index_error=None):
+        database.prepare_database(sleep=delays.append)
+        assert ensure.call_count == 1 and delays == []
+        with pytest.raises(IndexesNotReady) as exc:
+            database.require_indexes()
+        assert "duplicados" in str(exc.value)
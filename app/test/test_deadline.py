@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+from concurrent import futures
+from unittest.mock import patch
+import grpc
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo.errors import ExecutionTimeout
+from app import deadline, hashing, metrics
+from app.aio_service import AsyncUserService
+from app.hashing import PasswordHasher
+from app.instrumentation import AsyncDeadlineInterceptor, DeadlineInterceptor, DeadlineMiddleware
+from app.ratelimit import NullLoginLimiter, set_login_limiter
+from app.service import UserService
+from app.store import AsyncMemoryUserStore, MemoryUserStore
+import app.proto.user_pb2 as user_pb2
+import app.proto.user_pb2_grpc as user_pb2_grpc
+
+def test_budget_nests_and_expires():
+    assert deadline.remaining() is None
+    with deadline.budget(10):
+        with deadline.budget(0.05):
+            assert deadline.remaining() <= 0.05
+        assert deadline.remaining() > 5
+        with deadline.budget(0):
+            with pytest.raises(deadline.DeadlineExceeded):
+                deadline.check("test")
+    assert deadline.current() is None
+
+def test_hasher_skips_bcrypt_after_deadline():
+    hasher = PasswordHasher(kind="inline", workers=1, queue_size=1)
+    with patch("app.auth.verify_password") as verify, deadline.budget(0):
+        with pytest.raises(deadline.DeadlineExceeded) as exc:
+            hasher.verify("pw", "hash")
+    assert exc.value.stage == "hash"
+    verify.assert_not_called()
+    with pytest.raises(deadline.DeadlineExceeded):
+        hashing._timed(time.monotonic() - 1, verify)
+    verify.assert_not_called()
+
+def test_queued_hash_gives_up_at_deadline():
+    hasher = PasswordHasher(kind="thread", workers=1, queue_size=2)
+    release = threading.Event()
+    try:
+        blocker = hasher.submit(release.wait)
+        start = time.monotonic()
+        with deadline.budget(0.1), pytest.raises(deadline.DeadlineExceeded):
+            asyncio.run(hasher.hash_async("pw"))
+        assert time.monotonic() - start < 1
+    finally:
+        release.set()
+        blocker.result()
+        hasher.shutdown()
+
+class SlowStore(MemoryUserStore):
+    def get_by_email(self, email, projection=None):
+        time.sleep(0.3)
+        return super().get_by_email(email, projection)
+
+def test_grpc_deadline_skips_bcrypt():
+    set_login_limiter(NullLoginLimiter())
+    store = SlowStore()
+    store.insert({"username": "u", "email": "e@x", "password": "hash"})
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2),
+                         interceptors=[DeadlineInterceptor()])
+    user_pb2_grpc.add_UserServiceServicer_to_server(UserService(store), server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    before = metrics.DEADLINE_EXCEEDED.value(stage="hash")
+    try:
+        with patch("app.hashing.PasswordHasher.submit") as submit, \
+                grpc.insecure_channel(f"localhost:{port}") as channel:
+            stub = user_pb2_grpc.UserServiceStub(channel)
+            with pytest.raises(grpc.RpcError) as exc:
+                stub.Login(user_pb2.LoginRequest(email="e@x", password="pw"), timeout=0.1)
+            assert exc.value.code() == grpc.StatusCode.DEADLINE_EXCEEDED
+            time.sleep(0.4)
+            submit.assert_not_called()
+        assert metrics.DEADLINE_EXCEEDED.value(stage="hash") == before + 1
+    finally:
+        server.stop(None)
+
+def test_http_budget_returns_504():
+    api = FastAPI()
+    api.add_middleware(DeadlineMiddleware, timeout=0.05)
+
+    @api.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.1)
+        deadline.check("test")
+        return {}
+
+    @api.get("/mongo")
+    async def mongo():
+        raise ExecutionTimeout("operation exceeded time limit", 50)
+
+    client = TestClient(api)
+    resp = client.get("/slow")
+    assert resp.status_code == 504
+    assert client.get("/mongo").status_code == 504
+    assert metrics.DEADLINE_EXCEEDED.value(stage="mongo") >= 1
+
+def test_aio_deadline_cancels_handler():
+    class SlowAsyncStore(AsyncMemoryUserStore):
+        async def get_by_email(self, email, projection=None):
+            await asyncio.sleep(0.3)
+            return await super().get_by_email(email, projection)
+
+    set_login_limiter(NullLoginLimiter())
+    store = SlowAsyncStore()
+    store.store.insert({"username": "u", "email": "e@x", "password": "hash"})
+
+    async def run():
+        server = grpc.aio.server(interceptors=[AsyncDeadlineInterceptor()])
+        user_pb2_grpc.add_UserServiceServicer_to_server(AsyncUserService(store), server)
+        port = server.add_insecure_port("localhost:0")
+        await server.start()
+        try:
+            async with grpc.aio.insecure_channel(f"localhost:{port}") as channel:
+                stub = user_pb2_grpc.UserServiceStub(channel)
+                with pytest.raises(grpc.aio.AioRpcError) as exc:
+                    await stub.Login(user_pb2.LoginRequest(email="e@x", password="pw"), timeout=0.1)
+                assert exc.value.code() == grpc.StatusCode.DEADLINE_EXCEEDED
+                await asyncio.sleep(0.4)
+        finally:
+            await server.stop(None)
+
+    before = metrics.DEADLINE_EXCEEDED.value(stage="cancelled")
+    with patch("app.hashing.PasswordHasher.submit") as submit:
+        asyncio.run(run())
+    submit.assert_not_called()
+    assert metrics.DEADLINE_EXCEEDED.value(stage="cancelled") == before + 1
@@ -1,7 +1,49 @@
+import grpc
 import pytest
+from unittest.mock import MagicMock
+from bson import ObjectId
+from pymongo.errors import ServerSelectionTimeoutError
+from app.database import indexes_ready
 from app.grpc_server import UserServiceServicer
+from app.store import MemoryUserStore
+import app.proto.user_pb2 as user_pb2
 
 def test_createuser_method_exists():
     service = UserServiceServicer()
     assert hasattr(service, "CreateUser")
-    assert callable(getattr(service, "CreateUser", None))
\ No newline at end of file
+    assert callable(getattr(service, "CreateUser", None))
+class DummyContext:
+    def __init__(self):
+        self.code = None
+    def set_code(self, code):
+        self.code = code
+    def set_details(self, details):
+        self.details = details
+
+@pytest.fixture
+def servicer():
+    indexes_ready.set()
+    yield UserServiceServicer(MemoryUserStore())
+    indexes_ready.clear()
+
+def test_invalid_id_is_invalid_argument(servicer):
+    for method, request in (
+        (servicer.GetUser, user_pb2.GetUserRequest(id="nope")),
+        (servicer.UpdateUser, user_pb2.UpdateUserRequest(id="nope", email="e")),
+        (servicer.DeleteUser, user_pb2.DeleteUserRequest(id="nope")),
+    ):
+        ctx = DummyContext()
+        method(request, ctx)
+        assert ctx.code == grpc.StatusCode.INVALID_ARGUMENT
+
+def test_duplicate_email_is_already_exists(servicer):
+    servicer.CreateUser(user_pb2.CreateUserRequest(username="a", email="a@test.com"), DummyContext())
+    ctx = DummyContext()
+    servicer.CreateUser(user_pb2.CreateUserRequest(username="b", email="a@test.com"), ctx)
+    assert ctx.code == grpc.StatusCode.ALREADY_EXISTS
+
+def test_store_errors_are_not_swallowed(servicer):
+    servicer.store = MagicMock()
+    servicer.store.get_by_id.side_effect = ServerSelectionTimeoutError("sin servidor")
+    with pytest.raises(ServerSelectionTimeoutError):
+        servicer.GetUser(user_pb2.GetUserRequest(id=str(ObjectId())), DummyContext())
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+import pytest
+from app import hashing, metrics
+from app.auth import build_pwd_context
+from app.hashing import PasswordHasher, HashingBusyError
+from app.store import AsyncMemoryUserStore, MemoryUserStore
+
+@pytest.mark.parametrize("kind", ["inline", "thread", "process"])
+def test_hash_and_verify(kind):
+    hasher = PasswordHasher(kind=kind, workers=2, queue_size=2)
+    try:
+        hashed = hasher.hash("s3cret")
+        assert hasher.verify("s3cret", hashed)
+        assert not hasher.verify("wrong", hashed)
+    finally:
+        hasher.shutdown()
+
+def test_async_entry_points():
+    hasher = PasswordHasher(kind="thread", workers=1, queue_size=1)
+    async def run():
+        hashed = await hasher.hash_async("pw")
+        return await hasher.verify_async("pw", hashed)
+    try:
+        assert asyncio.run(run())
+    finally:
+        hasher.shutdown()
+
+def test_bounded_queue_rejects():
+    hasher = PasswordHasher(kind="thread", workers=1, queue_size=1)
+    release = threading.Event()
+    try:
+        first = hasher.submit(release.wait)
+        second = hasher.submit(release.wait)
+        with pytest.raises(HashingBusyError):
+            hasher.submit(release.wait)
+        release.set()
+        first.result()
+        second.result()
+        # El hueco se libera en el callback del future, justo después del resultado
+        deadline = time.monotonic() + 1
+        while hasher.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert hasher.pending == 0
+        hasher.submit(release.wait).result()
+    finally:
+        hasher.shutdown()
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        PasswordHasher(kind="gpu")
+
+def test_hash_many_in_chunks():
+    hasher = PasswordHasher(kind="thread", workers=2, queue_size=0)
+    try:
+        hashes = hasher.hash_many(["a", "b", "c"])
+        assert len(hashes) == 3
+        assert hasher.verify("c", hashes[2])
+        assert len(asyncio.run(hasher.hash_many_async(["a", "b"]))) == 2
+    finally:
+        hasher.shutdown()
+
+def test_rehash_replaces_outdated_hash():
+    hashing.configure(kind="inline", workers=1, queue_size=4)
+    store = MemoryUserStore()
+    old = build_pwd_context(bcrypt_rounds=4).hash("pw")
+    store.insert({"username": "u", "email": "u@x", "password": old})
+    try:
+        assert hashing.needs_rehash(old)
+        assert hashing.rehash_in_background(store, "u@x", "pw", old).result()
+        new = store.get_by_email("u@x", {"password": 1})["password"]
+        assert not hashing.needs_rehash(new)
+        assert hashing.verify_password("pw", new)
+        # El hash ya cambió: no se vuelve a escribir
+        assert not asyncio.run(
+            hashing.rehash_password_async(AsyncMemoryUserStore(store), "u@x", "pw", old)
+        )
+    finally:
+        hashing.shutdown()
+
+def test_rehash_skips_pending_emails():
+    store = MemoryUserStore()
+    release = threading.Event()
+    store.replace_password = lambda *args: release.wait(5)
+    hashing.configure(kind="inline", workers=1, queue_size=4)
+    before = metrics.PASSWORD_REHASHES.value(result="skipped")
+    try:
+        first = hashing.rehash_in_background(store, "u@x", "pw", "old")
+        # Mismo email con un rehash en marcha: se descarta sin encolar la contraseña
+        assert hashing.rehash_in_background(store, "u@x", "pw", "old").result() is False
+        with patch.object(hashing, "PASSWORD_REHASH_MAX_PENDING", 1):
+            assert hashing.rehash_in_background(store, "v@x", "pw", "old").result() is False
+        assert metrics.PASSWORD_REHASHES.value(result="skipped") == before + 2
+        release.set()
+        assert first.result()
+        assert not hashing._rehash_pending
+    finally:
+        release.set()
+        hashing.shutdown()
@@ -0,0 +1,89 @@
+import io
+import multiprocessing
+import signal
+import time
+import urllib.request
+from unittest.mock import patch
+import pytest
+from app import launcher
+
+def exit_with(code):
+    raise SystemExit(code)
+
+def wait_for_sigterm():
+    signal.signal(signal.SIGTERM, lambda *_: exit_with(0))
+    time.sleep(30)
+
+def supervisor(workers, clock=time.monotonic):
+    return launcher.Supervisor(workers, grace=1, context=multiprocessing.get_context("fork"),
+                               clock=clock, out=io.StringIO())
+
+def test_restarts_crashed_worker_with_backoff():
+    now = [0.0]
+    worker = launcher.Worker("w", exit_with, (3,))
+    sup = supervisor([worker], clock=lambda: now[0])
+    sup.start_all()
+    worker.process.join(5)
+    sup.poll(0)
+    assert worker.process is None and worker.failures == 1 and sup.restarts == 0
+    now[0] += 1
+    sup.poll(0)
+    assert sup.restarts == 1 and worker.process is not None
+    sup.stop()
+
+def test_stop_is_graceful_and_does_not_restart():
+    workers = [launcher.Worker(f"w{i}", wait_for_sigterm) for i in range(2)]
+    sup = supervisor(workers)
+    sup.start_all()
+    time.sleep(0.3)
+    sup.stop()
+    assert [worker.process.exitcode for worker in workers] == [0, 0]
+    sup.poll(0)
+    assert sup.restarts == 0
+
+def test_build_workers_toggles_sides():
+    workers = launcher.build_workers(0, 2, grpc_port=50051, metrics_port=9100)
+    assert [worker.name for worker in workers] == ["grpc-0", "grpc-1"]
+    assert [worker.args[3] for worker in workers] == [9100, 9101]
+    assert [worker.args[2] for worker in workers] == [True, True]
+    workers = launcher.build_workers(0, 1, grpc_port=50051, metrics_port=0, reuse_port=False)
+    assert workers[0].args[2] is False
+    assert launcher.main(["--no-http", "--no-grpc"]) == 2
+
+def test_child_environment_keeps_cache_with_short_ttl():
+    assert launcher.child_environment(1, environ={"PASSWORD_HASH_WORKERS": "2"}) == {}
+    with patch.object(launcher, "USER_CACHE_BACKEND", "memory"), \
+            patch.object(launcher, "USER_CACHE_TTL_SECONDS", 60.0), \
+            patch.object(launcher, "USER_CACHE_MULTIPROCESS_TTL_SECONDS", 5.0):
+        env = launcher.child_environment(2, environ={})
+    assert "USER_CACHE_BACKEND" not in env
+    assert env["USER_CACHE_TTL_SECONDS"] == "5.0"
+    assert not any(name.startswith("LOGIN_") for name in env)
+    assert "PASSWORD_HASH_WORKERS" in env
+    # Un backend compartido registrado por nombre se deja como está
+    with patch.object(launcher, "USER_CACHE_BACKEND", "redis"):
+        assert "USER_CACHE_TTL_SECONDS" not in launcher.child_environment(4, environ={})
+
+def test_http_worker_serves_on_shared_socket():
+    pytest.importorskip("uvicorn")
+    sock = launcher.bind_socket("127.0.0.1", 0)
+    port = sock.getsockname()[1]
+    sup = supervisor([launcher.Worker("http-0", launcher.run_http, (sock, 1))])
+    sup.start_all()
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as resp:
+                    assert resp.status == 200
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+    finally:
+        sup.stop()
+        sock.close()
+    # uvicorn termina lo que tiene en curso y vuelve a lanzar la señal recibida;
+    # lo que no puede pasar es que el supervisor tenga que matarlo
+    assert sup.workers[0].process.exitcode in (0, -signal.SIGTERM)
@@ -0,0 +1,266 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from fastapi.testclient import TestClient
+from app import hashing
+from app.database import indexes_ready
+from app.cache import get_user_cache
+from app.auth import build_pwd_context, create_access_token, get_password_hash
+from app.main import app, get_user_store
+from app.ratelimit import LoginLimiter, set_login_limiter
+from app.signing import KeyRing, SigningKey, generate_key, set_signer
+from app.store import AsyncMemoryUserStore, AsyncMongoUserStore, MemoryUserStore
+
+@pytest.fixture
+def collection():
+    hashing.configure(kind="inline", workers=1, queue_size=4)
+    get_user_cache().clear()
+    set_login_limiter(LoginLimiter())
+    mock_collection = MagicMock()
+    mock_collection.find_one = AsyncMock(return_value=None)
+    mock_collection.insert_one = AsyncMock()
+    mock_collection.update_one = AsyncMock()
+    mock_collection.delete_one = AsyncMock()
+    mock_collection.find_one_and_update = AsyncMock(return_value=None)
+    mock_collection.insert_many = AsyncMock()
+    mock_collection.delete_many = AsyncMock()
+    store = AsyncMongoUserStore(mock_collection)
+    app.dependency_overrides[get_user_store] = lambda: store
+    indexes_ready.set()
+    yield mock_collection
+    indexes_ready.clear()
+    app.dependency_overrides.clear()
+    hashing.shutdown()
+
+@pytest.fixture
+def client(collection):
+    with TestClient(app) as test_client:
+        yield test_client
+
+def auth_headers(email="e@test.com"):
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+def test_register(client, collection):
+    oid = ObjectId()
+    collection.insert_one.return_value.inserted_id = oid
+    resp = client.post("/register", json={"username": "u", "email": "e@test.com", "password": "pw"})
+    assert resp.status_code == 200
+    assert resp.json() == {"id": str(oid)}
+    stored = collection.insert_one.call_args[0][0]
+    assert stored["password"] != "pw"
+
+def test_register_duplicate(client, collection):
+    collection.insert_one.side_effect = DuplicateKeyError("E11000 duplicate key")
+    resp = client.post("/register", json={"username": "u", "email": "e@test.com", "password": "pw"})
+    assert resp.status_code == 400
+
+def test_register_rejected_until_indexes_verified(client, collection):
+    indexes_ready.clear()
+    resp = client.post("/register", json={"username": "u", "email": "e@test.com", "password": "pw"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "5"
+    collection.insert_one.assert_not_called()
+
+def test_login(client, collection):
+    collection.find_one.return_value = {"email": "e@test.com", "password": get_password_hash("pw")}
+    resp = client.post("/login", data={"username": "e@test.com", "password": "pw"})
+    assert resp.status_code == 200
+    assert resp.json()["token_type"] == "bearer"
+    resp = client.post("/login", data={"username": "e@test.com", "password": "otra"})
+    assert resp.status_code == 401
+
+def test_get_user(client, collection):
+    oid = ObjectId()
+    collection.find_one.return_value = {"_id": oid, "username": "u", "email": "e@test.com"}
+    resp = client.get(f"/users/{oid}", headers=auth_headers())
+    assert resp.status_code == 200
+    assert resp.json() == {"id": str(oid), "username": "u", "email": "e@test.com"}
+
+def test_get_user_cached_until_update(client, collection):
+    oid = ObjectId()
+    collection.find_one.return_value = {"_id": oid, "username": "u", "email": "e@test.com"}
+    client.get(f"/users/{oid}", headers=auth_headers())
+    client.get(f"/users/{oid}", headers=auth_headers())
+    assert collection.find_one.await_count == 1
+    collection.find_one_and_update.return_value = {"_id": oid, "username": "n", "email": "e@test.com"}
+    client.put(
+        f"/users/{oid}",
+        json={"username": "n", "email": "e@test.com", "password": "pw"},
+        headers=auth_headers(),
+    )
+    collection.find_one.return_value = {"_id": oid, "username": "n", "email": "e@test.com"}
+    assert client.get(f"/users/{oid}", headers=auth_headers()).json()["username"] == "n"
+    assert client.get("/cache/stats").status_code == 401
+    assert client.get("/cache/stats", headers=auth_headers()).json()["invalidations"] >= 1
+
+def test_get_user_etag_and_not_modified(client, collection):
+    oid = ObjectId()
+    collection.find_one.return_value = {"_id": oid, "username": "u", "email": "e@test.com",
+                                        "version": 3}
+    resp = client.get(f"/users/{oid}", headers=auth_headers())
+    assert resp.headers["ETag"] == '"3"'
+    # Perfil en caché: el 304 no toca Mongo
+    resp = client.get(f"/users/{oid}", headers={**auth_headers(), "If-None-Match": '"3"'})
+    assert resp.status_code == 304
+    assert resp.content == b""
+    assert collection.find_one.await_count == 1
+    resp = client.get(f"/users/{oid}", headers={**auth_headers(), "If-None-Match": 'W/"2"'})
+    assert resp.status_code == 200
+
+def test_get_me_not_modified_reads_only_version(client, collection):
+    collection.find_one.return_value = {"version": 5}
+    headers = {**auth_headers(), "If-None-Match": '"4", "5"'}
+    resp = client.get("/users/me", headers=headers)
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == '"5"'
+    assert resp.headers["Vary"] == "Authorization"
+    args, kwargs = collection.find_one.call_args
+    assert args == ({"email": "e@test.com"}, {"_id": 0, "version": 1})
+    assert kwargs == {"hint": "email_version"}
+
+def test_get_user_requires_token(client):
+    assert client.get(f"/users/{ObjectId()}").status_code == 401
+
+def test_get_user_invalid_id(client):
+    assert client.get("/users/no-valido", headers=auth_headers()).status_code == 400
+
+def test_get_me_not_found(client, collection):
+    assert client.get("/users/me", headers=auth_headers()).status_code == 404
+
+def test_update_user(client, collection):
+    oid = ObjectId()
+    collection.find_one_and_update.return_value = {"_id": oid, "username": "n", "email": "n@test.com"}
+    resp = client.put(
+        f"/users/{oid}",
+        json={"username": "n", "email": "n@test.com", "password": "pw"},
+        headers=auth_headers(),
+    )
+    assert resp.status_code == 200
+
+def test_patch_user_only_username(client, collection, monkeypatch):
+    oid = ObjectId()
+    collection.find_one_and_update.return_value = {"_id": oid, "username": "n", "email": "e@test.com"}
+    hash_calls = []
+    monkeypatch.setattr("app.main.get_password_hash_async", AsyncMock(side_effect=hash_calls.append))
+    resp = client.patch(f"/users/{oid}", json={"username": "n"}, headers=auth_headers())
+    assert resp.status_code == 200
+    assert resp.json() == {"id": str(oid), "username": "n", "email": "e@test.com"}
+    assert hash_calls == []
+    assert collection.find_one_and_update.call_args[0][1] == {
+        "$set": {"username": "n"}, "$inc": {"version": 1}
+    }
+
+def test_patch_user_empty_body(client):
+    resp = client.patch(f"/users/{ObjectId()}", json={}, headers=auth_headers())
+    assert resp.status_code == 400
+
+def test_patch_user_not_found(client, collection):
+    resp = client.patch(f"/users/{ObjectId()}", json={"password": "nueva"}, headers=auth_headers())
+    assert resp.status_code == 404
+
+def test_delete_user_not_found(client, collection):
+    collection.delete_one.return_value.deleted_count = 0
+    resp = client.delete(f"/users/{ObjectId()}", headers=auth_headers())
+    assert resp.status_code == 404
+
+def test_hashing_busy_returns_503(client, collection):
+    hashing.configure(kind="inline", workers=0, queue_size=0)
+    resp = client.post("/register", json={"username": "u", "email": "e@test.com", "password": "pw"})
+    assert resp.status_code == 503
+
+def test_batch_create_users(client, collection):
+    async def insert_many(docs, ordered):
+        for doc in docs:
+            doc["_id"] = ObjectId()
+    collection.insert_many.side_effect = insert_many
+    resp = client.post("/users/batch", json={"users": [
+        {"username": "a", "email": "a@test.com", "password": "pw"},
+        {"username": "b", "email": "", "password": "pw"},
+    ]}, headers=auth_headers())
+    results = resp.json()["results"]
+    assert "id" in results[0]
+    assert results[1]["index"] == 1 and "error" in results[1]
+
+def test_batch_delete_users(client, collection):
+    collection.delete_many.return_value.deleted_count = 2
+    resp = client.post("/users/batch/delete", json={"ids": [str(ObjectId()), str(ObjectId())]},
+                       headers=auth_headers())
+    assert resp.json() == {"deleted": 2, "invalid_ids": []}
+
+@pytest.fixture
+def memory_store(collection):
+    # Sustituye el store de Mongo simulado por uno en memoria con count usuarios
+    previous = app.dependency_overrides[get_user_store]
+    def fill(count):
+        store = MemoryUserStore()
+        for i in range(count):
+            store.insert({"username": f"u{i % 2}", "email": f"u{i}@test.com", "password": "hash"})
+        app.dependency_overrides[get_user_store] = lambda: AsyncMemoryUserStore(store)
+        return store
+    yield fill
+    app.dependency_overrides[get_user_store] = previous
+
+def test_list_users_keyset(client, memory_store):
+    memory_store(5)
+    resp = client.get("/users", params={"limit": 2}, headers=auth_headers())
+    page = resp.json()
+    assert [u["email"] for u in page["users"]] == ["u0@test.com", "u1@test.com"]
+    emails = []
+    while page["next_after"]:
+        page = client.get("/users", params={"limit": 2, "after": page["next_after"]},
+                          headers=auth_headers()).json()
+        emails += [u["email"] for u in page["users"]]
+    assert emails == ["u2@test.com", "u3@test.com", "u4@test.com"]
+
+def test_list_users_filters(client, memory_store):
+    memory_store(5)
+    resp = client.get("/users", params={"username": "u1"}, headers=auth_headers())
+    assert [u["email"] for u in resp.json()["users"]] == ["u1@test.com", "u3@test.com"]
+    resp = client.get("/users", params={"email": "u4@test.com"}, headers=auth_headers())
+    assert [u["username"] for u in resp.json()["users"]] == ["u0"]
+
+def test_list_users_invalid_cursor(client, memory_store):
+    memory_store(1)
+    assert client.get("/users", params={"after": "%%"}, headers=auth_headers()).status_code == 400
+
+def test_export_users_ndjson(client, memory_store):
+    memory_store(3)
+    resp = client.get("/users/export", headers=auth_headers())
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    assert [row["email"] for row in rows] == ["u0@test.com", "u1@test.com", "u2@test.com"]
+    assert all("password" not in row for row in rows)
+
+def test_login_rehashes_outdated_hash(client, collection):
+    old = build_pwd_context(bcrypt_rounds=4).hash("pw")
+    collection.find_one.return_value = {"email": "e@test.com", "password": old}
+    resp = client.post("/login", data={"username": "e@test.com", "password": "pw"})
+    assert resp.status_code == 200
+    query, update = collection.update_one.call_args[0]
+    assert query == {"email": "e@test.com", "password": old}
+    assert update["$set"]["password"].startswith("$2b$12$")
+
+def test_login_throttled_before_bcrypt(client, collection, monkeypatch):
+    set_login_limiter(LoginLimiter(email_burst=1, email_per_minute=1))
+    verify = AsyncMock(return_value=False)
+    monkeypatch.setattr("app.main.verify_password_async", verify)
+    collection.find_one.return_value = {"email": "e@test.com", "password": "hash"}
+    assert client.post("/login", data={"username": "e@test.com", "password": "x"}).status_code == 401
+    resp = client.post("/login", data={"username": "e@test.com", "password": "x"})
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert verify.await_count == 1
+    assert collection.find_one.await_count == 1
+
+def test_jwks(client):
+    assert client.get("/.well-known/jwks.json").json() == {"keys": []}
+    set_signer(KeyRing([SigningKey.from_pem("k1", generate_key("ES256"))]))
+    try:
+        resp = client.get("/.well-known/jwks.json")
+        assert resp.headers["cache-control"].startswith("public, max-age=")
+        assert [key["kid"] for key in resp.json()["keys"]] == ["k1"]
+        assert client.get("/users/me", headers=auth_headers()).status_code != 401
+    finally:
+        set_signer(None)
@@ -0,0 +1,92 @@
+import threading
+from concurrent import futures
+from unittest.mock import MagicMock
+import grpc
+from fastapi.testclient import TestClient
+from app import metrics
+from app.instrumentation import MetricsInterceptor, MongoCommandListener, QueueCountingExecutor
+from app.main import app
+from app.service import UserService
+from app.store import MemoryUserStore
+import app.proto.user_pb2 as user_pb2
+import app.proto.user_pb2_grpc as user_pb2_grpc
+
+def test_counter_and_histogram_render():
+    registry = metrics.Registry()
+    counter = registry.counter("test_total", "ayuda", ("code",))
+    histogram = registry.histogram("test_seconds", "ayuda", ("op",), buckets=(0.1, 1.0))
+    counter.inc(code="OK")
+    counter.inc(2, code="OK")
+    histogram.observe(0.05, op="a")
+    histogram.observe(0.5, op="a")
+    histogram.observe(5, op="a")
+    text = registry.render()
+    assert 'test_total{code="OK"} 3' in text
+    assert 'test_seconds_bucket{op="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{op="a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{op="a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{op="a"} 3' in text
+
+def test_gauge_function():
+    gauge = metrics.Gauge("test_events", "ayuda", ("event",))
+    gauge.set_function(lambda: {("hits",): 4})
+    assert 'test_events{event="hits"} 4' in gauge.render()
+
+def test_counter_function():
+    counter = metrics.Counter("test_events_total", "ayuda", ("event",))
+    counter.set_function(lambda: {("hits",): 4})
+    assert "# TYPE test_events_total counter" in counter.render()
+    assert 'test_events_total{event="hits"} 4' in counter.render()
+
+def test_executor_counts_queued_work():
+    executor = QueueCountingExecutor(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    try:
+        running = executor.submit(lambda: started.set() or release.wait(5))
+        started.wait(5)
+        queued = [executor.submit(lambda: None) for _ in range(3)]
+        assert executor.queued == 3
+        release.set()
+        running.result()
+        for future in queued:
+            future.result()
+        assert executor.queued == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+def test_mongo_listener_counts_commands():
+    before = metrics.MONGO_COMMANDS.value(command="find", status="ok")
+    event = MagicMock(command_name="find", duration_micros=1500)
+    MongoCommandListener().succeeded(event)
+    assert metrics.MONGO_COMMANDS.value(command="find", status="ok") == before + 1
+
+def test_grpc_interceptor_records_status():
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=2), interceptors=[MetricsInterceptor()]
+    )
+    user_pb2_grpc.add_UserServiceServicer_to_server(UserService(MemoryUserStore()), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    before = metrics.GRPC_HANDLED.value(method="GetUser", code="NOT_FOUND")
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = user_pb2_grpc.UserServiceStub(channel)
+            try:
+                stub.GetUser(user_pb2.GetUserRequest(id="ffffffffffffffffffffffff"))
+            except grpc.RpcError as exc:
+                assert exc.code() == grpc.StatusCode.NOT_FOUND
+    finally:
+        server.stop(None)
+    assert metrics.GRPC_HANDLED.value(method="GetUser", code="NOT_FOUND") == before + 1
+
+def test_metrics_endpoint():
+    with TestClient(app) as client:
+        client.get("/cache/stats")
+        resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{route="/cache/stats",method="GET",status="401"}' in resp.text
+    assert "# TYPE user_cache_events_total counter" in resp.text
+    assert 'user_cache_events_total{event="size"}' not in resp.text
+    assert "# TYPE user_cache_entries gauge" in resp.text
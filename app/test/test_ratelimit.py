@@ -0,0 +1,83 @@
+import pytest
+from app import metrics
+from app.ratelimit import LoginLimiter, LoginThrottled, peer_address
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def make_limiter(clock, **kwargs):
+    options = dict(email_burst=2, email_per_minute=60, client_burst=100, client_per_minute=600,
+                   lockout_failures=3, lockout_seconds=60, max_keys=100, clock=clock)
+    options.update(kwargs)
+    return LoginLimiter(**options)
+
+def test_email_bucket_refills():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    limiter.check("A@test.com", "1.1.1.1")
+    limiter.check("a@test.com", "2.2.2.2")
+    with pytest.raises(LoginThrottled) as exc:
+        limiter.check("a@test.com", "3.3.3.3")
+    assert exc.value.reason == "email"
+    assert exc.value.retry_after == pytest.approx(1.0)
+    clock.now = 1.0
+    limiter.check("a@test.com", "3.3.3.3")
+
+def test_client_bucket_spans_emails():
+    clock = FakeClock()
+    limiter = make_limiter(clock, client_burst=2)
+    limiter.check("a@test.com", "1.1.1.1")
+    limiter.check("b@test.com", "1.1.1.1")
+    before = metrics.LOGIN_THROTTLED.value(reason="client")
+    with pytest.raises(LoginThrottled):
+        limiter.check("c@test.com", "1.1.1.1")
+    assert metrics.LOGIN_THROTTLED.value(reason="client") == before + 1
+    # El intento rechazado no consumió el token del email
+    limiter.check("c@test.com", "2.2.2.2")
+    limiter.check("c@test.com", "2.2.2.2")
+
+def test_lockout_after_failures():
+    clock = FakeClock()
+    limiter = make_limiter(clock, email_burst=0)
+    for _ in range(3):
+        limiter.check("a@test.com", "1.1.1.1")
+        limiter.record_failure("a@test.com")
+    with pytest.raises(LoginThrottled) as exc:
+        limiter.check("a@test.com", "1.1.1.1")
+    assert exc.value.reason == "lockout"
+    clock.now = 61
+    limiter.check("a@test.com", "1.1.1.1")
+
+def test_success_resets_failures():
+    limiter = make_limiter(FakeClock(), email_burst=0)
+    limiter.record_failure("a@test.com")
+    limiter.record_failure("a@test.com")
+    limiter.record_success("a@test.com")
+    limiter.record_failure("a@test.com")
+    limiter.check("a@test.com", "1.1.1.1")
+
+def test_keys_are_bounded():
+    limiter = make_limiter(FakeClock(), max_keys=10)
+    for i in range(50):
+        limiter.check(f"u{i}@test.com", f"10.0.0.{i}")
+    assert limiter.stats()["size"] == 10
+
+def test_lockouts_survive_key_flood():
+    clock = FakeClock()
+    limiter = make_limiter(clock, email_burst=0, max_keys=10)
+    for _ in range(3):
+        limiter.record_failure("a@test.com")
+    for i in range(50):
+        limiter.check(f"u{i}@test.com", f"10.0.0.{i}")
+    with pytest.raises(LoginThrottled) as exc:
+        limiter.check("a@test.com", "1.1.1.1")
+    assert exc.value.reason == "lockout"
+    assert limiter.stats()["lockouts"] == 1
+
+def test_peer_address():
+    assert peer_address("ipv4:10.1.2.3:5000") == "10.1.2.3"
+    assert peer_address("ipv6:[::1]:5000") == "[::1]"
+    assert peer_address("unix:/tmp/sock") == "unix:/tmp/sock"
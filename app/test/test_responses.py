@@ -0,0 +1,21 @@
+import json
+from bson import ObjectId
+from app import responses
+
+def test_user_serializer_and_ndjson():
+    oid = ObjectId()
+    user = {"_id": oid, "username": "ñandú", "email": "e@test.com"}
+    assert responses.user_serializer(user) == {"id": str(oid), "username": "ñandú", "email": "e@test.com"}
+    lines = responses.ndjson([user, user]).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [str(oid), str(oid)]
+
+def test_encoders_agree():
+    content = {"users": [{"id": "1", "username": "ñ", "email": "a\"b"}], "next_after": None}
+    assert json.loads(responses.dumps_stdlib(content)) == content
+    if responses.orjson is not None:
+        assert responses.dumps_orjson(content) == responses.dumps_stdlib(content)
+
+def test_fast_json_response_renders_bytes():
+    response = responses.FastJSONResponse({"id": "1"})
+    assert response.body == b'{"id":"1"}'
+    assert response.media_type == "application/json"
@@ -1,8 +1,19 @@
 import pytest
+from datetime import timedelta
 from unittest.mock import MagicMock, patch
+from app.auth import create_access_token
+from app.cache import get_user_cache
+from app.config import USERS_MAX_BATCH_SIZE
+from app.database import indexes_ready
+from app.projections import AUTH_PROJECTION, PROFILE_PROJECTION
+from app.ratelimit import LoginLimiter, set_login_limiter
 from app.service import UserService
+from app.store import MongoUserStore
 import app.proto.user_pb2 as user_pb2
 import grpc
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from google.protobuf.field_mask_pb2 import FieldMask
 
 class DummyContext:
     def __init__(self):
@@ -12,26 +23,35 @@ class DummyContext:
         self.code = code
     def set_details(self, details):
         self.details = details
+    def peer(self):
+        return "ipv4:127.0.0.1:50000"
 
 @pytest.fixture
 def user_service():
-    with patch("app.service.get_db") as mock_get_db:
-        mock_db = MagicMock()
-        mock_collection = MagicMock()
-        mock_db.__getitem__.return_value = mock_collection
-        mock_get_db.return_value = mock_db
-        yield UserService()
+    get_user_cache().clear()
+    set_login_limiter(LoginLimiter())
+    indexes_ready.set()
+    yield UserService(MongoUserStore(MagicMock()))
+    indexes_ready.clear()
 
 def test_create_user(user_service):
-    user_service.collection.insert_one.return_value.inserted_id = "123"
+    user_service.store.collection.insert_one.return_value.inserted_id = "123"
     req = user_pb2.CreateUserRequest(username="user", email="mail@test.com", password="pw")
     response = user_service.CreateUser(req, DummyContext())
     assert response.username == "user"
     assert response.email == "mail@test.com"
     assert response.id == "123"
 
+def test_create_user_unavailable_until_indexes_verified(user_service):
+    indexes_ready.clear()
+    context = DummyContext()
+    req = user_pb2.CreateUserRequest(username="user", email="mail@test.com", password="pw")
+    assert user_service.CreateUser(req, context).id == ""
+    assert context.code == grpc.StatusCode.UNAVAILABLE
+    user_service.store.collection.insert_one.assert_not_called()
+
 def test_get_user_found(user_service):
-    user_service.collection.find_one.return_value = {"_id": "123", "username": "u", "email": "e"}
+    user_service.store.collection.find_one.return_value = {"_id": "123", "username": "u", "email": "e"}
     req = user_pb2.GetUserRequest(id="123")
     resp = user_service.GetUser(req, DummyContext())
     # Si el servicio no rellena los campos, verifica por qué. Puedes agregar un print(resp) para debug.
@@ -39,27 +59,61 @@ def test_get_user_found(user_service):
     assert resp.email == "e"
     assert resp.id == "123"
 
+def test_get_user_if_version(user_service):
+    oid = ObjectId()
+    user_service.store.collection.find_one.return_value = {
+        "_id": oid, "username": "u", "email": "e", "version": 2
+    }
+    resp = user_service.GetUser(user_pb2.GetUserRequest(id=str(oid)), DummyContext())
+    assert resp.version == 2 and not resp.not_modified
+    # Segunda lectura desde la caché: si la versión coincide no hay perfil
+    resp = user_service.GetUser(user_pb2.GetUserRequest(id=str(oid), if_version=2), DummyContext())
+    assert resp.not_modified and resp.version == 2 and resp.username == ""
+    resp = user_service.GetUser(user_pb2.GetUserRequest(id=str(oid), if_version=1), DummyContext())
+    assert not resp.not_modified and resp.username == "u"
+    assert user_service.store.collection.find_one.call_count == 1
+
 def test_get_user_not_found(user_service):
-    user_service.collection.find_one.return_value = None
+    user_service.store.collection.find_one.return_value = None
     req = user_pb2.GetUserRequest(id="notfound")
     ctx = DummyContext()
     resp = user_service.GetUser(req, ctx)
     assert ctx.code == grpc.StatusCode.NOT_FOUND
 
+def test_get_user_uses_cache(user_service):
+    oid = ObjectId()
+    user_service.store.collection.find_one.return_value = {"_id": oid, "username": "u", "email": "e"}
+    req = user_pb2.GetUserRequest(id=str(oid))
+    user_service.GetUser(req, DummyContext())
+    resp = user_service.GetUser(req, DummyContext())
+    assert resp.username == "u"
+    user_service.store.collection.find_one.assert_called_once()
+
+def test_delete_user_invalidates_cache(user_service):
+    oid = ObjectId()
+    user_service.cache.set({"_id": oid, "username": "u", "email": "e"})
+    user_service.store.collection.delete_one.return_value.deleted_count = 1
+    user_service.DeleteUser(user_pb2.DeleteUserRequest(id=str(oid)), DummyContext())
+    user_service.store.collection.find_one.return_value = None
+    ctx = DummyContext()
+    user_service.GetUser(user_pb2.GetUserRequest(id=str(oid)), ctx)
+    assert ctx.code == grpc.StatusCode.NOT_FOUND
+
 def test_update_user_found(user_service):
-    user_service.collection.update_one.return_value.matched_count = 1
-    user_service.collection.find_one.return_value = {"_id": "X", "username": "nuevo", "email": "nuevo@x.com"}
+    oid = ObjectId()
+    user_service.store.collection.find_one_and_update.return_value = {"_id": oid, "username": "nuevo", "email": "nuevo@x.com"}
     req = user_pb2.UpdateUserRequest(
-        id="X", username="nuevo", email="nuevo@x.com", password="pw"
+        id=str(oid), username="nuevo", email="nuevo@x.com", password="pw"
     )
     resp = user_service.UpdateUser(req, DummyContext())
     assert resp.username == "nuevo"
     assert resp.email == "nuevo@x.com"
-    assert resp.id == "X"
+    assert resp.id == str(oid)
+    user_service.store.collection.find_one.assert_not_called()
 
 def test_update_user_not_found(user_service):
     # Usa un id válido de ObjectId (24 chars hex) para que pase la validación:
-    user_service.collection.update_one.return_value.matched_count = 0
+    user_service.store.collection.find_one_and_update.return_value = None
     req = user_pb2.UpdateUserRequest(
         id="507f1f77bcf86cd799439011", username="n", email="n", password="pw"
     )
@@ -67,6 +121,27 @@ def test_update_user_not_found(user_service):
     resp = user_service.UpdateUser(req, ctx)
     assert ctx.code == grpc.StatusCode.NOT_FOUND
 
+def test_update_user_mask_skips_password_hash(user_service):
+    oid = ObjectId()
+    user_service.store.collection.find_one_and_update.return_value = {"_id": oid, "username": "solo", "email": "e"}
+    req = user_pb2.UpdateUserRequest(
+        id=str(oid), username="solo", update_mask=FieldMask(paths=["username"])
+    )
+    with patch("app.service.get_password_hash") as hash_pw:
+        resp = user_service.UpdateUser(req, DummyContext())
+    hash_pw.assert_not_called()
+    assert resp.username == "solo"
+    update = user_service.store.collection.find_one_and_update.call_args[0][1]
+    assert update == {"$set": {"username": "solo"}, "$inc": {"version": 1}}
+
+def test_update_user_mask_unknown_field(user_service):
+    req = user_pb2.UpdateUserRequest(
+        id="507f1f77bcf86cd799439011", update_mask=FieldMask(paths=["rol"])
+    )
+    ctx = DummyContext()
+    user_service.UpdateUser(req, ctx)
+    assert ctx.code == grpc.StatusCode.INVALID_ARGUMENT
+
 def test_update_user_invalid_id(user_service):
     # Esto sí debe dar INVALID_ARGUMENT:
     req = user_pb2.UpdateUserRequest(id="X", username="n", email="n", password="pw")
@@ -75,22 +150,29 @@ def test_update_user_invalid_id(user_service):
     assert ctx.code == grpc.StatusCode.INVALID_ARGUMENT
 
 def test_delete_user(user_service):
-    user_service.collection.delete_one.return_value.deleted_count = 1
+    user_service.store.collection.delete_one.return_value.deleted_count = 1
     req = user_pb2.DeleteUserRequest(id="X")
     resp = user_service.DeleteUser(req, DummyContext())
     assert isinstance(resp, user_pb2.Empty)
 
 def test_register_already_exists(user_service):
-    user_service.collection.find_one.return_value = {"email": "exist@test.com"}
+    user_service.store.collection.insert_one.side_effect = DuplicateKeyError("E11000 duplicate key")
     req = user_pb2.RegisterRequest(username="a", email="exist@test.com", password="pw")
     ctx = DummyContext()
     resp = user_service.Register(req, ctx)
     assert ctx.code == grpc.StatusCode.ALREADY_EXISTS
 
+def test_register_single_insert(user_service):
+    user_service.store.collection.insert_one.return_value.inserted_id = "abc"
+    req = user_pb2.RegisterRequest(username="a", email="new@test.com", password="pw")
+    resp = user_service.Register(req, DummyContext())
+    assert resp.id == "abc"
+    user_service.store.collection.find_one.assert_not_called()
+
 def test_login_success(user_service):
     with patch("app.service.verify_password", return_value=True), \
          patch("app.service.create_access_token", return_value="token"):
-        user_service.collection.find_one.return_value = {"email": "e", "password": "hashed"}
+        user_service.store.collection.find_one.return_value = {"email": "e", "password": "hashed"}
         req = user_pb2.LoginRequest(email="e", password="pw")
         ctx = DummyContext()
         resp = user_service.Login(req, ctx)
@@ -99,8 +181,123 @@ def test_login_success(user_service):
 
 def test_login_fail(user_service):
     with patch("app.service.verify_password", return_value=False):
-        user_service.collection.find_one.return_value = {"email": "e", "password": "hashed"}
+        user_service.store.collection.find_one.return_value = {"email": "e", "password": "hashed"}
         req = user_pb2.LoginRequest(email="e", password="pw")
         ctx = DummyContext()
         resp = user_service.Login(req, ctx)
-        assert ctx.code == grpc.StatusCode.UNAUTHENTICATED
\ No newline at end of file
+        assert ctx.code == grpc.StatusCode.UNAUTHENTICATED
+
+def _mock_page(user_service, docs):
+    find = user_service.store.collection.find.return_value
+    find.sort.return_value.limit.return_value.batch_size.return_value = iter(docs)
+    return user_service.store.collection.find
+
+def test_list_users_paginates(user_service):
+    docs = [{"_id": ObjectId(), "username": f"u{i}", "email": f"e{i}"} for i in range(3)]
+    find = _mock_page(user_service, docs)
+    req = user_pb2.ListUsersRequest(page_size=2)
+    resp = user_service.ListUsers(req, DummyContext())
+    assert [u.username for u in resp.users] == ["u0", "u1"]
+    assert resp.next_page_token
+    # La proyección deja fuera el hash de la contraseña
+    assert "password" not in find.call_args[0][1]
+
+    find = _mock_page(user_service, [])
+    user_service.ListUsers(
+        user_pb2.ListUsersRequest(page_size=2, page_token=resp.next_page_token), DummyContext()
+    )
+    assert find.call_args[0][0] == {"_id": {"$gt": docs[1]["_id"]}}
+
+def test_list_users_last_page(user_service):
+    _mock_page(user_service, [{"_id": ObjectId(), "username": "u", "email": "e"}])
+    resp = user_service.ListUsers(user_pb2.ListUsersRequest(page_size=2), DummyContext())
+    assert len(resp.users) == 1
+    assert resp.next_page_token == ""
+
+def test_list_users_invalid_token(user_service):
+    ctx = DummyContext()
+    user_service.ListUsers(user_pb2.ListUsersRequest(page_token="no-valido"), ctx)
+    assert ctx.code == grpc.StatusCode.INVALID_ARGUMENT
+
+def test_stream_users(user_service):
+    docs = [{"_id": ObjectId(), "username": f"u{i}", "email": f"e{i}"} for i in range(3)]
+    cursor = MagicMock()
+    cursor.__enter__.return_value = cursor
+    cursor.__iter__.return_value = iter(docs)
+    user_service.store.collection.find.return_value.sort.return_value.batch_size.return_value = cursor
+    resp = list(user_service.StreamUsers(user_pb2.ListUsersRequest(), DummyContext()))
+    assert [u.username for u in resp] == ["u0", "u1", "u2"]
+    cursor.__exit__.assert_called_once()
+
+def test_batch_get_users_keeps_order(user_service):
+    first, second = ObjectId(), ObjectId()
+    user_service.store.collection.find.return_value = [
+        {"_id": second, "username": "b", "email": "b"},
+        {"_id": first, "username": "a", "email": "a"},
+    ]
+    missing = str(ObjectId())
+    req = user_pb2.BatchGetUsersRequest(ids=[str(first), missing, str(second)])
+    resp = user_service.BatchGetUsers(req, DummyContext())
+    assert [u.username for u in resp.users] == ["a", "b"]
+    assert list(resp.not_found_ids) == [missing]
+    query = user_service.store.collection.find.call_args[0][0]
+    assert query["_id"]["$in"] == [first, ObjectId(missing), second]
+
+def test_batch_create_users_reports_per_item(user_service):
+    def insert_many(docs, ordered):
+        assert ordered is False
+        for doc in docs:
+            doc["_id"] = ObjectId()
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "dup"}]})
+    user_service.store.collection.insert_many.side_effect = insert_many
+    req = user_pb2.BatchCreateUsersRequest(users=[
+        user_pb2.CreateUserRequest(username="a", email="a@x", password="pw"),
+        user_pb2.CreateUserRequest(username="b", email="b@x", password="pw"),
+        user_pb2.CreateUserRequest(username="c", email="c@x", password=""),
+    ])
+    with patch("app.service.get_password_hashes", side_effect=lambda pws: ["h"] * len(pws)):
+        resp = user_service.BatchCreateUsers(req, DummyContext())
+    assert [r.index for r in resp.results] == [0, 1, 2]
+    assert resp.results[0].user.email == "a@x"
+    assert resp.results[1].error == "Email ya registrado"
+    assert resp.results[2].error
+
+def test_batch_delete_users(user_service):
+    user_service.store.collection.delete_many.return_value.deleted_count = 1
+    req = user_pb2.BatchDeleteUsersRequest(ids=[str(ObjectId()), "malo"])
+    resp = user_service.BatchDeleteUsers(req, DummyContext())
+    assert resp.deleted_count == 1
+    assert list(resp.invalid_ids) == ["malo"]
+
+def test_reads_never_fetch_password_hash_unless_login(user_service):
+    oid = ObjectId()
+    user_service.store.collection.find_one.return_value = {"_id": oid, "username": "u", "email": "e"}
+    user_service.GetUser(user_pb2.GetUserRequest(id=str(oid)), DummyContext())
+    assert user_service.store.collection.find_one.call_args[0][1] == PROFILE_PROJECTION
+    user_service.store.collection.find_one.return_value = {"email": "e", "password": "hash"}
+    with patch("app.service.verify_password", return_value=False):
+        user_service.Login(user_pb2.LoginRequest(email="e", password="pw"), DummyContext())
+    assert user_service.store.collection.find_one.call_args[0][1] == AUTH_PROJECTION
+
+def test_login_throttled_before_lookup(user_service):
+    set_login_limiter(LoginLimiter(email_burst=0, client_burst=0, lockout_failures=1))
+    user_service.store.collection.find_one.return_value = None
+    user_service.Login(user_pb2.LoginRequest(email="e", password="pw"), DummyContext())
+    ctx = DummyContext()
+    user_service.Login(user_pb2.LoginRequest(email="e", password="pw"), ctx)
+    assert ctx.code == grpc.StatusCode.RESOURCE_EXHAUSTED
+    user_service.store.collection.find_one.assert_called_once()
+
+def test_validate_tokens(user_service):
+    good = create_access_token({"sub": "a@test.com"})
+    expired = create_access_token({"sub": "b@test.com"}, expires_delta=timedelta(seconds=-1))
+    req = user_pb2.ValidateTokensRequest(tokens=[good, "basura", expired, good])
+    resp = user_service.ValidateTokens(req, DummyContext())
+    assert [result.valid for result in resp.results] == [True, False, False, True]
+    assert resp.results[0].subject == "a@test.com" and resp.results[0].expires_at > 0
+    assert resp.results[1].error == "Token inválido o expirado"
+
+def test_validate_tokens_batch_too_large(user_service):
+    ctx = DummyContext()
+    user_service.ValidateTokens(user_pb2.ValidateTokensRequest(tokens=["t"] * (USERS_MAX_BATCH_SIZE + 1)), ctx)
+    assert ctx.code == grpc.StatusCode.INVALID_ARGUMENT
@@ -0,0 +1,78 @@
+import asyncio
+from unittest.mock import patch
+import pytest
+import rsa
+from jose import JWTError, jwt
+from app import auth, metrics
+from app.signing import KeyRing, SharedSecret, SigningKey, generate_key, set_signer, write_key
+
+@pytest.fixture
+def ring():
+    keys = [SigningKey.from_pem(kid, generate_key("ES256")) for kid in ("2026-01", "2026-02")]
+    return KeyRing(keys)
+
+def test_signs_with_newest_key_and_kid(ring):
+    token = ring.sign({"sub": "a"})
+    assert jwt.get_unverified_header(token) == {"alg": "ES256", "kid": "2026-02", "typ": "JWT"}
+    assert ring.verify(token)["sub"] == "a"
+
+def test_rotation_keeps_old_tokens_valid(ring):
+    old = KeyRing(list(ring.keys.values()), active_kid="2026-01").sign({"sub": "a"})
+    assert ring.verify(old)["sub"] == "a"
+    retired = ring.keys["2026-01"]
+    public_only = SigningKey.from_pem(retired.kid, retired.public.to_pem().decode())
+    assert public_only.private is None
+    assert KeyRing([public_only, ring.keys["2026-02"]]).verify(old)["sub"] == "a"
+
+def test_rejects_unknown_kid_and_other_algorithms(ring):
+    other = KeyRing([SigningKey.from_pem("2026-02", generate_key("ES256"))])
+    with pytest.raises(JWTError):
+        ring.verify(other.sign({"sub": "a"}))
+    with pytest.raises(JWTError):
+        ring.verify(KeyRing([SigningKey.from_pem("x", generate_key("ES256"))]).sign({"sub": "a"}))
+    hs256 = jwt.encode({"sub": "a"}, "secreto", algorithm="HS256", headers={"kid": "2026-02"})
+    with pytest.raises(JWTError):
+        ring.verify(hs256)
+
+def test_jwks_publishes_public_keys_only(ring):
+    keys = ring.jwks()["keys"]
+    assert [key["kid"] for key in keys] == ["2026-01", "2026-02"]
+    assert all(key["kty"] == "EC" and key["use"] == "sig" and "d" not in key for key in keys)
+    assert SharedSecret("x").jwks() == {"keys": []}
+
+def test_load_from_dir(tmp_path):
+    write_key(str(tmp_path), "a")
+    write_key(str(tmp_path), "b")
+    with pytest.raises(FileExistsError):
+        write_key(str(tmp_path), "b")
+    ring = KeyRing.from_dir(str(tmp_path), active_kid="a")
+    assert ring.active.kid == "a" and set(ring.keys) == {"a", "b"}
+    with pytest.raises(ValueError):
+        KeyRing.from_dir(str(tmp_path), active_kid="c")
+
+def test_auth_uses_configured_signer(ring):
+    set_signer(ring)
+    try:
+        token = auth.create_access_token({"sub": "x"})
+        assert jwt.get_unverified_header(token)["kid"] == "2026-02"
+        assert auth.decode_access_token(token)["sub"] == "x"
+    finally:
+        set_signer(None)
+
+def test_async_tokens_run_off_the_loop_and_label_verifying_key(ring):
+    # Clave RSA pequeña solo para el test: el algoritmo de la que verifica no es el activo
+    _, private = rsa.newkeys(512)
+    retired = SigningKey.from_pem("2025-12", private.save_pkcs1().decode())
+    old = KeyRing([retired], active_kid="2025-12").sign({"sub": "a"})
+    set_signer(KeyRing([retired] + list(ring.keys.values())))
+    before = metrics.TOKEN_VERIFY_LATENCY.count(algorithm="RS256")
+    try:
+        with patch.object(auth, "token_cache", None), \
+                patch("asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+            assert asyncio.run(auth.verify_token_async(old))["sub"] == "a"
+            token = asyncio.run(auth.create_access_token_async({"sub": "b"}))
+        assert to_thread.call_count == 2
+        assert jwt.get_unverified_header(token)["kid"] == "2026-02"
+        assert metrics.TOKEN_VERIFY_LATENCY.count(algorithm="RS256") == before + 1
+    finally:
+        set_signer(None)
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ExecutionTimeout, OperationFailure
+from app.batch import insert_outcomes
+from app.cache import get_user_cache
+from app.pagination import InvalidPageToken
+from app.projections import AUTH_PROJECTION
+from app.service import UserService
+from app.store import (
+    AsyncMemoryUserStore, AsyncMongoUserStore, AsyncUserStore, MemoryUserStore,
+    MongoUserStore, UserStore
+)
+import app.proto.user_pb2 as user_pb2
+
+def make_user(i):
+    return {"username": f"u{i}", "email": f"u{i}@test.com", "password": "hash"}
+
+def test_insert_and_lookup():
+    store = MemoryUserStore()
+    user_id = store.insert(make_user(1))
+    assert store.get_by_id(user_id)["email"] == "u1@test.com"
+    assert store.get_by_email("u1@test.com")["_id"] == user_id
+    assert store.get_by_email("nadie@test.com") is None
+    assert "password" not in store.get_by_id(user_id)
+    assert store.get_by_email("u1@test.com", AUTH_PROJECTION) == {
+        "email": "u1@test.com", "password": "hash"
+    }
+
+def test_incomplete_engine_fails_on_instantiation():
+    class OnlyReads(UserStore):
+        def get_by_id(self, user_id, projection=None):
+            return None
+
+    class NoMethods(AsyncUserStore):
+        pass
+
+    for engine in (OnlyReads, NoMethods):
+        with pytest.raises(TypeError):
+            engine()
+
+def test_duplicate_email():
+    store = MemoryUserStore()
+    store.insert(make_user(1))
+    with pytest.raises(DuplicateKeyError):
+        store.insert(make_user(1))
+    other = store.insert(make_user(2))
+    with pytest.raises(DuplicateKeyError):
+        store.update(other, {"email": "u1@test.com"})
+
+def test_update_moves_email_index():
+    store = MemoryUserStore()
+    user_id = store.insert(make_user(1))
+    updated = store.update(user_id, {"email": "nuevo@test.com"}, {"email": 1})
+    assert updated == {"_id": user_id, "email": "nuevo@test.com"}
+    assert store.get_by_email("u1@test.com") is None
+    assert store.update(ObjectId(), {"username": "x"}) is None
+
+def test_update_bumps_version():
+    store = MemoryUserStore()
+    user_id = store.insert(make_user(1))
+    assert store.get_by_id(user_id)["version"] == 1
+    store.update(user_id, {"username": "x"})
+    assert store.get_version(user_id) == 2
+    assert store.get_version(email="u1@test.com") == 2
+    assert store.get_version(ObjectId()) is None
+    # Documentos anteriores al contador: versión 0
+    legacy = {"username": "l", "email": "l@test.com", "version": None}
+    legacy_id = store.insert(legacy)
+    assert store.get_version(legacy_id) == 0
+    assert store.update(legacy_id, {"username": "m"})["version"] == 1
+
+MISSING_INDEX = OperationFailure(
+    "error processing query: planner returned error :: caused by :: "
+    "hint provided does not correspond to an existing index", code=2)
+
+def test_get_version_without_version_index():
+    collection = MagicMock()
+    collection.find_one.side_effect = [MISSING_INDEX, {"version": 4}]
+    user_id = ObjectId()
+    assert MongoUserStore(collection).get_version(user_id) == 4
+    first, second = collection.find_one.call_args_list
+    assert first.kwargs == {"hint": "id_version"}
+    assert second.args == ({"_id": user_id}, {"_id": 0, "version": 1})
+    assert second.kwargs == {}
+
+    async_collection = MagicMock()
+    async_collection.find_one = AsyncMock(side_effect=[MISSING_INDEX, None])
+    store = AsyncMongoUserStore(async_collection)
+    assert asyncio.run(store.get_version(email="nadie@test.com")) is None
+    assert async_collection.find_one.await_count == 2
+
+    # Otros fallos (p.ej. deadline) no se reintentan
+    collection.find_one.side_effect = ExecutionTimeout("operation exceeded time limit", 50)
+    with pytest.raises(ExecutionTimeout):
+        MongoUserStore(collection).get_version(user_id)
+
+def test_delete():
+    store = MemoryUserStore()
+    ids = [store.insert(make_user(i)) for i in range(3)]
+    assert store.delete(ids[0])
+    assert not store.delete(ids[0])
+    assert store.delete_many([ids[1], ids[2], ObjectId()]) == 2
+    assert len(store) == 0
+    assert store.get_by_email("u1@test.com") is None
+
+def test_insert_many_reports_duplicates():
+    store = MemoryUserStore()
+    store.insert(make_user(1))
+    docs = [(0, make_user(0)), (1, make_user(1)), (2, make_user(2))]
+    with pytest.raises(BulkWriteError) as exc:
+        store.insert_many([doc for _, doc in docs])
+    outcomes = list(insert_outcomes(docs, exc.value))
+    assert [message for *_, message in outcomes] == [None, "Email ya registrado", None]
+    assert len(store) == 3
+
+def test_page_and_iterate():
+    store = MemoryUserStore()
+    ids = sorted(store.insert(make_user(i)) for i in range(5))
+    users, token = store.page(2)
+    assert [u["_id"] for u in users] == ids[:2]
+    assert "password" not in users[0]
+    users, token = store.page(2, token)
+    users, token = store.page(2, token)
+    assert [u["_id"] for u in users] == ids[4:] and token == ""
+    with store.iterate() as cursor:
+        assert [u["_id"] for u in cursor] == ids
+    with pytest.raises(InvalidPageToken):
+        store.iterate("no-valido")
+
+def test_concurrent_inserts():
+    store = MemoryUserStore()
+    errors = []
+
+    def insert(offset):
+        for i in range(200):
+            try:
+                store.insert(make_user(i % 300 + offset))
+            except DuplicateKeyError:
+                errors.append(i)
+
+    threads = [threading.Thread(target=insert, args=(n * 100,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store) + len(errors) == 800
+    assert len(store) == len({u["email"] for u in store.iterate()})
+
+def test_async_store_shares_data():
+    store = MemoryUserStore()
+    async_store = AsyncMemoryUserStore(store)
+
+    async def run():
+        user_id = await async_store.insert(make_user(1))
+        users = []
+        async with async_store.iterate() as cursor:
+            async for user in cursor:
+                users.append(user)
+        return user_id, users
+
+    user_id, users = asyncio.run(run())
+    assert store.get_by_id(user_id)["username"] == "u1"
+    assert [u["_id"] for u in users] == [user_id]
+
+def test_service_over_memory_store():
+    get_user_cache().clear()
+    service = UserService(MemoryUserStore())
+    created = service.CreateUser(
+        user_pb2.CreateUserRequest(username="u", email="u@test.com", password="pw"), None
+    )
+    found = service.GetUser(user_pb2.GetUserRequest(id=created.id), None)
+    assert found.email == "u@test.com"
+    listed = service.ListUsers(user_pb2.ListUsersRequest(), None)
+    assert [u.id for u in listed.users] == [created.id]
+
+def test_replace_password_only_if_unchanged():
+    store = MemoryUserStore()
+    store.insert(make_user(1))
+    old = store.get_by_email("u1@test.com", AUTH_PROJECTION)["password"]
+    assert store.replace_password("u1@test.com", old, "nuevo")
+    assert not store.replace_password("u1@test.com", old, "otro")
+    assert not store.replace_password("nadie@test.com", old, "otro")
+    assert store.get_by_email("u1@test.com", AUTH_PROJECTION)["password"] == "nuevo"
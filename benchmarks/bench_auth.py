@@ -0,0 +1,49 @@
+# Coste de autenticación por petición: verificación JWT completa vs caché de tokens
+#   python -m benchmarks.bench_auth [-n 20000]
+import argparse
+import timeit
+from app import auth
+from app.cache import ExpiringLRU
+
+def per_call_us(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+def run_coroutine(coro):
+    # get_current_user no espera nada: se ejecuta sin event loop para no medir asyncio
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+
+def run(number):
+    token = auth.create_access_token({"sub": "bench@test.com"})
+    get_current_user = lambda: run_coroutine(auth.get_current_user(token))
+    saved = auth.token_cache
+    results = {}
+    try:
+        auth.token_cache = None
+        results["decode_access_token sin caché"] = per_call_us(
+            lambda: auth.decode_access_token(token), number
+        )
+        auth.token_cache = ExpiringLRU(1000, clock=auth.time.time)
+        auth.decode_access_token(token)
+        results["decode_access_token con caché"] = per_call_us(
+            lambda: auth.decode_access_token(token), number
+        )
+        auth.token_cache = None
+        results["get_current_user sin caché"] = per_call_us(get_current_user, number)
+        auth.token_cache = ExpiringLRU(1000, clock=auth.time.time)
+        results["get_current_user con caché"] = per_call_us(get_current_user, number)
+    finally:
+        auth.token_cache = saved
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    args = parser.parse_args()
+    for name, us in run(args.number).items():
+        print(f"{name:35s} {us:8.2f} µs/llamada")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# Compara dos ficheros JSON de resultados (micro o load) escenario a escenario
+#   python -m benchmarks.compare antes.json despues.json
+import argparse
+import json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+
+def load(path):
+    with open(path) as source:
+        return json.load(source)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    before, after = load(args.before), load(args.after)
+    print(f"{before.get('commit') or args.before} -> {after.get('commit') or args.after}")
+    print(f"{'escenario':32s} " + " ".join(f"{metric:>20s}" for metric in METRICS))
+    for name, new in after["results"].items():
+        old = before["results"].get(name)
+        if old is None:
+            continue
+        cells = []
+        for metric in METRICS:
+            if metric not in old or metric not in new:
+                cells.append(f"{'-':>20s}")
+                continue
+            change = ((new[metric] - old[metric]) / old[metric] * 100) if old[metric] else 0.0
+            cells.append(f"{new[metric]:12.3f} ({change:+5.1f}%)")
+        print(f"{name:32s} " + " ".join(cells))
+
+if __name__ == "__main__":
+    main()
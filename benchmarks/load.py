@@ -0,0 +1,223 @@
+# Generador de carga extremo a extremo contra la app FastAPI y el UserService gRPC.
+#   python -m benchmarks.load --backend memory -c 50 -d 10 --output load.json
+#   python -m benchmarks.load --backend mongo --mongo-uri mongodb://localhost:27017/
+#   python -m benchmarks.load --http-url http://localhost:8000 --grpc-target localhost:50051
+# Sin --http-url/--grpc-target la app y el servidor gRPC se levantan en este proceso.
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from concurrent import futures
+import grpc
+try:
+    import httpx
+except ImportError:  # no es dependencia de la app: solo la usa este generador de carga
+    raise SystemExit("benchmarks.load necesita httpx: pip install httpx") from None
+from app import auth
+from app.cache import NullUserCache, set_user_cache
+from app.instrumentation import (
+    AdmissionInterceptor, AsyncAdmissionInterceptor, AsyncCompressionInterceptor,
+    AsyncDeadlineInterceptor, CompressionInterceptor, DeadlineInterceptor
+)
+from app.ratelimit import NullLoginLimiter, set_login_limiter
+from app.main import app as http_app, get_user_store
+from app.service import UserService
+from app.aio_service import AsyncUserService
+from app.store import (
+    AsyncMemoryUserStore, AsyncMongoUserStore, MemoryUserStore, MongoUserStore
+)
+import app.proto.user_pb2 as user_pb2
+import app.proto.user_pb2_grpc as user_pb2_grpc
+from benchmarks.report import summarize, print_table, write_json
+
+PASSWORD = "bench-password"
+SCENARIOS = {
+    "http.register", "http.login", "http.get_user", "http.get_me",
+    "grpc.GetUser", "grpc.ListUsers", "grpc.Login", "grpc.Register",
+}
+DEFAULT_SCENARIOS = "http.get_user,http.get_me,http.login,http.register,grpc.GetUser,grpc.ListUsers,grpc.Login"
+
+class Backend:
+    def __init__(self, kind, mongo_uri=None, mongo_db=None, keep=False):
+        self.kind = kind
+        self.mongo_uri = mongo_uri
+        self.mongo_db = mongo_db
+        self.keep = keep
+        if kind == "memory":
+            self.store = MemoryUserStore()
+        else:
+            from pymongo import MongoClient
+            from app.database import client_options, ensure_indexes
+            self._client = MongoClient(mongo_uri, **client_options())
+            db = self._client[mongo_db]
+            ensure_indexes(db)
+            self.store = MongoUserStore(db["users"])
+
+    def async_store(self):
+        if self.kind == "memory":
+            return AsyncMemoryUserStore(self.store)
+        from pymongo import AsyncMongoClient
+        from app.database import client_options
+        self._async_client = AsyncMongoClient(self.mongo_uri, **client_options())
+        return AsyncMongoUserStore(self._async_client[self.mongo_db]["users"])
+
+    def seed(self, count):
+        hashed = auth.get_password_hash(PASSWORD)
+        docs = [
+            {"username": f"seed{i}", "email": f"seed{i}@bench.local", "password": hashed}
+            for i in range(count)
+        ]
+        self.store.insert_many(docs)
+        return [doc["_id"] for doc in docs], [doc["email"] for doc in docs]
+
+    async def close(self):
+        if self.kind == "mongo":
+            if not self.keep:
+                self._client.drop_database(self.mongo_db)
+            self._client.close()
+            if hasattr(self, "_async_client"):
+                await self._async_client.close()
+
+async def run_scenario(operation, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id):
+        nonlocal errors
+        for i in itertools.count():
+            if time.perf_counter() >= deadline:
+                return
+            t0 = time.perf_counter()
+            try:
+                await operation(worker_id, i)
+            except (httpx.HTTPError, grpc.RpcError):
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(worker_id) for worker_id in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+def build_operations(http, stub, ids, emails, run_id):
+    token = auth.create_access_token({"sub": emails[0]})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def checked(response):
+        (await response).raise_for_status()
+
+    operations = {
+        "http.get_user": lambda w, i: checked(
+            http.get(f"/users/{random.choice(ids)}", headers=headers)),
+        "http.get_me": lambda w, i: checked(http.get("/users/me", headers=headers)),
+        "http.login": lambda w, i: checked(http.post(
+            "/login", data={"username": random.choice(emails), "password": PASSWORD})),
+        "http.register": lambda w, i: checked(http.post("/register", json={
+            "username": "new", "email": f"http-{run_id}-{w}-{i}@bench.local",
+            "password": PASSWORD})),
+        "grpc.GetUser": lambda w, i: stub.GetUser(
+            user_pb2.GetUserRequest(id=str(random.choice(ids)))),
+        "grpc.ListUsers": lambda w, i: stub.ListUsers(user_pb2.ListUsersRequest(page_size=100)),
+        "grpc.Login": lambda w, i: stub.Login(
+            user_pb2.LoginRequest(email=random.choice(emails), password=PASSWORD)),
+        "grpc.Register": lambda w, i: stub.Register(user_pb2.RegisterRequest(
+            username="new", email=f"grpc-{run_id}-{w}-{i}@bench.local", password=PASSWORD)),
+    }
+    return operations
+
+async def start_grpc_server(mode, backend, max_workers):
+    # Mismos interceptores de deadline, admisión y compresión que en producción
+    # (app.service.serve)
+    if mode == "aio":
+        server = grpc.aio.server(
+            interceptors=[AsyncDeadlineInterceptor(), AsyncAdmissionInterceptor(),
+                          AsyncCompressionInterceptor()])
+        user_pb2_grpc.add_UserServiceServicer_to_server(
+            AsyncUserService(backend.async_store()), server)
+    else:
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers),
+                             interceptors=[DeadlineInterceptor(), AdmissionInterceptor(),
+                                           CompressionInterceptor()])
+        user_pb2_grpc.add_UserServiceServicer_to_server(UserService(backend.store), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    result = server.start()
+    if asyncio.iscoroutine(result):
+        await result
+    return server, f"127.0.0.1:{port}"
+
+async def stop_grpc_server(server):
+    result = server.stop(None)
+    if asyncio.iscoroutine(result):
+        await result
+
+async def main_async(args):
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - SCENARIOS
+    if unknown:
+        raise SystemExit(f"Escenarios desconocidos: {', '.join(sorted(unknown))}")
+    if args.no_cache:
+        set_user_cache(NullUserCache())
+    if not args.login_limiter:
+        # Todas las peticiones salen de una dirección: el limitador cortaría los escenarios de login
+        set_login_limiter(NullLoginLimiter())
+
+    backend = Backend(args.backend, args.mongo_uri, args.mongo_db, args.keep)
+    ids, emails = backend.seed(args.seed_users)
+    server = None
+    if args.http_url:
+        http = httpx.AsyncClient(base_url=args.http_url, timeout=30)
+    else:
+        store = backend.async_store()
+        http_app.dependency_overrides[get_user_store] = lambda: store
+        http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=http_app), base_url="http://bench", timeout=30
+        )
+    target = args.grpc_target
+    if not target:
+        server, target = await start_grpc_server(args.grpc_mode, backend, args.grpc_workers)
+    channel = grpc.aio.insecure_channel(target)
+    stub = user_pb2_grpc.UserServiceStub(channel)
+
+    operations = build_operations(http, stub, ids, emails, run_id=int(time.time()))
+    results = {}
+    try:
+        for name in scenarios:
+            results[name] = await run_scenario(operations[name], args.concurrency, args.duration)
+            print(f"  {name}: {results[name]['count']} peticiones")
+    finally:
+        await channel.close()
+        await http.aclose()
+        if server is not None:
+            await stop_grpc_server(server)
+        http_app.dependency_overrides.clear()
+        await backend.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="Segundos por escenario")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS,
+                        help=f"Lista separada por comas de: {', '.join(sorted(SCENARIOS))}")
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--mongo-db", default="userdb_bench")
+    parser.add_argument("--keep", action="store_true", help="No borrar la base de benchmark al terminar")
+    parser.add_argument("--seed-users", type=int, default=1000)
+    parser.add_argument("--no-cache", action="store_true", help="Desactiva la caché de usuarios")
+    parser.add_argument("--login-limiter", action="store_true",
+                        help="Mantiene el limitador de intentos de login (en proceso)")
+    parser.add_argument("--http-url", help="App HTTP externa (por defecto, en proceso)")
+    parser.add_argument("--grpc-target", help="Servidor gRPC externo (por defecto, en proceso)")
+    parser.add_argument("--grpc-mode", choices=["thread", "aio"], default="thread")
+    parser.add_argument("--grpc-workers", type=int, default=10)
+    parser.add_argument("--output", help="Guarda los resultados en JSON")
+    args = parser.parse_args()
+    results = asyncio.run(main_async(args))
+    print_table(results)
+    if args.output:
+        write_json(args.output, "load", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Micro-benchmarks de las piezas calientes de cada petición
+#   python -m benchmarks.micro [-n 20000] [--bcrypt-rounds 5] [--output micro.json]
+import argparse
+import json
+import time
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from app import auth, responses
+from app.cache import ExpiringLRU
+from app.signing import KeyRing, SharedSecret, SigningKey, generate_key
+from app.main import UserOut, UserPage, user_serializer
+from app.service import user_response
+import app.proto.user_pb2 as user_pb2
+from benchmarks.report import summarize, print_table, write_json
+
+def measure(fn, number):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(number):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, elapsed_s=time.perf_counter() - start)
+
+def serialization(user, page, number):
+    # Coste de codificar una respuesta de GET /users/{id} y de una página de GET /users
+    one = UserOut(**user_serializer(user))
+    body = {"users": [user_serializer(u) for u in page], "next_after": None}
+    pages = max(1, number // 100)
+    results = {
+        "json user (jsonable_encoder+json)": measure(
+            lambda: json.dumps(jsonable_encoder(user_serializer(user))).encode(), number),
+        "json user (pydantic)": measure(lambda: one.model_dump_json(), number),
+        "json user (stdlib)": measure(lambda: responses.dumps_stdlib(user_serializer(user)), number),
+        "json page x100 (jsonable_encoder+json)": measure(
+            lambda: json.dumps(jsonable_encoder(body)).encode(), pages),
+        "json page x100 (pydantic)": measure(
+            lambda: UserPage.model_validate(body).model_dump_json(), pages),
+        "json page x100 (stdlib)": measure(
+            lambda: responses.dumps_stdlib({"users": [user_serializer(u) for u in page]}), pages),
+    }
+    if responses.orjson is not None:
+        results["json user (orjson)"] = measure(
+            lambda: responses.dumps_orjson(user_serializer(user)), number)
+        results["json page x100 (orjson)"] = measure(
+            lambda: responses.dumps_orjson({"users": [user_serializer(u) for u in page]}), pages)
+    return results
+
+def token_signatures(number):
+    # Firma y verificación sin caché por algoritmo: lo que cuesta cada token que
+    # verificamos nosotros y no un servicio con el JWKS
+    signers = {"HS256": SharedSecret("bench")}
+    for algorithm in ("RS256", "ES256"):
+        signers[algorithm] = KeyRing([SigningKey.from_pem("bench", generate_key(algorithm))])
+    results = {}
+    rounds = max(1, number // 100)
+    for algorithm, signer in signers.items():
+        token = signer.sign({"sub": "bench@test.com"})
+        results[f"jwt sign {algorithm}"] = measure(lambda: signer.sign({"sub": "bench@test.com"}), rounds)
+        results[f"jwt verify {algorithm}"] = measure(lambda: signer.verify(token), rounds)
+    return results
+
+def run(number, bcrypt_rounds):
+    user = {"_id": ObjectId(), "username": "bench", "email": "bench@test.com"}
+    page = [dict(user, _id=ObjectId()) for _ in range(100)]
+    token = auth.create_access_token({"sub": user["email"]})
+    hashed = auth.get_password_hash("s3cret")
+    saved_cache = auth.token_cache
+    results = {}
+    try:
+        results["user_serializer"] = measure(lambda: user_serializer(user), number)
+        results.update(serialization(user, page, number))
+        results["pb.UserResponse"] = measure(lambda: user_response(user), number)
+        results["pb.UserListResponse x100"] = measure(
+            lambda: user_pb2.UserListResponse(users=[user_response(u) for u in page]).SerializeToString(),
+            max(1, number // 100),
+        )
+        results["create_access_token"] = measure(
+            lambda: auth.create_access_token({"sub": user["email"]}), number
+        )
+        auth.token_cache = None
+        results["decode_access_token (sin caché)"] = measure(
+            lambda: auth.decode_access_token(token), number
+        )
+        auth.token_cache = ExpiringLRU(1000, clock=time.time)
+        results["decode_access_token (caché)"] = measure(
+            lambda: auth.decode_access_token(token), number
+        )
+        results.update(token_signatures(number))
+        results["bcrypt hash"] = measure(lambda: auth.get_password_hash("s3cret"), bcrypt_rounds)
+        results["bcrypt verify"] = measure(lambda: auth.verify_password("s3cret", hashed), bcrypt_rounds)
+    finally:
+        auth.token_cache = saved_cache
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    parser.add_argument("--bcrypt-rounds", type=int, default=5)
+    parser.add_argument("--output", help="Guarda los resultados en JSON")
+    args = parser.parse_args()
+    results = run(args.number, args.bcrypt_rounds)
+    print_table(results)
+    if args.output:
+        write_json(args.output, "micro", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Utilidades comunes: percentiles, tabla por consola y resultados en JSON
+import json
+import platform
+import subprocess
+import time
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies_s, errors=0, elapsed_s=None):
+    values = sorted(latencies_s)
+    count = len(values)
+    summary = {
+        "count": count,
+        "errors": errors,
+        "mean_ms": (sum(values) / count * 1000) if count else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": (values[-1] * 1000) if count else 0.0,
+    }
+    if elapsed_s:
+        summary["throughput_rps"] = count / elapsed_s
+    return summary
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def write_json(path, kind, config, results):
+    document = {
+        "kind": kind,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w") as output:
+        json.dump(document, output, indent=2, sort_keys=True)
+
+def print_table(results):
+    print(f"{'escenario':32s} {'n':>8s} {'err':>5s} {'p50 ms':>9s} {'p95 ms':>9s} "
+          f"{'p99 ms':>9s} {'req/s':>10s}")
+    for name, summary in results.items():
+        print(f"{name:32s} {summary['count']:8d} {summary['errors']:5d} "
+              f"{summary['p50_ms']:9.3f} {summary['p95_ms']:9.3f} {summary['p99_ms']:9.3f} "
+              f"{summary.get('throughput_rps', 0):10.1f}")